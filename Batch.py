@@ -0,0 +1,135 @@
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from Evaluation import MG_SCORES, EG_SCORES, PHASES, MAX_PHASE
+from Encoding import RECORD_SIZE, PositionStore
+
+# Batches are arrays of shape (N, 12, 8, 8) with planes[n, piece index, row, col] = 1 where that piece stands.
+# Piece index is as in consts.PIECE_CODES and row 0 is the first rank, as in Chess.board.
+
+def _requireNumpy():
+	if np is None:
+		raise ImportError('Batch requires numpy. Install it with: pip install numpy')
+
+def piecePlanes(games):
+	"""Builds the piece planes of a list of games from their bitboards
+
+	Params:
+	games -- sequence of Chess games
+
+	Returns: uint8 array of shape (N, 12, 8, 8)
+	"""
+	_requireNumpy()
+	bitboards = np.array([chess.position.pieces for chess in games], dtype=np.uint64).reshape(-1, 12)
+	return _unpackBitboards(bitboards)
+
+def _unpackBitboards(bitboards):
+	"""Expands an (N, 12) array of bitboards to (N, 12, 8, 8) planes"""
+	bits = np.unpackbits(bitboards.astype('<u8').view(np.uint8), axis=-1, bitorder='little')
+	return bits.reshape(-1, 12, 8, 8)
+
+def recordArray(records):
+	"""Views packed position records as an (N, RECORD_SIZE) uint8 array without copying
+
+	Params:
+	records -- PositionStore or bytes-like object of whole records
+
+	Returns: uint8 array of shape (N, RECORD_SIZE)
+	"""
+	_requireNumpy()
+	if isinstance(records, PositionStore):
+		records = records.view
+	return np.frombuffer(records, dtype=np.uint8).reshape(-1, RECORD_SIZE)
+
+def recordPlanes(records):
+	"""Builds the piece planes of packed position records without decoding them into games
+
+	Params:
+	records -- (N, RECORD_SIZE) uint8 array, or anything recordArray accepts
+
+	Returns: uint8 array of shape (N, 12, 8, 8)
+	"""
+	_requireNumpy()
+	if not isinstance(records, np.ndarray):
+		records = recordArray(records)
+	count = len(records)
+	occupied = np.unpackbits(records[:, :8], axis=1, bitorder='little').astype(bool)
+	nibbles = records[:, 8:24]
+	# piece index of the k-th occupied square, from low to high square
+	pieces = np.empty((count, 32), dtype=np.uint8)
+	pieces[:, 0::2] = nibbles & 15
+	pieces[:, 1::2] = nibbles >> 4
+	order = np.cumsum(occupied, axis=1) - 1
+	order[~occupied] = 0
+	square_pieces = np.take_along_axis(pieces, order, axis=1)
+
+	planes = np.zeros((count, 12, 64), dtype=np.uint8)
+	rows, squares = np.nonzero(occupied)
+	planes[rows, square_pieces[rows, squares], squares] = 1
+	return planes.reshape(count, 12, 8, 8)
+
+def recordTurns(records):
+	"""Side to move of each packed record as an int8 array of 0 (white) and 1 (black)"""
+	_requireNumpy()
+	if not isinstance(records, np.ndarray):
+		records = recordArray(records)
+	return (records[:, 24] & 1).astype(np.int8)
+
+def scorePlanes(planes, turns=None):
+	"""Scores a batch of positions with the material and piece-square terms of Evaluation
+
+	Params:
+	planes -- array of shape (N, 12, 8, 8)
+	turns -- side to move of each position as 0 or 1, or None for scores from white's point of view (default: None)
+
+	Returns: int64 array of N scores in centipawns. With turns they match Evaluation.evaluate
+	"""
+	_requireNumpy()
+	flat = planes.reshape(len(planes), 12, 64).astype(np.int64)
+	mg = np.einsum('npq,pq->n', flat, np.array(MG_SCORES, dtype=np.int64))
+	eg = np.einsum('npq,pq->n', flat, np.array(EG_SCORES, dtype=np.int64))
+	phase = np.minimum(flat.sum(axis=2) @ np.array(PHASES, dtype=np.int64), MAX_PHASE)
+	scores = (mg*phase + eg*(MAX_PHASE - phase)) // MAX_PHASE
+	if turns is not None:
+		scores = np.where(np.asarray(turns) == 0, scores, -scores)
+	return scores
+
+def evaluateGames(games):
+	"""Scores a list of games from the point of view of the side to move. Matches Evaluation.evaluate for each
+
+	Returns: int64 array of N scores in centipawns
+	"""
+	return scorePlanes(piecePlanes(games), [chess.turn for chess in games])
+
+def evaluateRecords(records):
+	"""Scores packed position records from the point of view of the side to move without decoding them
+
+	Returns: int64 array of N scores in centipawns
+	"""
+	_requireNumpy()
+	if not isinstance(records, np.ndarray):
+		records = recordArray(records)
+	return scorePlanes(recordPlanes(records), recordTurns(records))
+
+
+if __name__ == "__main__":
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description='Score the positions of a packed position file in batches')
+	parser.add_argument('store', help='file written by Encoding.writePositions')
+	parser.add_argument('--batch', type=int, default=65536, help='positions per batch (default: 65536)')
+	options = parser.parse_args()
+
+	with PositionStore(options.store) as store:
+		records = recordArray(store)
+		start = time.perf_counter()
+		total = 0
+		for first in range(0, len(records), options.batch):
+			total += int(evaluateRecords(records[first:first+options.batch]).sum())
+		seconds = time.perf_counter() - start
+		del records
+	print('{} positions in {:.2f}s ({:.0f} positions/sec), mean score {:.1f}'.format(
+		len(store), seconds, len(store) / seconds if seconds > 0 else 0, total / len(store) if len(store) else 0))
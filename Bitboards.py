@@ -0,0 +1,294 @@
+from consts import EMPTY_SQUARE, piece_index, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from Zobrist import PIECE_KEYS
+from Evaluation import MG_SCORES, EG_SCORES, PHASES
+
+# Squares are numbered 0-63 as row*8 + col so that bit (row*8 + col) of a
+# bitboard is the square board[row][col] of the list view.
+
+def squareToCoords(sq):
+	"""Converts square index to zero-indexed (row, col)"""
+	return (sq >> 3, sq & 7)
+
+def coordsToSquare(coords):
+	"""Converts zero-indexed (row, col) to square index"""
+	return coords[0]*8 + coords[1]
+
+def bitSquares(bb):
+	"""Generates the square indices of the set bits in bb from low to high"""
+	while bb:
+		lsb = bb & -bb
+		yield lsb.bit_length() - 1
+		bb ^= lsb
+
+def _leaperAttacks(diffs):
+	"""Builds a 64 entry table of attack bitboards for a piece that jumps by diffs"""
+	table = []
+	for sq in range(64):
+		row, col = squareToCoords(sq)
+		attacks = 0
+		for diff in diffs:
+			r, c = row+diff[0], col+diff[1]
+			if 0 <= r < 8 and 0 <= c < 8:
+				attacks |= 1 << (r*8 + c)
+		table.append(attacks)
+	return table
+
+def _rays(diff):
+	"""Builds a 64 entry table of squares reachable on an empty board moving in direction diff"""
+	table = []
+	for sq in range(64):
+		row, col = squareToCoords(sq)
+		ray = 0
+		r, c = row+diff[0], col+diff[1]
+		while 0 <= r < 8 and 0 <= c < 8:
+			ray |= 1 << (r*8 + c)
+			r, c = r+diff[0], c+diff[1]
+		table.append(ray)
+	return table
+
+KNIGHT_ATTACKS = _leaperAttacks([(1,2), (1,-2), (2,1), (2,-1), (-1,2), (-1,-2), (-2,1), (-2,-1)])
+KING_ATTACKS = _leaperAttacks([(1,1), (1,0), (1,-1), (0,1), (0,-1), (-1,1), (-1,0), (-1,-1)])
+# PAWN_ATTACKS[color][sq] -- squares attacked by a pawn of color standing on sq
+PAWN_ATTACKS = [_leaperAttacks([(1,1), (1,-1)]), _leaperAttacks([(-1,1), (-1,-1)])]
+
+# Rays toward higher square indices find their first blocker with the lowest set bit,
+# rays toward lower indices with the highest set bit.
+NORTH, EAST, NORTH_EAST, NORTH_WEST = _rays((1,0)), _rays((0,1)), _rays((1,1)), _rays((1,-1))
+SOUTH, WEST, SOUTH_WEST, SOUTH_EAST = _rays((-1,0)), _rays((0,-1)), _rays((-1,-1)), _rays((-1,1))
+# all squares a rook or bishop could reach from sq on an empty board
+ROOK_LINES = [NORTH[sq] | EAST[sq] | SOUTH[sq] | WEST[sq] for sq in range(64)]
+BISHOP_LINES = [NORTH_EAST[sq] | NORTH_WEST[sq] | SOUTH_WEST[sq] | SOUTH_EAST[sq] for sq in range(64)]
+
+def _between():
+	"""Builds BETWEEN[a][b], the squares strictly between a and b if they share a rank, file or diagonal, else 0"""
+	table = [[0]*64 for sq in range(64)]
+	for rays in (NORTH, EAST, NORTH_EAST, NORTH_WEST, SOUTH, WEST, SOUTH_WEST, SOUTH_EAST):
+		for a in range(64):
+			for b in bitSquares(rays[a]):
+				table[a][b] = rays[a] ^ rays[b] ^ (1 << b)
+	return table
+
+BETWEEN = _between()
+
+def rookAttacks(sq, occupancy):
+	"""Squares attacked by a rook on sq given the occupied squares"""
+	attacks = 0
+	for rays in (NORTH, EAST):
+		ray = rays[sq]
+		blockers = ray & occupancy
+		if blockers:
+			ray ^= rays[(blockers & -blockers).bit_length() - 1]
+		attacks |= ray
+	for rays in (SOUTH, WEST):
+		ray = rays[sq]
+		blockers = ray & occupancy
+		if blockers:
+			ray ^= rays[blockers.bit_length() - 1]
+		attacks |= ray
+	return attacks
+
+def bishopAttacks(sq, occupancy):
+	"""Squares attacked by a bishop on sq given the occupied squares"""
+	attacks = 0
+	for rays in (NORTH_EAST, NORTH_WEST):
+		ray = rays[sq]
+		blockers = ray & occupancy
+		if blockers:
+			ray ^= rays[(blockers & -blockers).bit_length() - 1]
+		attacks |= ray
+	for rays in (SOUTH_WEST, SOUTH_EAST):
+		ray = rays[sq]
+		blockers = ray & occupancy
+		if blockers:
+			ray ^= rays[blockers.bit_length() - 1]
+		attacks |= ray
+	return attacks
+
+
+class Position:
+	__slots__ = ('pieces', 'occupied', 'occupancy', 'squares', 'hash', 'kings', 'mg', 'eg', 'phase', '_board')
+
+	def __init__(self):
+		"""Initialize an empty bitboard position
+
+		self.pieces holds one bitboard per piece code indexed like PIECE_CODES.
+		self.occupied holds the occupancy of each color and self.occupancy of both.
+		self.squares mirrors the pieces as a 64 entry list of 2 char piece codes.
+		self.hash is the Zobrist key of the piece placement.
+		self.kings holds the square of the lowest king of each color or None.
+		self.mg, self.eg and self.phase hold the evaluation terms of Evaluation.py for the pieces on the board.
+		"""
+		self.pieces = [0]*12
+		self.occupied = [0, 0]
+		self.occupancy = 0
+		self.squares = [EMPTY_SQUARE]*64
+		self.hash = 0
+		self.kings = [None, None]
+		self.mg = 0
+		self.eg = 0
+		self.phase = 0
+		self._board = None
+
+	@classmethod
+	def fromBoard(cls, board):
+		"""Builds a position from an 8x8 board of rows of piece codes, such as a list of lists or Chess.board"""
+		return cls.fromSquares([piece for row in board for piece in row])
+
+	@classmethod
+	def fromSquares(cls, squares):
+		"""Builds a position from a 64 entry list of piece codes or EMPTY_SQUARE in one pass,
+		which is faster than placing the pieces one at a time with setPiece"""
+		position = cls()
+		pieces = position.pieces
+		key = mg = eg = phase = 0
+		for sq, piece in enumerate(squares):
+			if piece != EMPTY_SQUARE:
+				index = piece_index[piece]
+				pieces[index] |= 1 << sq
+				key ^= PIECE_KEYS[index][sq]
+				mg += MG_SCORES[index][sq]
+				eg += EG_SCORES[index][sq]
+				phase += PHASES[index]
+		white = pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5]
+		black = pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]
+		position.occupied = [white, black]
+		position.occupancy = white | black
+		position.squares = list(squares)
+		position.hash = key
+		position.mg = mg
+		position.eg = eg
+		position.phase = phase
+		position._updateKing(0)
+		position._updateKing(1)
+		return position
+
+	def copy(self):
+		"""Returns an independent copy of the position"""
+		position = Position.__new__(Position)
+		position.pieces = self.pieces[:]
+		position.occupied = self.occupied[:]
+		position.occupancy = self.occupancy
+		position.squares = self.squares[:]
+		position.hash = self.hash
+		position.kings = self.kings[:]
+		position.mg = self.mg
+		position.eg = self.eg
+		position.phase = self.phase
+		position._board = None
+		return position
+
+	def toBoard(self):
+		"""Returns the position as an 8x8 tuple of tuples of piece codes.
+
+		The tuples are built lazily and cached until the position changes. They are read only, so changes must go
+		through setPiece and removePiece.
+		"""
+		if self._board is None:
+			squares = self.squares
+			self._board = tuple(tuple(squares[row*8:row*8+8]) for row in range(8))
+		return self._board
+
+	def setPiece(self, sq, piece):
+		"""Places piece on square sq, replacing any piece already there"""
+		if self.squares[sq] != EMPTY_SQUARE:
+			self.removePiece(sq)
+		index = piece_index[piece]
+		bit = 1 << sq
+		self.pieces[index] |= bit
+		self.occupied[index // 6] |= bit
+		self.occupancy |= bit
+		self.squares[sq] = piece
+		self.hash ^= PIECE_KEYS[index][sq]
+		self.mg += MG_SCORES[index][sq]
+		self.eg += EG_SCORES[index][sq]
+		self.phase += PHASES[index]
+		self._board = None
+		if index % 6 == KING:
+			self._updateKing(index // 6)
+
+	def removePiece(self, sq):
+		"""Removes and returns the piece on square sq. Returns EMPTY_SQUARE if there was none"""
+		piece = self.squares[sq]
+		if piece == EMPTY_SQUARE:
+			return piece
+		index = piece_index[piece]
+		mask = ~(1 << sq)
+		self.pieces[index] &= mask
+		self.occupied[index // 6] &= mask
+		self.occupancy &= mask
+		self.squares[sq] = EMPTY_SQUARE
+		self.hash ^= PIECE_KEYS[index][sq]
+		self.mg -= MG_SCORES[index][sq]
+		self.eg -= EG_SCORES[index][sq]
+		self.phase -= PHASES[index]
+		self._board = None
+		if index % 6 == KING:
+			self._updateKing(index // 6)
+		return piece
+
+	def _updateKing(self, color):
+		kings = self.pieces[6*color + KING]
+		self.kings[color] = (kings & -kings).bit_length() - 1 if kings else None
+
+	def pieceBitboard(self, piece_type, color):
+		"""Returns the bitboard of pieces of piece_type (PAWN..KING) and color (0 white, 1 black)"""
+		return self.pieces[6*color + piece_type]
+
+	def attackers(self, sq, color):
+		"""Returns a bitboard of the pieces of color that attack square sq"""
+		pieces = self.pieces
+		base = 6*color
+		occupancy = self.occupancy
+		attackers = (KNIGHT_ATTACKS[sq] & pieces[base+KNIGHT]) \
+			| (KING_ATTACKS[sq] & pieces[base+KING]) \
+			| (PAWN_ATTACKS[1-color][sq] & pieces[base+PAWN])
+		queens = pieces[base+QUEEN]
+		diagonal = pieces[base+BISHOP] | queens
+		if diagonal:
+			attackers |= bishopAttacks(sq, occupancy) & diagonal
+		straight = pieces[base+ROOK] | queens
+		if straight:
+			attackers |= rookAttacks(sq, occupancy) & straight
+		return attackers
+
+	def isAttacked(self, sq, color, occupancy=None):
+		"""Checks if any piece of color attacks square sq. Stops at the first attacker found
+
+		Params:
+		sq -- square index
+		color -- attacking color as 0 (white) or 1 (black)
+		occupancy -- occupied squares to use for sliding attacks (default: self.occupancy)
+
+		Returns: True if sq is attacked
+		"""
+		pieces = self.pieces
+		base = 6*color
+		if KNIGHT_ATTACKS[sq] & pieces[base+KNIGHT] or PAWN_ATTACKS[1-color][sq] & pieces[base+PAWN] \
+			or KING_ATTACKS[sq] & pieces[base+KING]:
+			return True
+
+		if occupancy is None:
+			occupancy = self.occupancy
+		queens = pieces[base+QUEEN]
+		# only the first piece on each ray can attack
+		straight = (pieces[base+ROOK] | queens) & ROOK_LINES[sq]
+		if straight:
+			for rays in (NORTH, EAST):
+				blockers = rays[sq] & occupancy
+				if blockers & straight and blockers & -blockers & straight:
+					return True
+			for rays in (SOUTH, WEST):
+				blockers = rays[sq] & occupancy
+				if blockers & straight and 1 << (blockers.bit_length() - 1) & straight:
+					return True
+		diagonal = (pieces[base+BISHOP] | queens) & BISHOP_LINES[sq]
+		if diagonal:
+			for rays in (NORTH_EAST, NORTH_WEST):
+				blockers = rays[sq] & occupancy
+				if blockers & diagonal and blockers & -blockers & diagonal:
+					return True
+			for rays in (SOUTH_WEST, SOUTH_EAST):
+				blockers = rays[sq] & occupancy
+				if blockers & diagonal and 1 << (blockers.bit_length() - 1) & diagonal:
+					return True
+		return False
@@ -0,0 +1,226 @@
+import mmap
+import random
+import struct
+
+from Chess import Chess
+from Moves import encodeMove, moveStart, moveEnd, movePromotion, moveFlag, moveToUCI, CASTLE
+
+# Polyglot book entries are 16 bytes, big endian, sorted by key:
+#   key    64-bit position key
+#   move   16 bits of to file, to row, from file, from row and promotion, 3 bits each from the low bits up
+#   weight 16-bit relative weight of the move
+#   learn  32 bits reserved for learning, written as 0
+# Castling is stored as the king moving onto its own rook, as in e1h1.
+#
+# Keys are Chess.hash, which is the Polyglot key of the position, so books made by other Polyglot tools can be probed.
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+ENTRY_SIZE = ENTRY.size
+MAX_WEIGHT = 0xffff
+
+# king moves that castle, as stored in a book and as made by Chess.doMove
+_castle_moves = {
+	encodeMove(4, 7): encodeMove(4, 6, flag=CASTLE),
+	encodeMove(4, 0): encodeMove(4, 2, flag=CASTLE),
+	encodeMove(60, 63): encodeMove(60, 62, flag=CASTLE),
+	encodeMove(60, 56): encodeMove(60, 58, flag=CASTLE),
+}
+_book_castles = {move: book_move for book_move, move in _castle_moves.items()}
+
+def toBookMove(move):
+	"""Converts a move packed by Moves.encodeMove to a 16-bit Polyglot move"""
+	if moveFlag(move) == CASTLE:
+		move = _book_castles[move]
+	start = moveStart(move)
+	end = moveEnd(move)
+	# Polyglot promotions are 1 knight to 4 queen, the same as the piece types
+	return end | start << 6 | movePromotion(move) << 12
+
+def fromBookMove(chess, book_move):
+	"""Finds the legal move of chess matching a 16-bit Polyglot move
+
+	Returns: move packed by Moves.encodeMove or None if no legal move matches
+	"""
+	end = book_move & 63
+	start = book_move >> 6 & 63
+	promotion = book_move >> 12 & 7
+	move = encodeMove(start, end, promotion)
+	if chess.position.squares[start][1] == 'K' and move in _castle_moves:
+		move = _castle_moves[move]
+	for legal in chess.legalMoves():
+		# compare without the flags since en passant is not marked in the book
+		if legal & 0x7fff == move & 0x7fff:
+			return legal
+	return None
+
+class OpeningBook:
+	def __init__(self, path):
+		"""Opens a Polyglot book. The file is memory mapped read only and searched in place, so it is never loaded
+
+		Params:
+		path -- book file
+		"""
+		self.file = open(path, 'rb')
+		size = self.file.seek(0, 2)
+		if size % ENTRY_SIZE:
+			self.file.close()
+			raise ValueError("'{}' is not a whole number of {} byte book entries".format(path, ENTRY_SIZE))
+		self.count = size // ENTRY_SIZE
+		# empty files cannot be mapped
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+	def __len__(self):
+		return self.count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		"""Unmaps and closes the book"""
+		if self.map is not None:
+			self.map.close()
+		self.file.close()
+
+	def entries(self, key):
+		"""Finds the entries of a position by binary search
+
+		Params:
+		key -- 64-bit position key such as Chess.hash
+
+		Returns: list of (book move, weight, learn) in book order
+		"""
+		book = self.map
+		low, high = 0, self.count
+		unpack_key = KEY.unpack_from
+		while low < high:
+			middle = (low + high) >> 1
+			if unpack_key(book, middle*ENTRY_SIZE)[0] < key:
+				low = middle + 1
+			else:
+				high = middle
+
+		entries = []
+		while low < self.count:
+			entry_key, book_move, weight, learn = ENTRY.unpack_from(book, low*ENTRY_SIZE)
+			if entry_key != key:
+				break
+			entries.append((book_move, weight, learn))
+			low += 1
+		return entries
+
+	def moves(self, chess):
+		"""Book moves for the player to move
+
+		Params:
+		chess -- Chess game
+
+		Returns: list of (move packed by Moves.encodeMove, weight) with the heaviest first. Illegal book moves are left out
+		"""
+		moves = []
+		for book_move, weight, learn in self.entries(chess.hash):
+			move = fromBookMove(chess, book_move)
+			if move is not None:
+				moves.append((move, weight))
+		moves.sort(key=lambda entry: entry[1], reverse=True)
+		return moves
+
+	def choose(self, chess, rng=random):
+		"""Picks a book move at random in proportion to the weights
+
+		Params:
+		chess -- Chess game
+		rng -- random.Random to draw with (default: random module)
+
+		Returns: move packed by Moves.encodeMove or None if the position is not in the book
+		"""
+		moves = self.moves(chess)
+		if not moves:
+			return None
+		total = sum(weight for move, weight in moves)
+		if total == 0:
+			return moves[0][0]
+		pick = rng.randrange(total)
+		for move, weight in moves:
+			pick -= weight
+			if pick < 0:
+				return move
+
+def buildBook(games, path, plies=20, min_weight=1):
+	"""Builds a Polyglot book from the opening moves of games
+
+	Each move scores 2 for the player who went on to win, 1 for a draw or unknown result and 0 for a loss,
+	summed over all games. Games stop counting at their first illegal move and games with a bad FEN tag are skipped.
+
+	Params:
+	games -- iterable of PGN.PGNGame such as PGN.readGames(file)
+	path -- book file to write
+	plies -- number of moves from the start of each game to add (default: 20)
+	min_weight -- leave out moves with a lower total weight (default: 1)
+
+	Returns: number of entries written
+	"""
+	weights = {}
+	for game in games:
+		if 'FEN' in game.tags:
+			try:
+				chess = Chess.fromFEN(game.tags['FEN'])
+			except ValueError:
+				continue
+		else:
+			chess = Chess()
+			chess.setupBoard()
+		scores = {'1-0': (2, 0), '0-1': (0, 2)}.get(game.result, (1, 1))
+		for san in game.moves[:plies]:
+			key = chess.hash
+			turn = chess.turn
+			try:
+				move = chess.makeMove(san)
+			except ValueError:
+				break
+			entry = (key, toBookMove(move))
+			weights[entry] = weights.get(entry, 0) + scores[turn]
+
+	entries = [(key, book_move, weight) for (key, book_move), weight in weights.items() if weight >= min_weight]
+	# scale the weights down if any would overflow 16 bits
+	largest = max((weight for key, book_move, weight in entries), default=0)
+	scale = MAX_WEIGHT / largest if largest > MAX_WEIGHT else 1
+	entries.sort(key=lambda entry: (entry[0], -entry[2]))
+	with open(path, 'wb') as f:
+		for key, book_move, weight in entries:
+			# scaling never rounds a move that was played down to 0
+			f.write(ENTRY.pack(key, book_move, max(int(weight*scale), min(weight, 1)), 0))
+	return len(entries)
+
+
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Build a Polyglot opening book from PGN or list the book moves of a position')
+	commands = parser.add_subparsers(dest='command', required=True)
+	build = commands.add_parser('build', help='build a book from a PGN file')
+	build.add_argument('pgn')
+	build.add_argument('book')
+	build.add_argument('--plies', type=int, default=20, help='moves from the start of each game to add (default: 20)')
+	build.add_argument('--min-weight', type=int, default=1, help='leave out moves with a lower total weight (default: 1)')
+	probe = commands.add_parser('probe', help='list the book moves of a position')
+	probe.add_argument('book')
+	probe.add_argument('fen', nargs='?', default='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+	options = parser.parse_args()
+
+	if options.command == 'build':
+		from PGN import readGames
+		with open(options.pgn, encoding='utf-8', errors='replace') as f:
+			count = buildBook(readGames(f), options.book, options.plies, options.min_weight)
+		print('{} entries written to {}'.format(count, options.book))
+	else:
+		chess = Chess.fromFEN(options.fen)
+		with OpeningBook(options.book) as book:
+			moves = book.moves(chess)
+		total = sum(weight for move, weight in moves)
+		for move, weight in moves:
+			print('{:6} {:6} {:6.1%}'.format(moveToUCI(move), weight, weight / total if total else 0))
+		if not moves:
+			print('position not in book')
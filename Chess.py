@@ -1,20 +1,112 @@
 import re
-import copy
+from collections import namedtuple
 
 from consts import *
-from Pieces import possiblePieceStarts
+from Pieces import possiblePieceStarts, generateMoves, isLegalMove
+from Bitboards import Position, squareToCoords
+from Moves import encodeMove, moveToUCI, squareName, CASTLE, EN_PASSANT
+from Zobrist import castleKey, enPassantKey, TURN_KEY
+from Notation import parseMove as parseNotation
+from MoveCache import MoveCache
+
+# castling right lost when a piece moves from or to a square, as (color, side)
+castle_squares = {0: (0, 1), 7: (0, 0), 56: (1, 1), 63: (1, 0)}
+# piece code of each FEN piece letter
+fen_pieces = {char: 'W' + char for char in PIECE_TYPES}
+fen_pieces.update({char.lower(): 'B' + char for char in PIECE_TYPES})
+fen_letters = {piece: char for char, piece in fen_pieces.items()}
+# Zobrist key of the castling rights of a new game
+full_castle_key = castleKey([[True, True], [True, True]])
+# cache of resolved moves shared by all games. See Chess.findMove
+shared_move_cache = MoveCache()
+# king moves from and to squares that castle when written as coordinates
+uci_castles = {('e1', 'g1'): 'king', ('e1', 'c1'): 'queen', ('e8', 'g8'): 'king', ('e8', 'c8'): 'queen'}
+
+# reasons a move is rejected, as MoveResult.reason
+MOVE_OK = 0
+INVALID_NOTATION = 1
+OWN_PIECE_ON_TARGET = 2
+TARGET_OCCUPIED = 3
+CAPTURE_EMPTY_SQUARE = 4
+NO_PIECE = 5
+NO_PIECE_FROM_START = 6
+AMBIGUOUS = 7
+PROMOTION_REQUIRED = 8
+PROMOTION_NOT_ALLOWED = 9
+KING_IN_CHECK = 10
+CASTLE_OUT_OF_CHECK = 11
+CASTLE_PIECES_MISSING = 12
+CASTLE_RIGHT_LOST = 13
+CASTLE_INVALID_SIDE = 14
+CASTLE_THROUGH_CHECK = 15
+
+# message of each reason, formatted with MoveResult.args
+MOVE_MESSAGES = [
+	None,
+	"'{}' is an invalid move",
+	"Cannot make move {}{} because {} is occupied by your own piece",
+	"Cannot make move {}{} because {} is occupied",
+	"Cannot make capture {}x{} because {} is unoccupied",
+	"No piece found that can make move {}{}",
+	"No piece found that can make move from {}{} to {}",
+	"Multiple pieces found that can make move {}{}",
+	"Cannot move to {} without promotion",
+	"Cannot promote with this move",
+	"Cannot make move to a position in check",
+	"Cannot castle out of check",
+	"Pieces are not in place to castle {} side",
+	"Castling {} side no longer allowed",
+	"'{}' is not a side to castle on",
+	"Cannot castle through or into check",
+]
+
+class MoveResult(namedtuple('MoveResult', ['move', 'reason', 'args'])):
+	"""Outcome of checking a move. move -- the move packed by Moves.encodeMove or None if it was rejected,
+	reason -- MOVE_OK or the code of the rule that rejected it, args -- values for its message"""
+	__slots__ = ()
+
+	def __bool__(self):
+		return self.reason == MOVE_OK
+
+	@property
+	def message(self):
+		"""Text describing why the move was rejected, or None if it is legal. Only formatted when asked for"""
+		if self.reason == MOVE_OK:
+			return None
+		return MOVE_MESSAGES[self.reason].format(*self.args)
+
+# plies between full snapshots of the game kept for gotoPly
+SNAPSHOT_INTERVAL = 32
+
+class History:
+	"""Moves recorded by makeMove and tryMove, for undo, redo and gotoPly.
+	undos -- undo record returned by doMove for each ply of the line, including plies taken back
+	texts -- each move as it was written
+	ply -- number of plies currently made
+	snapshots -- game state at plies 0, SNAPSHOT_INTERVAL, 2*SNAPSHOT_INTERVAL... as made by Chess.snapshot"""
+	__slots__ = ('undos', 'texts', 'ply', 'snapshots')
+
+	def __init__(self):
+		self.undos = []
+		self.texts = []
+		self.ply = 0
+		self.snapshots = []
 
 class Chess:
+	# games hold hundreds of thousands of positions at once, so instances have no __dict__
+	__slots__ = ('glyphs', 'position', 'turn', 'moves', 'castle', 'en_passant', 'halfmove_clock', 'fullmove',
+		'zobrist_state', 'move_cache', 'history')
+	width = 8
+	height = 8
+
 	def __init__(self, glyphs=True):
 		"""Initialize Chess Game
 
 		Params:
 		glyphs -- Use Unicode chess chars (default True)
 		"""
-		self.width  = 8
-		self.height = 8
 		self.glyphs = glyphs
-		self.board = [[EMPTY_SQUARE]*self.width for i in range(self.height)]
+		self.position = Position() # bitboard representation of the board
 		self.turn = 0 # White goes first
 		self.moves = [[],[]] # records moves made so far
 
@@ -23,67 +115,392 @@ class Chess:
 		# player can castle queen if self.castle[self.turn][1]
 		self.castle = [[True, True], [True, True]]
 
-		self.move_re = re.compile(r'^([KQBNR])?(?:([abcdefgh][1-8])?(:?[abcdefgh])?\s*([-x]))?\s*([abcdefgh][1-8])(?:=([QBNR]))?$')
+		# Square index that can be captured en passant this turn or None
+		self.en_passant = None
+
+		# Plies since the last capture or pawn move, and the number of the current full move
+		self.halfmove_clock = 0
+		self.fullmove = 1
+
+		# Zobrist key of the castling rights and en passant square. See hash
+		self.zobrist_state = full_castle_key
+
+		# MoveCache of resolved moves, or None to resolve every move
+		self.move_cache = shared_move_cache
+
+		# History of the moves recorded by makeMove and tryMove, created with the first one
+		self.history = None
+
+	def copy(self):
+		"""Returns an independent copy of the game"""
+		chess = Chess.__new__(Chess)
+		chess.glyphs = self.glyphs
+		chess.position = self.position.copy()
+		chess.turn = self.turn
+		chess.moves = [self.moves[0][:], self.moves[1][:]]
+		chess.castle = [self.castle[0][:], self.castle[1][:]]
+		chess.en_passant = self.en_passant
+		chess.halfmove_clock = self.halfmove_clock
+		chess.fullmove = self.fullmove
+		chess.zobrist_state = self.zobrist_state
+		chess.move_cache = self.move_cache
+		# the copy starts a history of its own
+		chess.history = None
+		return chess
+
+	@property
+	def board(self):
+		"""8x8 tuple of tuples view of the board indexed as board[row][col].
+
+		The view is materialized lazily from self.position and is read only. Use setSquare to change a square.
+		Assigning an 8x8 list of lists to board replaces the position.
+		"""
+		return self.position.toBoard()
+
+	@board.setter
+	def board(self, board):
+		self.position = Position.fromBoard(board)
+		self.history = None
+
+	@property
+	def hash(self):
+		"""64-bit Zobrist key of the position including side to move, castling rights and en passant square.
+
+		The piece part is kept by self.position and the rest by doMove, so reading the key is O(1).
+		Call resetHash after changing self.castle or self.en_passant directly.
+		"""
+		return self.position.hash ^ self.zobrist_state ^ (TURN_KEY if self.turn == 0 else 0)
+
+	def resetHash(self):
+		"""Recomputes the castling and en passant part of the Zobrist key from the current state"""
+		self.zobrist_state = castleKey(self.castle) ^ enPassantKey(self.position, self.turn, self.en_passant)
 
 	def setupBoard(self):
 		"""Setup Chess Board to start game"""
 
-		# Black Pieces
-		self.board[7] = ['BR', 'BN', 'BB', 'BQ', 'BK', 'BB', 'BN', 'BR']
-		self.board[6] = ['BP', 'BP', 'BP', 'BP', 'BP', 'BP', 'BP', 'BP']
+		self.board = [
+			# White Pieces
+			['WR', 'WN', 'WB', 'WQ', 'WK', 'WB', 'WN', 'WR'],
+			['WP', 'WP', 'WP', 'WP', 'WP', 'WP', 'WP', 'WP'],
+			# Empty squares
+			[EMPTY_SQUARE]*8,
+			[EMPTY_SQUARE]*8,
+			[EMPTY_SQUARE]*8,
+			[EMPTY_SQUARE]*8,
+			# Black Pieces
+			['BP', 'BP', 'BP', 'BP', 'BP', 'BP', 'BP', 'BP'],
+			['BR', 'BN', 'BB', 'BQ', 'BK', 'BB', 'BN', 'BR'],
+		]
+
+	@classmethod
+	def fromFEN(cls, fen, glyphs=True):
+		"""Creates a game set up from a FEN string. See setupFEN"""
+		chess = cls(glyphs)
+		chess.setupFEN(fen)
+		return chess
+
+	def setupFEN(self, fen):
+		"""Setup Chess Board from a position in Forsyth-Edwards Notation
+
+		Params:
+		fen -- FEN string. Only the piece placement field is required.
+			Side to move, castling rights, en passant square and the move clocks default to 'w', '-', '-', '0' and '1'
 
-		# Empty squares
-		for i in range(2,6):
-			self.board[i] = [EMPTY_SQUARE]*8
+		Ex:
+		setupFEN('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+		"""
+		fields = fen.split()
+		if not fields:
+			raise ValueError("'{}' is not a valid FEN".format(fen))
+		placement = fields[0]
+		turn = fields[1] if len(fields) > 1 else 'w'
+		castling = fields[2] if len(fields) > 2 else '-'
+		en_passant = fields[3] if len(fields) > 3 else '-'
+		halfmove_clock = fields[4] if len(fields) > 4 else '0'
+		fullmove = fields[5] if len(fields) > 5 else '1'
+
+		ranks = placement.split('/')
+		if len(ranks) != 8:
+			raise ValueError("'{}' does not have 8 ranks".format(placement))
+		squares = [EMPTY_SQUARE]*64
+		for i, rank in enumerate(ranks):
+			row = 7-i
+			col = 0
+			for char in rank:
+				if char in '12345678':
+					col += int(char)
+				elif char in fen_pieces:
+					if col > 7:
+						raise ValueError("Rank '{}' has more than 8 squares".format(rank))
+					squares[row*8 + col] = fen_pieces[char]
+					col += 1
+				else:
+					raise ValueError("'{}' is not a valid FEN piece".format(char))
+			if col != 8:
+				raise ValueError("Rank '{}' does not have 8 squares".format(rank))
+
+		if turn not in ['w', 'b']:
+			raise ValueError("'{}' is not a valid side to move".format(turn))
+		if castling != '-' and (not castling or any(char not in 'KQkq' for char in castling) or len(set(castling)) != len(castling)):
+			raise ValueError("'{}' is not a valid castling field".format(castling))
+		if en_passant != '-' and not re.match(r'^[a-h][36]$', en_passant):
+			raise ValueError("'{}' is not a valid en passant square".format(en_passant))
+		if not halfmove_clock.isdigit():
+			raise ValueError("'{}' is not a valid halfmove clock".format(halfmove_clock))
+		if not fullmove.isdigit() or int(fullmove) < 1:
+			raise ValueError("'{}' is not a valid fullmove number".format(fullmove))
+		if len(fields) > 6:
+			raise ValueError("'{}' has too many fields".format(fen))
+
+		self.position = Position.fromSquares(squares)
+		self.turn = 0 if turn == 'w' else 1
+		self.castle = [['K' in castling, 'Q' in castling], ['k' in castling, 'q' in castling]]
+		row, col = self.convertPosToCoords(en_passant) if en_passant != '-' else (None, None)
+		self.en_passant = row*8 + col if row is not None else None
+		self.halfmove_clock = int(halfmove_clock)
+		self.fullmove = int(fullmove)
+		self.moves = [[],[]]
+		self.history = None
+		self.resetHash()
+
+	def toFEN(self):
+		"""Returns the position in Forsyth-Edwards Notation
 
-		# White Pieces
-		self.board[1] = ['WP', 'WP', 'WP', 'WP', 'WP', 'WP', 'WP', 'WP']
-		self.board[0] = ['WR', 'WN', 'WB', 'WQ', 'WK', 'WB', 'WN', 'WR']
+		Ex:
+		'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'
+		"""
+		squares = self.position.squares
+		ranks = []
+		for row in range(7, -1, -1):
+			rank = ''
+			empty = 0
+			for piece in squares[row*8:row*8+8]:
+				if piece == EMPTY_SQUARE:
+					empty += 1
+					continue
+				if empty:
+					rank += str(empty)
+					empty = 0
+				rank += fen_letters[piece]
+			ranks.append(rank + str(empty) if empty else rank)
+
+		castling = ''.join(char for char, allowed in zip('KQkq', self.castle[0] + self.castle[1]) if allowed) or '-'
+		en_passant = squareName(self.en_passant) if self.en_passant is not None else '-'
+		return '{} {} {} {} {} {}'.format('/'.join(ranks), 'wb'[self.turn], castling, en_passant,
+			self.halfmove_clock, self.fullmove)
 
 	def makeMove(self, move):
 		"""Makes chess move on board
 
-		Moves are accepted in algebraic chess notation without move ambiguity.
-		Moves are also accepted in long algebraic notation which also includes the starting position.
+		Moves are accepted in standard algebraic notation, with the file or rank of the moving piece when it is ambiguous.
+		Moves are also accepted in long algebraic notation which also includes the starting position,
+		and in UCI coordinates such as 'g1f3', 'e1g1' or 'e7e8q'.
+		Check and mate suffixes and trailing annotations like '!?' are ignored.
+		Raises ValueError if the move is invalid or illegal. See tryMove for a version that does not raise.
 
 		Params:
 		move -- String in algebraic chess notation
+
+		Returns: the move made, packed by Moves.encodeMove
 		"""
 
-		if move in ['O-O', '0-0']:
-			self.moveCastle('king')
-		elif move in ['O-O-O', '0-0-0']:
-			self.moveCastle('queen')
-		else:
-			match = self.move_re.match(move)
-			if match:
-				piece, start_pos, pawn_pos, move_type, end_pos, promotion = match.group(1, 2, 3, 4, 5, 6)
-
-				# set pawn for empty piece
-				if piece == None:
-					piece = 'P'
-
-				# check for capture
-				capture = False
-				if move_type == 'x':
-					capture = True
-					if piece == 'P':
-						if pawn_pos == None and start_pos == None:
-							raise ValueError("'{}' is an invalid move".format(move))
-							return
-						if start_pos == None:
-							# mark that rank is not given
-							start_pos = 'X'+pawn_pos
-
-				self.movePiece(piece, end_pos, start_pos, capture, promotion)
+		result = self.findMove(move)
+		if result.reason != MOVE_OK:
+			raise ValueError(result.message)
+		self.recordMove(result.move, move)
+		return result.move
+
+	def parseMove(self, move):
+		"""Splits a move into the arguments of moveCastle or movePiece. Moves are read by Notation.parseMove,
+		and moves without a piece letter such as UCI 'g1f3' or 'e1g1' move the piece standing on their start square.
+
+		Params:
+		move -- String in algebraic chess notation or UCI coordinates
+
+		Returns: (side,) for a castle, (piece, end_pos, start_pos, capture, promotion) for other moves,
+			or None if the move is not valid notation
+		"""
+		parsed = parseNotation(move)
+		if parsed is None:
+			return None
+		if parsed.castle:
+			return (parsed.castle,)
+
+		piece = parsed.piece
+		capture = parsed.capture
+		if piece is None:
+			squares = self.position.squares
+			coords = self.convertPosToCoords(parsed.start)
+			occupant = squares[coords[0]*8 + coords[1]]
+			if occupant[0] != 'WB'[self.turn]:
+				# leave the checks of movePiece to report the missing piece
+				piece = 'P'
 			else:
-				raise ValueError("'{}' is an invalid move".format(move))
-		
-		# record move
-		self.moves[self.turn].append(move)
-		# change turns
-		self.turn = 1-self.turn
+				piece = occupant[1]
+				if piece == 'K' and (parsed.start, parsed.end) in uci_castles:
+					return (uci_castles[parsed.start, parsed.end],)
+			if capture is None:
+				# UCI moves do not mark captures, so they capture whatever stands on the end square
+				coords = self.convertPosToCoords(parsed.end)
+				end_sq = coords[0]*8 + coords[1]
+				capture = squares[end_sq] != EMPTY_SQUARE or (piece == 'P' and end_sq == self.en_passant)
+		return (piece, parsed.end, parsed.start, capture, parsed.promotion)
+
+	def findMove(self, move):
+		"""Checks a move in algebraic chess notation without making it or raising.
+		Results are looked up in and added to self.move_cache, so a move seen before in the same position is not resolved again.
+
+		Params:
+		move -- String in algebraic chess notation as accepted by makeMove
 
+		Returns: MoveResult
+		"""
+		cache = self.move_cache
+		if cache is None:
+			return self.resolveMove(move)
+		# the key is built from the castling rights and en passant square themselves rather than self.hash,
+		# which goes stale when they are changed directly without calling resetHash
+		position = self.position
+		key = position.hash ^ castleKey(self.castle) ^ enPassantKey(position, self.turn, self.en_passant) \
+			^ (TURN_KEY if self.turn == 0 else 0)
+		result = cache.get(key, move)
+		if result is None:
+			result = self.resolveMove(move)
+			cache.put(key, move, result)
+		return result
+
+	def resolveMove(self, move):
+		"""Checks a move like findMove without using the cache
+
+		Returns: MoveResult
+		"""
+		parsed = self.parseMove(move)
+		if parsed is None:
+			return MoveResult(None, INVALID_NOTATION, (move,))
+		elif len(parsed) == 1:
+			return self.findCastle(*parsed)
+		return self.findPieceMove(*parsed)
+
+	def tryMove(self, move):
+		"""Makes a move like makeMove if it is legal, but reports an illegal move instead of raising ValueError
+
+		Params:
+		move -- String in algebraic chess notation
+
+		Returns: MoveResult, true if the move was made. Its message is only formatted when read
+		"""
+		result = self.findMove(move)
+		if result.reason == MOVE_OK:
+			self.recordMove(result.move, move)
+		return result
+
+	def recordMove(self, move, text):
+		"""Makes a legal move and records it in self.moves and self.history so it can be taken back.
+		Moves taken back with undo and not redone are dropped.
+
+		Params:
+		move -- legal move packed by Moves.encodeMove
+		text -- the move as written
+		"""
+		history = self.history
+		if history is None:
+			history = self.history = History()
+		ply = history.ply
+		if ply < len(history.undos):
+			del history.undos[ply:]
+			del history.texts[ply:]
+			del history.snapshots[ply // SNAPSHOT_INTERVAL + 1:]
+		if ply % SNAPSHOT_INTERVAL == 0 and len(history.snapshots) == ply // SNAPSHOT_INTERVAL:
+			history.snapshots.append(self.snapshot())
+
+		self.moves[self.turn].append(text)
+		history.undos.append(self.doMove(move))
+		history.texts.append(text)
+		history.ply = ply + 1
+
+	def undo(self):
+		"""Takes back the last recorded move. It can be made again with redo
+
+		Returns: the move taken back, packed by Moves.encodeMove, or None if there is no move to take back
+		"""
+		history = self.history
+		if history is None or history.ply == 0:
+			return None
+		history.ply -= 1
+		undo = history.undos[history.ply]
+		self.undoMove(undo)
+		self.moves[self.turn].pop()
+		return undo[0]
+
+	def redo(self):
+		"""Makes the next move taken back by undo again
+
+		Returns: the move made, packed by Moves.encodeMove, or None if there is no move to make
+		"""
+		history = self.history
+		if history is None or history.ply == len(history.undos):
+			return None
+		ply = history.ply
+		move = history.undos[ply][0]
+		self.moves[self.turn].append(history.texts[ply])
+		self.doMove(move)
+		history.ply = ply + 1
+		return move
+
+	def plies(self):
+		"""Returns: (current ply, number of plies recorded) where ply 0 is the position before the first recorded move"""
+		history = self.history
+		if history is None:
+			return (0, 0)
+		return (history.ply, len(history.undos))
+
+	def gotoPly(self, ply):
+		"""Moves through the recorded moves to the position after ply plies, taking moves back or making them again.
+		Nearby plies are reached a move at a time. Far ones start from the nearest snapshot, so no more than
+		SNAPSHOT_INTERVAL moves are made or taken back whatever the length of the game.
+
+		Params:
+		ply -- 0 for the position before the first recorded move, up to the number of plies recorded
+		"""
+		current, last = self.plies()
+		if not 0 <= ply <= last:
+			raise ValueError('Ply {} is outside the recorded plies 0 to {}'.format(ply, last))
+		if abs(ply - current) <= SNAPSHOT_INTERVAL:
+			while current > ply:
+				self.undo()
+				current -= 1
+			while current < ply:
+				self.redo()
+				current += 1
+			return
+
+		history = self.history
+		index = min(ply // SNAPSHOT_INTERVAL, len(history.snapshots) - 1)
+		self.restore(history.snapshots[index])
+		undos = history.undos
+		for i in range(index * SNAPSHOT_INTERVAL, ply):
+			self.doMove(undos[i][0])
+		history.ply = ply
+		texts = history.texts
+		first = history.snapshots[0][1]
+		self.moves[first] = texts[0:ply:2]
+		self.moves[1-first] = texts[1:ply:2]
+
+	def snapshot(self):
+		"""Returns: the state of the game without its move lists, to be put back with restore"""
+		castle = self.castle
+		return (self.position.copy(), self.turn, [castle[0][:], castle[1][:]], self.en_passant, self.halfmove_clock,
+			self.fullmove, self.zobrist_state)
+
+	def restore(self, snapshot):
+		"""Puts back a state returned by snapshot. The snapshot can be restored again later"""
+		position, self.turn, castle, self.en_passant, self.halfmove_clock, self.fullmove, self.zobrist_state = snapshot
+		self.position = position.copy()
+		self.castle = [castle[0][:], castle[1][:]]
+
+	def isLegal(self, move):
+		"""Returns: True if the move in algebraic chess notation is legal for the player to move. The board is unchanged"""
+		return self.findMove(move).reason == MOVE_OK
 
 	def convertPosToCoords(self, pos):
 		"""Convert position notation from board notation to (row, col).
@@ -117,7 +534,7 @@ class Chess:
 		"""
 
 		coords = self.convertPosToCoords(pos)
-		return self.board[coords[0]][coords[1]]
+		return self.position.squares[coords[0]*8 + coords[1]]
 
 	def setSquare(self, pos, piece):
 		"""Places piece on given square
@@ -140,178 +557,389 @@ class Chess:
 			raise ValueError('{} is not a valid piece type'.format(piece[1]))
 
 		coords = self.convertPosToCoords(pos)
-		self.board[coords[0]][coords[1]] = piece
+		self.position.setPiece(coords[0]*8 + coords[1], piece)
+		# recorded moves cannot be taken back on a changed board
+		self.history = None
 
 	def movePiece(self, piece, end_pos, start_pos=None, capture=False, promotion=None):
-		"""Checks that the move is legal and, if so, makes the move.
+		"""Checks that the move is legal and, if so, makes the move and passes the turn.
 		Otherwise, a ValueError is raised with text describing why the move is illegal.
+		The move is recorded like one made by makeMove, written in long algebraic notation (Ex: 'Ng1-f3', 'e4xd5', 'e7-e8=Q').
 
 		Params:
 		piece -- piece to move from ['K','Q','R','B','N','P']
 		end_pos -- final piece position in chess notation (not checked for valid inputs)
-		start_pos -- starting piece position in chess notation (default: None).
+		start_pos -- starting piece position in chess notation, or just its file or rank (default: None).
 			Set to None if starting position must be inferred from end_pos. 
 			This is possible as long as the move is unambiguous.
 		capture -- boolean if the move is capturing a piece (default: False)
 		promotion -- Provides choice for pawn promotion from [Q','R','B','N',None] (default: None)
 			None is used if there is no promotion. If a pawn is being moved to last rank, a promotion must be provided
+
+		Returns: the move made, packed by Moves.encodeMove
+		"""
+		result = self.findPieceMove(piece, end_pos, start_pos, capture, promotion)
+		if result.reason != MOVE_OK:
+			raise ValueError(result.message)
+		move = result.move
+		start = move & 63
+		end = move >> 6 & 63
+		squares = self.position.squares
+		text = '{}{}{}{}'.format(piece if piece != 'P' else '', squareName(start),
+			'x' if squares[end] != EMPTY_SQUARE or move >> 15 == EN_PASSANT else '-', squareName(end))
+		if move >> 12 & 7:
+			text += '=' + PIECE_TYPES[move >> 12 & 7]
+		self.recordMove(move, text)
+		return move
+
+	def findPieceMove(self, piece, end_pos, start_pos=None, capture=False, promotion=None):
+		"""Checks the move of a piece like movePiece without making it or raising
+
+		Returns: MoveResult
 		"""
 		end_coords = self.convertPosToCoords(end_pos)
+		end_occupant = self.position.squares[end_coords[0]*8 + end_coords[1]]
 		color = 'W' if self.turn == 0 else 'B'
 
 		# check if end_pos is occupied
-		if self.board[end_coords[0]][end_coords[1]][0][0] == color:
-			raise ValueError("Cannot make move {}{} because {} is occupied by your own piece".format(piece, end_pos, end_pos))
-		if not capture and self.board[end_coords[0]][end_coords[1]] != EMPTY_SQUARE:
-			raise ValueError("Cannot make move {}{} because {} is occupied".format(piece, end_pos, end_pos))
-		if capture and self.board[end_coords[0]][end_coords[1]] == EMPTY_SQUARE:
-			raise ValueError("Cannot make capture {}x{} because {} is unoccupied".format(piece, end_pos, end_pos))
-
-		possible_pieces_to_move = possiblePieceStarts(piece, end_coords, color, self.board)
-		# print(possible_pieces_to_move)
+		if end_occupant[0] == color:
+			return MoveResult(None, OWN_PIECE_ON_TARGET, (piece, end_pos, end_pos))
+		if not capture and end_occupant != EMPTY_SQUARE:
+			return MoveResult(None, TARGET_OCCUPIED, (piece, end_pos, end_pos))
+		end_sq = end_coords[0]*8 + end_coords[1]
+		en_passant = piece == 'P' and capture and end_sq == self.en_passant
+		if capture and end_occupant == EMPTY_SQUARE and not en_passant:
+			return MoveResult(None, CAPTURE_EMPTY_SQUARE, (piece, end_pos, end_pos))
+
+		possible_pieces_to_move = possiblePieceStarts(piece, end_coords, color, self.position,
+			end_coords if en_passant else None)
 
 		if len(possible_pieces_to_move) < 1:
-			raise ValueError("No piece found that can make move {}{}".format(piece, end_pos))
-		elif len(possible_pieces_to_move) > 1 and start_pos == None:
-			raise ValueError("Multiple pieces found that can make move {}{}".format(piece, end_pos))
+			return MoveResult(None, NO_PIECE, (piece, end_pos))
 
-		start_coords = possible_pieces_to_move[0]
+		if start_pos:
+			if len(start_pos) == 2:
+				start_coords = self.convertPosToCoords(start_pos)
+				possible_pieces_to_move = [start_coords] if start_coords in possible_pieces_to_move else []
+			elif start_pos in col_conv:
+				# only the file is given as in 'exd4' or 'Nbd7'
+				possible_pieces_to_move = [start for start in possible_pieces_to_move if start[1] == col_conv[start_pos]]
+			else:
+				# only the rank is given as in 'R1e2'
+				possible_pieces_to_move = [start for start in possible_pieces_to_move if start[0] == int(start_pos)-1]
+			if len(possible_pieces_to_move) < 1:
+				return MoveResult(None, NO_PIECE_FROM_START, (piece, start_pos, end_pos))
+
+		flag = EN_PASSANT if en_passant else 0
+		if len(possible_pieces_to_move) > 1:
+			# a pinned piece does not make the move ambiguous
+			possible_pieces_to_move = [start for start in possible_pieces_to_move
+				if isLegalMove(self.position, encodeMove(start[0]*8 + start[1], end_sq, 0, flag), self.turn)] \
+				or possible_pieces_to_move
+			if len(possible_pieces_to_move) > 1:
+				return MoveResult(None, AMBIGUOUS, (piece, end_pos))
 
-		# Pawn notation is weird. This covers notation like 'exd4'
-		if piece == 'P' and capture and start_pos[0] == 'X':
-			# rank not given
-			start_col = col_conv[start_pos[1]]
-			start_coords = None
-			for poss_start in possible_pieces_to_move:
-				if poss_start[1] == start_col:
-					start_coords = poss_start
-			if start_coords == None:
-				raise ValueError("No pawn found that can make move {}x{}".format(start_pos[0], end_pos))
+		start_coords = possible_pieces_to_move[0]
 
-		else:
-			if start_pos:
-				start_coords = self.convertPosToCoords(start_pos)
-				if start_coords not in possible_pieces_to_move:
-					raise ValueError("No piece found that can make move from {}{} to {}".format(piece, start_pos, end_pos))
-			
 		# Pawn promotion
-		if piece == 'P' and (self.turn == 0 and end_coords[0] == 7) or (self.turn == 1 and end_coords[0] == 0):
+		promotion_type = 0
+		if piece == 'P' and ((self.turn == 0 and end_coords[0] == 7) or (self.turn == 1 and end_coords[0] == 0)):
 			if promotion:
-				piece = promotion
+				promotion_type = PIECE_TYPES.index(promotion)
 			else:
-				raise ValueError("Cannot move to {} without promotion".format(piece, end_pos))
+				return MoveResult(None, PROMOTION_REQUIRED, (end_pos,))
 		else:
 			if promotion:
-				raise ValueError("Cannot promote with this move")
-
-		# move piece
-		newBoard = copy.deepcopy(self.board)
-		newBoard[start_coords[0]][start_coords[1]] = EMPTY_SQUARE
-		newBoard[end_coords[0]][end_coords[1]] = color + piece
+				return MoveResult(None, PROMOTION_NOT_ALLOWED, ())
 
-		if self.checkForCheck(newBoard):
-			raise ValueError("Cannot make move to a position in check")
+		move = encodeMove(start_coords[0]*8 + start_coords[1], end_sq, promotion_type, flag)
+		if not isLegalMove(self.position, move, self.turn):
+			return MoveResult(None, KING_IN_CHECK, ())
 		# TODO: check for checkmate
 
-		# handle castling rules
-		castle_row = 0 if self.turn == 0 else 7
-		if piece == 'K':
-			self.castle[self.turn] = [False, False]
-		elif piece == 'R' and start_coords == (castle_row, 0):
-			self.castle[self.turn][1] = False
-		elif piece == 'R' and start_coords == (castle_row, 7):
-			self.castle[self.turn][0] = False
-
-		self.board = newBoard
+		return MoveResult(move, MOVE_OK, ())
 
 	def moveCastle(self, side='king'):
-		"""Performs Castling for current player if allowed
+		"""Performs Castling for current player if allowed and passes the turn. Otherwise, a ValueError is raised.
+		The move is recorded like one made by makeMove, as 'O-O' or 'O-O-O'.
 
 		Params:
 		side -- Side to castle on ['king','queen']
 
+		Returns: the move made, packed by Moves.encodeMove
+		"""
+		result = self.findCastle(side)
+		if result.reason != MOVE_OK:
+			raise ValueError(result.message)
+		self.recordMove(result.move, 'O-O' if side == 'king' else 'O-O-O')
+		return result.move
+
+	def findCastle(self, side='king'):
+		"""Checks castling like moveCastle without making it or raising
+
+		Returns: MoveResult
 		"""
 
-		if self.checkForCheck(self.board):
-			raise ValueError("Cannot castle out of check")
+		if self.checkForCheck(self.position):
+			return MoveResult(None, CASTLE_OUT_OF_CHECK, ())
 
 		row = 0 if self.turn == 0 else 7
 		color = 'W' if self.turn == 0 else 'B'
+		squares = self.position.squares[row*8:row*8+8]
 
 		if side=='king':
-			if (self.board[row][4], self.board[row][5], self.board[row][6], self.board[row][7]) \
+			if (squares[4], squares[5], squares[6], squares[7]) \
 				!= (color+'K', EMPTY_SQUARE, EMPTY_SQUARE, color+'R'):
-				raise ValueError("Pieces are not in place to castle king side")
+				return MoveResult(None, CASTLE_PIECES_MISSING, ('king',))
 			if not self.castle[self.turn][0]:
-				raise ValueError("Castling king side no longer allowed")
+				return MoveResult(None, CASTLE_RIGHT_LOST, ('king',))
+			path = range(5,7)
+		elif side=='queen':
+			if (squares[4], squares[3], squares[2], squares[1], squares[0]) \
+				!= (color+'K', EMPTY_SQUARE, EMPTY_SQUARE, EMPTY_SQUARE, color+'R'):
+				return MoveResult(None, CASTLE_PIECES_MISSING, ('queen',))
+			if not self.castle[self.turn][1]:
+				return MoveResult(None, CASTLE_RIGHT_LOST, ('queen',))
+			path = range(3,1,-1)
+		else:
+			return MoveResult(None, CASTLE_INVALID_SIDE, (side,))
 
-			# Castle
-			newBoard = copy.deepcopy(self.board)
-			for col in range(5,7):
-				newBoard[row][col-1], newBoard[row][col] = EMPTY_SQUARE, color+'K'
-				if self.checkForCheck(newBoard):
-					raise ValueError("Cannot castle through or into check")
+		# The king is not in check so the squares it passes through can be tested in the current position
+		for col in path:
+			if self.position.isAttacked(row*8 + col, 1-self.turn):
+				return MoveResult(None, CASTLE_THROUGH_CHECK, ())
 
-			newBoard[row][5], newBoard[row][7] = color+'R', EMPTY_SQUARE
+		return MoveResult(encodeMove(row*8 + 4, row*8 + path[-1], flag=CASTLE), MOVE_OK, ())
 
-			self.castle[self.turn] = [False, False]
+	def doMove(self, move):
+		"""Makes a move in place and passes the turn without checking that it is legal.
 
-		if side=='queen':
-			if (self.board[row][4], self.board[row][3], self.board[row][2], self.board[row][1], self.board[row][0]) \
-				!= (color+'K', EMPTY_SQUARE, EMPTY_SQUARE, EMPTY_SQUARE, color+'R'):
-				raise ValueError("Pieces are not in place to castle queen side")
-			if not self.castle[self.turn][1]:
-				raise ValueError("Castling queen side no longer allowed")
+		Params:
+		move -- move packed by Moves.encodeMove. Castling is given as the king's move with the CASTLE flag.
+
+		Returns: undo record to pass to undoMove as
+			(move, moved piece, captured piece, castling rights, en passant square, zobrist state, halfmove clock)
+		"""
+		position = self.position
+		start = move & 63
+		end = move >> 6 & 63
+		flag = move >> 15
+		piece = position.removePiece(start)
+		captured = position.removePiece(end)
+		castle = self.castle
+		en_passant = self.en_passant
+
+		self.en_passant = None
+		if piece[1] == 'P':
+			if flag == EN_PASSANT:
+				captured = position.removePiece(end-8 if self.turn == 0 else end+8)
+			elif end - start == 16 or start - end == 16:
+				self.en_passant = (start + end) >> 1
+
+		promotion = move >> 12 & 7
+		if promotion:
+			position.setPiece(end, piece[0] + PIECE_TYPES[promotion])
+		else:
+			position.setPiece(end, piece)
+
+		if flag == CASTLE:
+			row = start & 56
+			if end & 7 == 6:
+				position.setPiece(row+5, position.removePiece(row+7))
+			else:
+				position.setPiece(row+3, position.removePiece(row))
+
+		# handle castling rules. Rights are copied on write so the undo record can keep the old lists
+		if castle[0][0] or castle[0][1] or castle[1][0] or castle[1][1]:
+			lost = []
+			if piece[1] == 'K':
+				lost += [(self.turn, 0), (self.turn, 1)]
+			if start in castle_squares:
+				lost.append(castle_squares[start])
+			if end in castle_squares:
+				lost.append(castle_squares[end])
+			if lost:
+				self.castle = [castle[0][:], castle[1][:]]
+				for color, side in lost:
+					self.castle[color][side] = False
+
+		halfmove_clock = self.halfmove_clock
+		if piece[1] == 'P' or captured != EMPTY_SQUARE:
+			self.halfmove_clock = 0
+		else:
+			self.halfmove_clock += 1
+		if self.turn == 1:
+			self.fullmove += 1
+		self.turn = 1-self.turn
+
+		zobrist_state = self.zobrist_state
+		if en_passant is not None or self.en_passant is not None or self.castle is not castle:
+			self.resetHash()
+
+		return (move, piece, captured, castle, en_passant, zobrist_state, halfmove_clock)
+
+	def undoMove(self, undo):
+		"""Takes back a move made by doMove
+
+		Params:
+		undo -- undo record returned by doMove for the last move made
+		"""
+		move, piece, captured, castle, en_passant, zobrist_state, halfmove_clock = undo
+		position = self.position
+		start = move & 63
+		end = move >> 6 & 63
+		flag = move >> 15
+
+		position.removePiece(end)
+		position.setPiece(start, piece)
+		if flag == EN_PASSANT:
+			position.setPiece(end+8 if piece[0] == 'B' else end-8, captured)
+		elif captured != EMPTY_SQUARE:
+			position.setPiece(end, captured)
+
+		if flag == CASTLE:
+			row = start & 56
+			if end & 7 == 6:
+				position.setPiece(row+7, position.removePiece(row+5))
+			else:
+				position.setPiece(row, position.removePiece(row+3))
+
+		self.castle = castle
+		self.en_passant = en_passant
+		self.zobrist_state = zobrist_state
+		self.halfmove_clock = halfmove_clock
+		self.turn = 1-self.turn
+		if self.turn == 1:
+			self.fullmove -= 1
+
+	def legalMoves(self):
+		"""Lists all legal moves for the player to move, including castling, promotions and en passant.
 
-			# Castle
-			newBoard = copy.deepcopy(self.board)
-			for col in range(3,1,-1):
-				newBoard[row][col+1], newBoard[row][col] = EMPTY_SQUARE, color+'K'
-				if self.checkForCheck(newBoard):
-					raise ValueError("Cannot castle through or into check")
+		Returns: list of moves packed by Moves.encodeMove that can be passed to doMove
+		"""
+		return generateMoves(self.position, self.turn, self.castle[self.turn], self.en_passant)
+
+	def longAlgebraic(self, move):
+		"""Converts a packed move of the player to move into long algebraic notation accepted by makeMove
+
+		Ex: 'Ng1-f3', 'e5xd6', 'f7-f8=Q', 'O-O'
+
+		Params:
+		move -- move packed by Moves.encodeMove
+		"""
+		start = move & 63
+		end = move >> 6 & 63
+		if move >> 15 == CASTLE:
+			return 'O-O' if end & 7 == 6 else 'O-O-O'
+
+		piece = self.position.squares[start][1]
+		capture = self.position.squares[end] != EMPTY_SQUARE or move >> 15 == EN_PASSANT
+		text = '{}{}{}{}'.format('' if piece == 'P' else piece, squareName(start), 'x' if capture else '-', squareName(end))
+		promotion = move >> 12 & 7
+		if promotion:
+			text += '=' + PIECE_TYPES[promotion]
+		return text
+
+	def perft(self, depth, table=None):
+		"""Counts the leaf nodes of the legal move tree to the given depth
 
-			newBoard[row][3], newBoard[row][0] = color+'R', EMPTY_SQUARE
+		Params:
+		depth -- number of plies to search
+		table -- Transposition.TranspositionTable to cache subtree counts in or None (default: None)
 
-			self.castle[self.turn] = [False, False]
+		Returns: number of positions reachable in exactly depth plies
+		"""
+		if depth <= 0:
+			return 1
+		moves = self.legalMoves()
+		if depth == 1:
+			return len(moves)
+
+		if table is not None:
+			key = self.hash
+			entry = table.probe(key)
+			if entry is not None and entry[1] == depth:
+				return entry[2]
+
+		nodes = 0
+		for move in moves:
+			undo = self.doMove(move)
+			nodes += self.perft(depth-1, table)
+			self.undoMove(undo)
+
+		if table is not None:
+			table.store(key, depth, nodes)
+		return nodes
+
+	def divide(self, depth, table=None):
+		"""Runs perft below each legal move of the position
 
-		self.board = newBoard
+		Params:
+		depth -- number of plies to search including the root move
+		table -- Transposition.TranspositionTable to cache subtree counts in or None (default: None)
 
-	def findKing(self, board):
+		Returns: dict mapping each move in coordinate notation (Ex: 'e2e4') to its perft(depth-1) count
+		"""
+		counts = {}
+		for move in self.legalMoves():
+			undo = self.doMove(move)
+			counts[moveToUCI(move)] = self.perft(depth-1, table)
+			self.undoMove(undo)
+		return counts
+
+	def findKing(self, board, color=None):
 		"""Finds king of color self.turn on board if it exists. Only returns the position of the first king it finds.
 
 		Params:
-		board -- board to search for king on
+		board -- board to search for king on as a list of lists or a Bitboards.Position
+		color -- color of king to find as 0 (white) or 1 (black) (default: self.turn)
 
 		Returns: coords of first king found or None if there is no king
 		"""
-		color = 'W' if self.turn == 0 else 'B'
-		king_coords = None
-		for row in range(len(board)):
-			for col in range(len(board[row])):
-				if board[row][col] == color+'K':
-					king_coords = (row,col)
-					return king_coords
+		if not isinstance(board, Position):
+			board = Position.fromBoard(board)
+		if color is None:
+			color = self.turn
+
+		king_sq = board.kings[color]
+		if king_sq is None:
+			return None
 
-		return None
+		return squareToCoords(king_sq)
 
-	def checkForCheck(self, board):
+	def checkForCheck(self, board, color=None):
 		"""Checks board if the player is in check. Only works if there is no more than 1 self.turn colored king.
 
 		Params:
-		board -- board to search for check
+		board -- board to search for check as a list of lists or a Bitboards.Position
+		color -- color of player to test as 0 (white) or 1 (black) (default: self.turn)
 
 		Returns: True if in check and False otherwise.
 		"""
-		opposing_color = 'W' if self.turn == 1 else 'B'
-		king_coords = self.findKing(board)
-		if king_coords == None:
+		if not isinstance(board, Position):
+			board = Position.fromBoard(board)
+		if color is None:
+			color = self.turn
+
+		king_sq = board.kings[color]
+		if king_sq is None:
 			return False
-		for piece in ['Q','R','B','N','P']:
-			possible_pieces_to_move = possiblePieceStarts(piece, king_coords, opposing_color, board)
-			if possible_pieces_to_move:
-				return True
 
-		return False
+		return board.isAttacked(king_sq, 1-color)
+
+	def isSquareAttacked(self, square, by_color):
+		"""Checks if a square is attacked by any piece of a color
+
+		Params:
+		square -- square in chess notation or as a square index 0-63
+		by_color -- attacking color as 0 (white) or 1 (black)
+
+		Returns: True if square is attacked
+		"""
+		if isinstance(square, str):
+			row, col = self.convertPosToCoords(square)
+			square = row*8 + col
+		return self.position.isAttacked(square, by_color)
 
 	def printBoard(self):
 		"""Print board state to stdout"""
@@ -0,0 +1,175 @@
+import mmap
+import struct
+import sys
+
+from consts import PIECE_CODES, EMPTY_SQUARE, piece_index
+from Chess import Chess
+from Bitboards import Position, bitSquares
+
+# Positions are packed into fixed 32 byte records:
+#   bytes  0-7   occupancy bitboard, little endian
+#   bytes  8-23  one 4-bit piece index per occupied square from low to high square, low nibble first
+#   byte  24     side to move in bit 0, castling rights KQkq in bits 1-4
+#   byte  25     en passant square or NO_EN_PASSANT
+#   byte  26     halfmove clock, capped at 255
+#   byte  27     reserved
+#   bytes 28-29  fullmove number, capped at 65535
+#   bytes 30-31  reserved
+RECORD = struct.Struct('<Q16sBBBxHxx')
+RECORD_SIZE = RECORD.size
+NO_EN_PASSANT = 0xff
+MAX_PIECES = 32
+
+def encodePosition(chess):
+	"""Packs a game's position into a RECORD_SIZE byte record
+
+	Params:
+	chess -- Chess game
+
+	Returns: bytes. Raises ValueError if there are more than 32 pieces on the board
+	"""
+	position = chess.position
+	squares = position.squares
+	occupancy = position.occupancy
+	if occupancy.bit_count() > MAX_PIECES:
+		raise ValueError('Cannot encode a position with more than {} pieces'.format(MAX_PIECES))
+
+	nibbles = bytearray(16)
+	for i, sq in enumerate(bitSquares(occupancy)):
+		nibbles[i >> 1] |= piece_index[squares[sq]] << (4 * (i & 1))
+
+	castle = chess.castle
+	flags = chess.turn | castle[0][0] << 1 | castle[0][1] << 2 | castle[1][0] << 3 | castle[1][1] << 4
+	en_passant = chess.en_passant if chess.en_passant is not None else NO_EN_PASSANT
+	return RECORD.pack(occupancy, bytes(nibbles), flags, en_passant, min(chess.halfmove_clock, 255), min(chess.fullmove, 65535))
+
+def decodePosition(record, glyphs=True):
+	"""Unpacks a record made by encodePosition into a new Chess game
+
+	Params:
+	record -- bytes-like object of RECORD_SIZE bytes
+	glyphs -- passed on to Chess (default: True)
+
+	Returns: Chess
+	"""
+	occupancy, nibbles, flags, en_passant, halfmove_clock, fullmove = RECORD.unpack(record)
+	squares = [EMPTY_SQUARE]*64
+	for i, sq in enumerate(bitSquares(occupancy)):
+		squares[sq] = PIECE_CODES[nibbles[i >> 1] >> (4 * (i & 1)) & 15]
+
+	chess = Chess(glyphs)
+	chess.position = Position.fromSquares(squares)
+	chess.turn = flags & 1
+	chess.castle = [[bool(flags & 2), bool(flags & 4)], [bool(flags & 8), bool(flags & 16)]]
+	chess.en_passant = en_passant if en_passant != NO_EN_PASSANT else None
+	chess.halfmove_clock = halfmove_clock
+	chess.fullmove = fullmove
+	chess.resetHash()
+	return chess
+
+def writePositions(path, games, append=False):
+	"""Writes the positions of games to a file of packed records
+
+	Params:
+	path -- file to write
+	games -- iterable of Chess games
+	append -- add to the end of an existing file instead of replacing it (default: False)
+
+	Returns: number of records written
+	"""
+	count = 0
+	with open(path, 'ab' if append else 'wb') as f:
+		for chess in games:
+			f.write(encodePosition(chess))
+			count += 1
+	return count
+
+class PositionStore:
+	def __init__(self, path):
+		"""Opens a file of packed records written by writePositions. The file is memory mapped read only,
+		so records are read from the page cache on access and nothing is loaded up front.
+
+		Params:
+		path -- file of records
+		"""
+		self.file = open(path, 'rb')
+		size = self.file.seek(0, 2)
+		if size % RECORD_SIZE:
+			self.file.close()
+			raise ValueError("'{}' is not a whole number of {} byte records".format(path, RECORD_SIZE))
+		self.count = size // RECORD_SIZE
+		# empty files cannot be mapped
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+		self.view = memoryview(self.map) if self.map is not None else memoryview(b'')
+
+	def __len__(self):
+		return self.count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		"""Unmaps and closes the file. Arrays made from the mapped records, such as by Batch.recordArray,
+		must be released first, or the map cannot be closed and BufferError is raised after closing the file"""
+		try:
+			self.view.release()
+			if self.map is not None:
+				self.map.close()
+		finally:
+			self.file.close()
+
+	def record(self, i):
+		"""Returns record i as bytes. Records are small, so copying them keeps the store free to close"""
+		if i < 0:
+			i += self.count
+		if not 0 <= i < self.count:
+			raise IndexError('record index out of range')
+		return self.view[i*RECORD_SIZE:(i+1)*RECORD_SIZE].tobytes()
+
+	def fields(self, i):
+		"""Returns the raw fields of record i as (occupancy, piece nibbles, flags, en passant, halfmove clock, fullmove)"""
+		if i < 0:
+			i += self.count
+		if not 0 <= i < self.count:
+			raise IndexError('record index out of range')
+		return RECORD.unpack_from(self.view, i*RECORD_SIZE)
+
+	def records(self):
+		"""Generates the raw fields of each record in file order. See fields"""
+		return RECORD.iter_unpack(self.view)
+
+	def __getitem__(self, i):
+		"""Decodes record i into a new Chess game"""
+		return decodePosition(self.record(i))
+
+	def __iter__(self):
+		for i in range(self.count):
+			yield decodePosition(self.view[i*RECORD_SIZE:(i+1)*RECORD_SIZE])
+
+
+if __name__ == "__main__":
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description='Pack a file of FEN positions into fixed size records, or print the records of a packed file')
+	parser.add_argument('source', help='FEN file to pack, or packed file with --dump')
+	parser.add_argument('output', nargs='?', help='packed file to write')
+	parser.add_argument('--dump', action='store_true', help='print the packed file as FEN')
+	options = parser.parse_args()
+
+	start = time.perf_counter()
+	if options.dump:
+		with PositionStore(options.source) as store:
+			for chess in store:
+				print(chess.toFEN())
+		count = len(store)
+	elif options.output:
+		with open(options.source) as f:
+			count = writePositions(options.output, (Chess.fromFEN(line) for line in f if line.strip()))
+	else:
+		parser.error('expected an output file or --dump')
+	seconds = time.perf_counter() - start
+	print('{} positions ({} bytes each) in {:.2f}s'.format(count, RECORD_SIZE, seconds), file=sys.stderr)
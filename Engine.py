@@ -0,0 +1,281 @@
+import time
+from collections import namedtuple
+
+from consts import PIECE_CODES, EMPTY_SQUARE
+from Chess import Chess
+from Moves import EN_PASSANT, moveToUCI
+from Transposition import TranspositionTable, EXACT, LOWER, UPPER
+from Evaluation import evaluate
+from Tablebase import MAX_PIECES as MAX_TABLEBASE_PIECES
+
+INFINITY = 1000000
+MATE = 100000
+# scores beyond this are mates and are stored in the transposition table relative to the node
+MATE_BOUND = MATE - 1000
+MAX_PLY = 100
+
+# material values for ordering captures
+PIECE_VALUES = [100, 320, 330, 500, 900, 0]
+code_values = {code: PIECE_VALUES[i % 6] for i, code in enumerate(PIECE_CODES)}
+code_values[EMPTY_SQUARE] = 0
+
+# move ordering scores
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 20
+KILLER_SCORE = 1 << 19
+
+SearchResult = namedtuple('SearchResult', ['move', 'value', 'depth', 'pv', 'nodes', 'seconds'])
+
+class SearchStopped(Exception):
+	"""Raised inside the search when a limit is reached or stop is requested"""
+
+class Engine:
+	def __init__(self, chess, table=None, hash_mb=16, tablebase=None):
+		"""Initialize a search engine for a Chess game
+
+		Params:
+		chess -- Chess instance to search. Moves are made and taken back on it during the search
+		table -- Transposition.TranspositionTable to use (default: new table of hash_mb megabytes)
+		hash_mb -- size of the table to create if none is given (default: 16)
+		tablebase -- Tablebase.Tablebase to score positions with few pieces. Only tables already loaded are used (default: None)
+		"""
+		self.chess = chess
+		self.table = table if table is not None else TranspositionTable(hash_mb)
+		self.tablebase = tablebase
+		self.history = [[0]*64 for i in range(64)]
+		self.stopped = False
+		self.nodes = 0
+		self.depth_stats = []
+
+	def stop(self):
+		"""Asks a running search to stop. Safe to call from another thread.
+		A stop asked for before the search starts is kept, so the next search returns at once"""
+		self.stopped = True
+
+	def search(self, depth=MAX_PLY, movetime=None, nodes=None, info=None):
+		"""Searches the current position with iterative deepening
+
+		Params:
+		depth -- maximum depth in plies (default: MAX_PLY)
+		movetime -- wall clock budget in seconds or None for no limit (default: None)
+		nodes -- node budget or None for no limit (default: None)
+		info -- function called after each completed depth with a dict of
+			'depth', 'value', 'nodes', 'seconds', 'nps' and 'pv' (default: None)
+
+		Returns: SearchResult of the deepest completed iteration. move is None if there are no legal moves
+		"""
+		chess = self.chess
+		self.start_time = time.perf_counter()
+		self.deadline = self.start_time + movetime if movetime is not None else None
+		self.node_limit = nodes
+		self.nodes = 0
+		self.depth_stats = []
+		self.killers = [[0, 0] for i in range(MAX_PLY+1)]
+		self.pv_table = [[] for i in range(MAX_PLY+1)]
+		self.undos = []
+		self.path = []
+		self.table.newSearch()
+
+		moves = chess.legalMoves()
+		result = SearchResult(moves[0] if moves else None, 0, 0, moves[:1], 0, 0.0)
+		if len(moves) < 2:
+			self.stopped = False
+			return result
+
+		for current_depth in range(1, min(depth, MAX_PLY) + 1):
+			if self.stopped:
+				break
+			depth_start = time.perf_counter()
+			depth_nodes = self.nodes
+			try:
+				value = self.negamax(current_depth, -INFINITY, INFINITY, 0)
+			except SearchStopped:
+				# take back the moves of the unfinished iteration
+				while self.undos:
+					chess.undoMove(self.undos.pop())
+				break
+
+			now = time.perf_counter()
+			pv = self.pv_table[0][:]
+			result = SearchResult(pv[0], value, current_depth, pv, self.nodes, now - self.start_time)
+			seconds = now - depth_start
+			stats = {
+				'depth': current_depth,
+				'value': value,
+				'nodes': self.nodes - depth_nodes,
+				'seconds': seconds,
+				'nps': (self.nodes - depth_nodes) / seconds if seconds > 0 else 0.0,
+				'pv': [moveToUCI(move) for move in pv],
+			}
+			self.depth_stats.append(stats)
+			if info:
+				info(stats)
+			if abs(value) > MATE_BOUND:
+				break
+
+		# the stop, if any, ended this search
+		self.stopped = False
+		return result._replace(nodes=self.nodes, seconds=time.perf_counter() - self.start_time)
+
+	def checkLimits(self):
+		if self.stopped or (self.deadline is not None and time.perf_counter() >= self.deadline) \
+			or (self.node_limit is not None and self.nodes >= self.node_limit):
+			raise SearchStopped()
+
+	def orderMoves(self, moves, hash_move, ply):
+		"""Sorts moves best first: hash move, captures by MVV-LVA, killers, then by history"""
+		squares = self.chess.position.squares
+		killers = self.killers[ply]
+		history = self.history
+		scores = {}
+		for move in moves:
+			if move == hash_move:
+				scores[move] = HASH_MOVE_SCORE
+				continue
+			start = move & 63
+			end = move >> 6 & 63
+			victim = code_values[squares[end]]
+			if victim or move >> 15 == EN_PASSANT or move >> 12 & 7:
+				scores[move] = CAPTURE_SCORE + 10*victim - code_values[squares[start]] + (move >> 12 & 7)
+			elif move == killers[0] or move == killers[1]:
+				scores[move] = KILLER_SCORE
+			else:
+				scores[move] = history[start][end]
+		moves.sort(key=scores.__getitem__, reverse=True)
+		return moves
+
+	def negamax(self, depth, alpha, beta, ply):
+		"""Alpha-beta search of the current position to depth plies
+
+		Returns: value of the position for the player to move
+		"""
+		self.nodes += 1
+		if not self.nodes & 1023:
+			self.checkLimits()
+		self.pv_table[ply] = []
+
+		chess = self.chess
+		key = chess.hash
+		if ply > 0 and key in self.path:
+			return 0
+
+		if self.tablebase is not None and ply > 0 and chess.position.occupancy.bit_count() <= MAX_TABLEBASE_PIECES:
+			found = self.tablebase.probe(chess, generate=False)
+			if found is not None:
+				result, plies = found
+				return result * (MATE - ply - plies) if result else 0
+
+		hash_move = 0
+		entry = self.table.probe(key)
+		if entry is not None:
+			hash_move = entry[0]
+			if ply > 0 and entry[1] >= depth:
+				value = entry[2]
+				if value > MATE_BOUND:
+					value -= ply
+				elif value < -MATE_BOUND:
+					value += ply
+				bound = entry[3]
+				if bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha):
+					return value
+
+		if depth <= 0 or ply >= MAX_PLY:
+			return self.quiesce(alpha, beta, ply)
+
+		moves = chess.legalMoves()
+		if not moves:
+			return -MATE + ply if chess.checkForCheck(chess.position) else 0
+
+		alpha_start = alpha
+		best_value = -INFINITY
+		best_move = 0
+		self.path.append(key)
+		for move in self.orderMoves(moves, hash_move, ply):
+			self.undos.append(chess.doMove(move))
+			value = -self.negamax(depth-1, -beta, -alpha, ply+1)
+			chess.undoMove(self.undos.pop())
+
+			if value > best_value:
+				best_value = value
+				best_move = move
+				if value > alpha:
+					alpha = value
+					self.pv_table[ply] = [move] + self.pv_table[ply+1]
+					if alpha >= beta:
+						# remember quiet moves that cause a cutoff
+						if chess.position.squares[move >> 6 & 63] == EMPTY_SQUARE and not move >> 12 & 7 \
+							and move >> 15 != EN_PASSANT:
+							killers = self.killers[ply]
+							if killers[0] != move:
+								killers[1] = killers[0]
+								killers[0] = move
+							self.history[move & 63][move >> 6 & 63] += depth*depth
+						break
+		self.path.pop()
+
+		bound = UPPER if best_value <= alpha_start else LOWER if best_value >= beta else EXACT
+		stored = best_value
+		if stored > MATE_BOUND:
+			stored += ply
+		elif stored < -MATE_BOUND:
+			stored -= ply
+		self.table.store(key, depth, stored, bound, best_move)
+		return best_value
+
+	def quiesce(self, alpha, beta, ply):
+		"""Searches captures and promotions until the position is quiet"""
+		chess = self.chess
+		in_check = chess.checkForCheck(chess.position)
+		if not in_check:
+			stand_pat = evaluate(chess)
+			if stand_pat >= beta:
+				return stand_pat
+			if stand_pat > alpha:
+				alpha = stand_pat
+
+		moves = chess.legalMoves()
+		if not moves:
+			return -MATE + ply if in_check else 0
+		if ply >= MAX_PLY:
+			return evaluate(chess)
+
+		squares = chess.position.squares
+		if not in_check:
+			moves = [move for move in moves if squares[move >> 6 & 63] != EMPTY_SQUARE or move >> 12 & 7 or move >> 15 == EN_PASSANT]
+		best_value = alpha
+		for move in self.orderMoves(moves, 0, ply):
+			self.nodes += 1
+			if not self.nodes & 1023:
+				self.checkLimits()
+			self.undos.append(chess.doMove(move))
+			value = -self.quiesce(-beta, -alpha, ply+1)
+			chess.undoMove(self.undos.pop())
+			if value > best_value:
+				best_value = value
+				if value > alpha:
+					alpha = value
+					if alpha >= beta:
+						break
+		return best_value
+
+
+if __name__ == "__main__":
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Search a position and report per-depth timing')
+	parser.add_argument('fen', nargs='?', default='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+	parser.add_argument('--depth', type=int, default=MAX_PLY)
+	parser.add_argument('--movetime', type=float, default=None, help='seconds to search')
+	parser.add_argument('--nodes', type=int, default=None)
+	parser.add_argument('--hash', type=int, default=16, help='transposition table size in MB')
+	options = parser.parse_args()
+	if options.depth == MAX_PLY and options.movetime is None and options.nodes is None:
+		options.movetime = 5.0
+
+	engine = Engine(Chess.fromFEN(options.fen), hash_mb=options.hash)
+	report = lambda stats: print('depth {depth:2} value {value:6} nodes {nodes:9} time {seconds:7.3f}s {nps:9.0f} nodes/sec pv {pv}'.format(
+		**dict(stats, pv=' '.join(stats['pv']))))
+	result = engine.search(options.depth, options.movetime, options.nodes, report)
+	print('bestmove {} ({} nodes in {:.3f}s, {:.0f} nodes/sec)'.format(
+		moveToUCI(result.move) if result.move is not None else '(none)', result.nodes, result.seconds,
+		result.nodes / result.seconds if result.seconds > 0 else 0))
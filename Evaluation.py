@@ -0,0 +1,128 @@
+from consts import piece_index, EMPTY_SQUARE
+
+# Piece values in centipawns for the middle game and end game, indexed by piece type
+MG_VALUES = [100, 320, 330, 500, 900, 0]
+EG_VALUES = [120, 300, 320, 520, 920, 0]
+
+# Game phase contributed by each piece type. The start position has MAX_PHASE
+PHASE_WEIGHTS = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+# Piece-square tables from white's point of view, written with the 8th rank first
+PAWN_TABLE = [
+	  0,   0,   0,   0,   0,   0,   0,   0,
+	 50,  50,  50,  50,  50,  50,  50,  50,
+	 10,  10,  20,  30,  30,  20,  10,  10,
+	  5,   5,  10,  25,  25,  10,   5,   5,
+	  0,   0,   0,  20,  20,   0,   0,   0,
+	  5,  -5, -10,   0,   0, -10,  -5,   5,
+	  5,  10,  10, -20, -20,  10,  10,   5,
+	  0,   0,   0,   0,   0,   0,   0,   0,
+]
+KNIGHT_TABLE = [
+	-50, -40, -30, -30, -30, -30, -40, -50,
+	-40, -20,   0,   0,   0,   0, -20, -40,
+	-30,   0,  10,  15,  15,  10,   0, -30,
+	-30,   5,  15,  20,  20,  15,   5, -30,
+	-30,   0,  15,  20,  20,  15,   0, -30,
+	-30,   5,  10,  15,  15,  10,   5, -30,
+	-40, -20,   0,   5,   5,   0, -20, -40,
+	-50, -40, -30, -30, -30, -30, -40, -50,
+]
+BISHOP_TABLE = [
+	-20, -10, -10, -10, -10, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,  10,  10,   5,   0, -10,
+	-10,   5,   5,  10,  10,   5,   5, -10,
+	-10,   0,  10,  10,  10,  10,   0, -10,
+	-10,  10,  10,  10,  10,  10,  10, -10,
+	-10,   5,   0,   0,   0,   0,   5, -10,
+	-20, -10, -10, -10, -10, -10, -10, -20,
+]
+ROOK_TABLE = [
+	  0,   0,   0,   0,   0,   0,   0,   0,
+	  5,  10,  10,  10,  10,  10,  10,   5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	 -5,   0,   0,   0,   0,   0,   0,  -5,
+	  0,   0,   0,   5,   5,   0,   0,   0,
+]
+QUEEN_TABLE = [
+	-20, -10, -10,  -5,  -5, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,   5,   5,   5,   0, -10,
+	 -5,   0,   5,   5,   5,   5,   0,  -5,
+	  0,   0,   5,   5,   5,   5,   0,  -5,
+	-10,   5,   5,   5,   5,   5,   0, -10,
+	-10,   0,   5,   0,   0,   0,   0, -10,
+	-20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+KING_MG_TABLE = [
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-20, -30, -30, -40, -40, -30, -30, -20,
+	-10, -20, -20, -20, -20, -20, -20, -10,
+	 20,  20,   0,   0,   0,   0,  20,  20,
+	 20,  30,  10,   0,   0,  10,  30,  20,
+]
+KING_EG_TABLE = [
+	-50, -40, -30, -20, -20, -30, -40, -50,
+	-30, -20, -10,   0,   0, -10, -20, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -30,   0,   0,   0,   0, -30, -30,
+	-50, -30, -30, -30, -30, -30, -30, -50,
+]
+MG_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_MG_TABLE]
+EG_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_EG_TABLE]
+
+def _scores(values, tables):
+	"""Builds [piece index][square] tables of material plus piece-square value, positive for white and negative for black"""
+	scores = []
+	for color in range(2):
+		for piece_type in range(6):
+			table = []
+			for sq in range(64):
+				row, col = sq >> 3, sq & 7
+				# tables are written from the 8th rank down, and black reads them mirrored
+				score = values[piece_type] + tables[piece_type][(7-row)*8 + col if color == 0 else row*8 + col]
+				table.append(score if color == 0 else -score)
+			scores.append(table)
+	return scores
+
+# MG_SCORES[piece index][square] with piece index as in consts.PIECE_CODES
+MG_SCORES = _scores(MG_VALUES, MG_TABLES)
+EG_SCORES = _scores(EG_VALUES, EG_TABLES)
+PHASES = PHASE_WEIGHTS * 2
+
+def taper(mg, eg, phase):
+	"""Blends middle game and end game scores by game phase"""
+	if phase > MAX_PHASE:
+		phase = MAX_PHASE
+	return (mg*phase + eg*(MAX_PHASE-phase)) // MAX_PHASE
+
+def evaluate(chess):
+	"""Evaluates a Chess position in centipawns from the point of view of the player to move.
+
+	Material, piece-square and phase terms are kept up to date by the position as pieces move, so this is O(1).
+	"""
+	position = chess.position
+	score = taper(position.mg, position.eg, position.phase)
+	return score if chess.turn == 0 else -score
+
+def evaluatePosition(position):
+	"""Computes the (mg, eg, phase) terms of a Bitboards.Position from scratch by scanning every square"""
+	mg = eg = phase = 0
+	for sq, piece in enumerate(position.squares):
+		if piece != EMPTY_SQUARE:
+			index = piece_index[piece]
+			mg += MG_SCORES[index][sq]
+			eg += EG_SCORES[index][sq]
+			phase += PHASES[index]
+	return mg, eg, phase
@@ -0,0 +1,127 @@
+import sys
+import time
+from collections import namedtuple
+
+from consts import KING, EMPTY_SQUARE, piece_index
+from Chess import Chess
+from Moves import squareName
+from Instrument import profiling, addProfileArgument
+
+# number -- line number in the input starting at 1, fen -- line as read,
+# normalized -- FEN as written by Chess.toFEN or None if invalid, error -- reason the FEN is invalid or None
+FENResult = namedtuple('FENResult', ['number', 'fen', 'normalized', 'error'])
+
+BACK_RANKS = 0xff | 0xff << 56
+# king and rook needed on their squares for each castling right, indexed like Chess.castle
+CASTLE_PIECES = [[(4, 7, 'WR'), (4, 0, 'WR')], [(60, 63, 'BR'), (60, 56, 'BR')]]
+
+def checkPosition(chess):
+	"""Checks that a position could arise in a game
+
+	Params:
+	chess -- Chess game
+
+	Returns: list of strings describing each problem found. Empty if the position is valid
+	"""
+	position = chess.position
+	pieces = position.pieces
+	squares = position.squares
+	turn = chess.turn
+	problems = []
+
+	for color, name in enumerate(['white', 'black']):
+		kings = pieces[6*color + KING].bit_count()
+		if kings != 1:
+			problems.append('{} has {} kings'.format(name, kings))
+	if (pieces[piece_index['WP']] | pieces[piece_index['BP']]) & BACK_RANKS:
+		problems.append('pawns on the first or last rank')
+
+	king_sq = position.kings[1-turn]
+	if king_sq is not None and position.isAttacked(king_sq, turn):
+		problems.append('side not to move is in check')
+
+	for color in range(2):
+		for side in range(2):
+			king_sq, rook_sq, rook = CASTLE_PIECES[color][side]
+			if chess.castle[color][side] and (squares[king_sq] != 'WB'[color] + 'K' or squares[rook_sq] != rook):
+				problems.append("castling right '{}' without king and rook in place".format('KQkq'[2*color + side]))
+
+	en_passant = chess.en_passant
+	if en_passant is not None:
+		# the pawn that just moved two squares is in front of the square and the square it came from is empty
+		if turn == 0:
+			row, pushed_sq, from_sq = 5, en_passant-8, en_passant+8
+		else:
+			row, pushed_sq, from_sq = 2, en_passant+8, en_passant-8
+		if en_passant >> 3 != row or squares[pushed_sq] != 'WB'[1-turn] + 'P' \
+			or squares[en_passant] != EMPTY_SQUARE or squares[from_sq] != EMPTY_SQUARE:
+			problems.append("en passant square '{}' without a pawn that just moved two squares".format(squareName(en_passant)))
+	return problems
+
+def normalizeFEN(fen):
+	"""Validates a FEN and rewrites it in the form written by Chess.toFEN, filling in any missing fields
+
+	Params:
+	fen -- FEN string
+
+	Returns: normalized FEN string. Raises ValueError describing the problems if the FEN is invalid
+	"""
+	chess = Chess.fromFEN(fen)
+	problems = checkPosition(chess)
+	if problems:
+		raise ValueError('; '.join(problems))
+	return chess.toFEN()
+
+def validateFENs(lines):
+	"""Validates and normalizes one FEN per line. Blank lines and lines starting with '#' are skipped
+
+	Params:
+	lines -- iterable of lines such as an open file
+
+	Returns: generator of FENResult
+	"""
+	for number, line in enumerate(lines, 1):
+		fen = line.strip()
+		if not fen or fen[0] == '#':
+			continue
+		try:
+			yield FENResult(number, fen, normalizeFEN(fen), None)
+		except ValueError as e:
+			yield FENResult(number, fen, None, str(e))
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Validate and normalize a file of FEN positions, one per line')
+	parser.add_argument('fens', help="FEN file or '-' for stdin")
+	parser.add_argument('-o', '--output', help='write the normalized FEN of each valid line to this file')
+	parser.add_argument('--quiet', action='store_true', help='only print the summary')
+	addProfileArgument(parser)
+	options = parser.parse_args(argv)
+
+	source = sys.stdin if options.fens == '-' else open(options.fens)
+	output = open(options.output, 'w') if options.output else None
+	start = time.perf_counter()
+	count = invalid = 0
+	try:
+		with profiling(options.profile):
+			for result in validateFENs(source):
+				count += 1
+				if result.error is not None:
+					invalid += 1
+					if not options.quiet:
+						print('line {}: {}: {}'.format(result.number, result.fen, result.error))
+				elif output:
+					output.write(result.normalized + '\n')
+	finally:
+		if source is not sys.stdin:
+			source.close()
+		if output:
+			output.close()
+	seconds = time.perf_counter() - start
+	print('{} positions, {} invalid in {:.2f}s ({:.0f} positions/sec)'.format(
+		count, invalid, seconds, count / seconds if seconds > 0 else 0))
+	return 1 if invalid else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
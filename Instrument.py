@@ -0,0 +1,134 @@
+import functools
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+import Chess
+import Pieces
+
+# Instrumented functions as (owner, attribute). Chess.py imports possiblePieceStarts by name, so both names are replaced.
+TARGETS = [
+	(Chess.Chess, 'makeMove'),
+	(Chess.Chess, 'tryMove'),
+	(Chess.Chess, 'movePiece'),
+	(Chess.Chess, 'findPieceMove'),
+	(Chess.Chess, 'findCastle'),
+	(Chess.Chess, 'checkForCheck'),
+	(Chess.Chess, 'findKing'),
+	(Pieces, 'possiblePieceStarts'),
+	(Chess, 'possiblePieceStarts'),
+]
+
+# name -> [calls, seconds]. Times include the time spent in instrumented functions called from inside
+stats = {}
+# (owner, attribute) -> original function while instrumentation is enabled
+_originals = {}
+
+def _timed(name, function):
+	"""Wraps function to add its calls and time to stats[name]"""
+	counter = stats.setdefault(name, [0, 0.0])
+	perf_counter = time.perf_counter
+
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		start = perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			counter[0] += 1
+			counter[1] += perf_counter() - start
+	return wrapper
+
+def _timedByPiece(name, function):
+	"""Wraps possiblePieceStarts to keep stats per piece type, as '<name>[N]'. Pawns are '<name>[P]'"""
+	perf_counter = time.perf_counter
+
+	@functools.wraps(function)
+	def wrapper(piece, *args, **kwargs):
+		start = perf_counter()
+		try:
+			return function(piece, *args, **kwargs)
+		finally:
+			key = '{}[{}]'.format(name, piece or 'P')
+			counter = stats.get(key)
+			if counter is None:
+				counter = stats[key] = [0, 0.0]
+			counter[0] += 1
+			counter[1] += perf_counter() - start
+	return wrapper
+
+def enabled():
+	"""Returns: True if the hot functions are being counted and timed"""
+	return bool(_originals)
+
+def enable():
+	"""Replaces the functions in TARGETS with counting and timing wrappers. Does nothing if already enabled"""
+	if _originals:
+		return
+	wrappers = {}
+	for owner, attribute in TARGETS:
+		function = getattr(owner, attribute)
+		_originals[(owner, attribute)] = function
+		# the two names of possiblePieceStarts share one wrapper
+		if function not in wrappers:
+			if attribute == 'possiblePieceStarts':
+				wrappers[function] = _timedByPiece(attribute, function)
+			else:
+				wrappers[function] = _timed('{}.{}'.format(owner.__name__, attribute), function)
+		setattr(owner, attribute, wrappers[function])
+
+def disable():
+	"""Puts back the original functions, so disabled instrumentation costs nothing. The stats are kept"""
+	for (owner, attribute), function in _originals.items():
+		setattr(owner, attribute, function)
+	_originals.clear()
+
+def reset():
+	"""Zeroes the stats"""
+	for counter in stats.values():
+		counter[0] = 0
+		counter[1] = 0.0
+
+def report():
+	"""Returns: dict of name -> {'calls', 'seconds', 'mean_us'} for each function called, most total time first"""
+	rows = sorted(((name, calls, seconds) for name, (calls, seconds) in stats.items() if calls), key=lambda row: -row[2])
+	return {name: {'calls': calls, 'seconds': seconds, 'mean_us': seconds / calls * 1e6} for name, calls, seconds in rows}
+
+def formatReport():
+	"""Returns: the report as a table, one function per line"""
+	lines = ['{:32} {:>10} {:>10} {:>10}'.format('function', 'calls', 'seconds', 'mean us')]
+	for name, row in report().items():
+		lines.append('{:32} {:10} {:10.3f} {:10.1f}'.format(name, row['calls'], row['seconds'], row['mean_us']))
+	return '\n'.join(lines)
+
+def dumpJSON(path):
+	"""Writes the report to a JSON file"""
+	with open(path, 'w') as f:
+		json.dump(report(), f, indent=2)
+
+@contextmanager
+def profiling(output=None, file=sys.stderr):
+	"""Enables instrumentation for a block and reports when it ends. Used by the --profile flags
+
+	Params:
+	output -- None to leave instrumentation off, '' to print the report, or a path to also write it as JSON (default: None)
+	file -- stream the report is printed to (default: sys.stderr)
+	"""
+	if output is None:
+		yield
+		return
+	reset()
+	enable()
+	try:
+		yield
+	finally:
+		disable()
+		print(formatReport(), file=file)
+		if output:
+			dumpJSON(output)
+
+def addProfileArgument(parser):
+	"""Adds the --profile flag read by profiling to an argparse parser"""
+	parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+		help='count and time calls to the move rule checks and print a report at exit, also writing it to JSON if given')
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+DEFAULT_SIZE = 1 << 16
+
+class MoveCache:
+	def __init__(self, size=DEFAULT_SIZE):
+		"""Initialize a least recently used cache of resolved moves
+
+		Entries map (position key, move text) to the Chess.MoveResult of checking that move in that position,
+		so a move seen before in the same position is resolved without searching for the piece or testing legality.
+		When full, the entry used longest ago is dropped.
+
+		Params:
+		size -- most entries kept (default: DEFAULT_SIZE)
+		"""
+		if size < 1:
+			raise ValueError('Cache size must be at least 1, not {}'.format(size))
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		"""Number of entries in the cache"""
+		return len(self.entries)
+
+	def clear(self):
+		"""Empties the cache and resets the counters"""
+		self.entries.clear()
+		self.hits = self.misses = self.evictions = 0
+
+	def get(self, key, text):
+		"""Looks up a move
+
+		Params:
+		key -- 64-bit position key such as Chess.hash
+		text -- move as written
+
+		Returns: the stored MoveResult or None if the move is not cached
+		"""
+		entry = self.entries.get((key, text))
+		if entry is None:
+			self.misses += 1
+			return None
+		self.entries.move_to_end((key, text))
+		self.hits += 1
+		return entry
+
+	def put(self, key, text, result):
+		"""Stores the result of resolving a move, dropping the least recently used entry if the cache is full"""
+		entries = self.entries
+		entries[(key, text)] = result
+		if len(entries) > self.size:
+			entries.popitem(last=False)
+			self.evictions += 1
+
+	def stats(self):
+		"""Returns a dict of cache size and hit/miss/eviction counters"""
+		lookups = self.hits + self.misses
+		return {
+			'entries': len(self),
+			'size': self.size,
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'hit_rate': self.hits / lookups if lookups else 0.0,
+		}
@@ -0,0 +1,43 @@
+from consts import PIECE_TYPES
+
+# Moves are packed into ints:
+#   bits  0-5  start square
+#   bits  6-11 end square
+#   bits 12-14 promotion piece type (KNIGHT..QUEEN) or 0 for no promotion
+#   bits 15-16 move flag
+NORMAL, CASTLE, EN_PASSANT = 0, 1, 2
+
+def encodeMove(start, end, promotion=0, flag=NORMAL):
+	"""Packs a move into an int
+
+	Params:
+	start -- start square index
+	end -- end square index
+	promotion -- piece type to promote to from consts KNIGHT..QUEEN or 0 for none (default: 0)
+	flag -- one of NORMAL, CASTLE, EN_PASSANT (default: NORMAL)
+	"""
+	return start | end << 6 | promotion << 12 | flag << 15
+
+def moveStart(move):
+	return move & 63
+
+def moveEnd(move):
+	return move >> 6 & 63
+
+def movePromotion(move):
+	return move >> 12 & 7
+
+def moveFlag(move):
+	return move >> 15
+
+def squareName(sq):
+	"""Converts square index to chess notation. Ex: 21 converts to 'f3'"""
+	return 'abcdefgh'[sq & 7] + str((sq >> 3) + 1)
+
+def moveToUCI(move):
+	"""Converts a packed move to long algebraic coordinate notation. Ex: 'e2e4', 'e7e8q'"""
+	text = squareName(move & 63) + squareName(move >> 6 & 63)
+	promotion = move >> 12 & 7
+	if promotion:
+		text += PIECE_TYPES[promotion].lower()
+	return text
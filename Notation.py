@@ -0,0 +1,135 @@
+from collections import namedtuple
+
+# A move read from text. Castles have castle set to 'king' or 'queen', piece 'K' and the other fields empty.
+# piece -- 'K', 'Q', 'R', 'B', 'N', 'P', or None if not given and a start square is, as in UCI 'g1f3'
+# start -- square, file or rank the piece moves from as written, or None
+# end -- square the piece moves to
+# capture -- True if the move is written with 'x', None for UCI moves, which have no piece letter or separator
+#   and do not say whether they capture
+# promotion -- 'Q', 'R', 'B', 'N' or None
+ParsedMove = namedtuple('ParsedMove', ['piece', 'start', 'end', 'capture', 'promotion', 'castle'])
+
+FILES = 'abcdefgh'
+RANKS = '12345678'
+PIECE_LETTERS = 'KQRBN'
+PROMOTION_LETTERS = 'QRBN'
+# promotion letters of UCI moves such as 'e7e8q'
+UCI_PROMOTIONS = {'q': 'Q', 'r': 'R', 'b': 'B', 'n': 'N'}
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+KING_CASTLE = ParsedMove('K', None, None, False, None, 'king')
+QUEEN_CASTLE = ParsedMove('K', None, None, False, None, 'queen')
+
+def parseMove(text):
+	"""Reads a move in standard algebraic notation (Ex: 'Nf3', 'exd5', 'Nbd7', 'R1e2', 'f8=Q+', 'O-O-O#'),
+	long algebraic notation (Ex: 'Ng1-f3', 'e7xd8=N') or UCI coordinates (Ex: 'e2e4', 'e7e8q').
+	Check and mate suffixes and up to two annotation marks like '!?' are ignored.
+
+	Params:
+	text -- move as a string
+
+	Returns: ParsedMove or None if the text is not a move
+	"""
+	end = len(text)
+	# '!' and '?' annotations, then the check or mate sign before them
+	marks = 0
+	while end and marks < 2 and text[end-1] in '!?':
+		end -= 1
+		marks += 1
+	if end and text[end-1] in '+#':
+		end -= 1
+	if end < 2:
+		return None
+
+	if text[0] in 'O0':
+		if end == 3 and text[1] == '-' and text[2] in 'O0':
+			return KING_CASTLE
+		if end == 5 and text[1] == '-' and text[2] in 'O0' and text[3] == '-' and text[4] in 'O0':
+			return QUEEN_CASTLE
+		return None
+
+	i = 0
+	piece = None
+	if text[0] in PIECE_LETTERS:
+		piece = text[0]
+		i = 1
+
+	promotion = None
+	if end - i >= 4 and text[end-2] == '=' and text[end-1] in PROMOTION_LETTERS:
+		promotion = text[end-1]
+		end -= 2
+	elif end == 5 and text[4] in UCI_PROMOTIONS and text[0] in FILES and text[1] in RANKS:
+		promotion = UCI_PROMOTIONS[text[4]]
+		end = 4
+
+	# the destination square is always the last two characters
+	if end - i < 2 or text[end-2] not in FILES or text[end-1] not in RANKS:
+		return None
+	destination = text[end-2:end]
+	end -= 2
+
+	# between the piece and the destination: start file, start rank, then '-' or 'x' with optional spaces around it
+	start_file = start_rank = None
+	if i < end and text[i] in FILES:
+		start_file = text[i]
+		i += 1
+	if i < end and text[i] in RANKS:
+		start_rank = text[i]
+		i += 1
+	while i < end and text[i] == ' ':
+		i += 1
+	capture = False
+	separated = i < end and text[i] in '-x'
+	if separated:
+		capture = text[i] == 'x'
+		i += 1
+	while i < end and text[i] == ' ':
+		i += 1
+	if i != end:
+		return None
+
+	if start_file and start_rank:
+		start = start_file + start_rank
+		if piece is None and not separated:
+			capture = None
+	else:
+		start = start_file or start_rank
+		if piece is None:
+			# pawn captures name the file they come from
+			if capture and start_file is None:
+				return None
+			piece = 'P'
+	return ParsedMove(piece, start, destination, capture, promotion, None)
+
+def parseMoves(moves):
+	"""Reads a list of moves, such as the main line of a game
+
+	Params:
+	moves -- iterable of move strings, or one string of moves separated by whitespace. In a string,
+		move numbers like '12.' and '12...' are skipped and results like '1-0' end the list
+
+	Returns: list of ParsedMove with None for each entry that is not a move
+	"""
+	if isinstance(moves, str):
+		moves = _splitMoves(moves)
+	# games repeat the same few strings, so each distinct string is only read once
+	parsed = {}
+	results = []
+	for text in moves:
+		move = parsed.get(text, parseMove)
+		if move is parseMove:
+			move = parsed[text] = parseMove(text)
+		results.append(move)
+	return results
+
+def _splitMoves(text):
+	moves = []
+	for token in text.split():
+		if token in RESULTS:
+			break
+		# drop the move number, which may be written against the move as in '1.e4'
+		if token[0].isdigit() and '.' in token:
+			token = token[token.rindex('.')+1:]
+		if token:
+			moves.append(token)
+	return moves
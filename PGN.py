@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import time
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import Chess
+from Instrument import profiling, addProfileArgument
+
+# tags -- dict of tag names to values, moves -- list of SAN strings of the main line,
+# result -- game termination marker or None if the game was not terminated
+PGNGame = namedtuple('PGNGame', ['tags', 'moves', 'result'])
+
+# number -- position of the game in the input starting at 1, legal -- True if every move could be made,
+# plies -- number of moves made, illegal_ply and illegal_move -- first move that could not be made or None,
+# error -- reason the move could not be made or None, key -- Zobrist key of the final position,
+# fen -- FEN of the final position, before the first move that could not be made. None if the game could not be set up
+GameResult = namedtuple('GameResult', ['number', 'tags', 'legal', 'plies', 'illegal_ply', 'illegal_move', 'error', 'key', 'fen'])
+
+RESULTS = {'1-0', '0-1', '1/2-1/2', '*'}
+TAG_RE = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# a brace comment (possibly running past the end of the line), a rest of line comment, a variation bracket or any other word
+TOKEN_RE = re.compile(r'\{[^}]*\}?|;.*|[()]|[^\s{}();]+')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.*')
+
+def readGames(lines):
+	"""Reads games one at a time from PGN text. Only the current game is held in memory.
+
+	Comments, variations, NAGs, move numbers and annotation glyphs are skipped so only the main line is kept.
+
+	Params:
+	lines -- iterable of lines of PGN text such as an open file
+
+	Returns: generator of PGNGame
+	"""
+	tags = {}
+	moves = []
+	in_comment = False
+	variation_depth = 0
+	for line in lines:
+		if in_comment:
+			end = line.find('}')
+			if end < 0:
+				continue
+			line = line[end+1:]
+			in_comment = False
+		elif line.startswith('%'):
+			# escaped line
+			continue
+
+		if variation_depth == 0 and line.lstrip().startswith('['):
+			if moves:
+				# previous game ended without a result
+				yield PGNGame(tags, moves, None)
+				tags = {}
+				moves = []
+			match = TAG_RE.match(line.strip())
+			if match:
+				tags[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+			continue
+
+		for token in TOKEN_RE.findall(line):
+			first = token[0]
+			if first == '{':
+				in_comment = not token.endswith('}')
+			elif first == ';':
+				pass
+			elif first == '(':
+				variation_depth += 1
+			elif first == ')':
+				if variation_depth > 0:
+					variation_depth -= 1
+			elif variation_depth > 0 or first == '$' or first in '!?':
+				pass
+			elif token in RESULTS:
+				yield PGNGame(tags, moves, token)
+				tags = {}
+				moves = []
+			else:
+				# move numbers may be written against the move as in '1.e4' or '12...Nf6'
+				if first.isdigit() and not token.startswith('0-0'):
+					token = MOVE_NUMBER_RE.sub('', token)
+					if not token:
+						continue
+				moves.append(token)
+
+	if tags or moves:
+		yield PGNGame(tags, moves, None)
+
+def validateGame(game, number=1):
+	"""Replays a game through Chess.tryMove, stopping at the first move that cannot be made
+
+	Params:
+	game -- PGNGame. A 'FEN' tag gives the starting position
+	number -- position of the game in its input (default: 1)
+
+	Returns: GameResult
+	"""
+	try:
+		if 'FEN' in game.tags:
+			chess = Chess.fromFEN(game.tags['FEN'])
+		else:
+			chess = Chess()
+			chess.setupBoard()
+	except ValueError as e:
+		return GameResult(number, game.tags, False, 0, 0, None, str(e), None, None)
+
+	for ply, move in enumerate(game.moves):
+		result = chess.tryMove(move)
+		if not result:
+			return GameResult(number, game.tags, False, ply, ply+1, move, result.message, chess.hash, chess.toFEN())
+	return GameResult(number, game.tags, True, len(game.moves), None, None, None, chess.hash, chess.toFEN())
+
+def _validateChunk(chunk):
+	return [validateGame(game, number) for number, game in chunk]
+
+def _chunks(games, size):
+	chunk = []
+	for number, game in enumerate(games, 1):
+		chunk.append((number, game))
+		if len(chunk) == size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+def validateGames(games, processes=1, chunk_size=64):
+	"""Validates a stream of games, optionally across several processes
+
+	Games are sent to the workers in chunks and only a few chunks per worker are in flight at once,
+	so memory use does not grow with the size of the input. Results come back in input order.
+
+	Params:
+	games -- iterable of PGNGame such as readGames(file)
+	processes -- number of worker processes, 1 to validate in this process or None for one per core (default: 1)
+	chunk_size -- games sent to a worker at a time (default: 64)
+
+	Returns: generator of GameResult
+	"""
+	if processes == 1:
+		for number, game in enumerate(games, 1):
+			yield validateGame(game, number)
+		return
+
+	processes = processes or os.cpu_count() or 1
+	with ProcessPoolExecutor(processes) as executor:
+		window = 4 * processes
+		pending = deque()
+		for chunk in _chunks(games, chunk_size):
+			pending.append(executor.submit(_validateChunk, chunk))
+			if len(pending) >= window:
+				yield from pending.popleft().result()
+		while pending:
+			yield from pending.popleft().result()
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Validate the games of a PGN file by replaying their moves')
+	parser.add_argument('pgn', help="PGN file or '-' for stdin")
+	parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per core)')
+	parser.add_argument('--chunk', type=int, default=64, help='games sent to a worker at a time')
+	parser.add_argument('--quiet', action='store_true', help='only print the summary')
+	addProfileArgument(parser)
+	options = parser.parse_args(argv)
+	if options.profile is not None:
+		# only the calling process is instrumented
+		options.processes = 1
+
+	source = sys.stdin if options.pgn == '-' else open(options.pgn, encoding='utf-8', errors='replace')
+	start = time.perf_counter()
+	games = plies = illegal = 0
+	try:
+		with profiling(options.profile):
+			for result in validateGames(readGames(source), options.processes, options.chunk):
+				games += 1
+				plies += result.plies
+				if not result.legal:
+					illegal += 1
+					if not options.quiet:
+						print('game {} ({} vs {}): ply {} {}: {}'.format(result.number, result.tags.get('White', '?'),
+							result.tags.get('Black', '?'), result.illegal_ply, result.illegal_move, result.error))
+	finally:
+		if source is not sys.stdin:
+			source.close()
+	seconds = time.perf_counter() - start
+	print('{} games, {} illegal, {} plies in {:.2f}s ({:.0f} games/sec, {:.0f} plies/sec)'.format(
+		games, illegal, plies, seconds, games / seconds if seconds > 0 else 0, plies / seconds if seconds > 0 else 0))
+	return 1 if illegal else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
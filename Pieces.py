@@ -1,4 +1,7 @@
-from consts import EMPTY_SQUARE
+from consts import EMPTY_SQUARE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from Bitboards import Position, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_LINES, BISHOP_LINES, BETWEEN, \
+	rookAttacks, bishopAttacks, squareToCoords, bitSquares
+from Moves import CASTLE, EN_PASSANT
 
 def onBoard(row, col):
 	"""Checks if row, col are valid coords on the chess board"""
@@ -9,15 +12,14 @@ def onBoard(row, col):
 
 	return True
 
-def possiblePawnStarts(end_coords, color, board):
-	# TODO: en passant
+def possiblePawnStarts(end_coords, color, board, en_passant=None):
 	if color == 'W':
 		# Cant move pawns to 1st or 2nd rank
 		if end_coords[0] == 0 or end_coords[0] == 1:
 			return []
 
 		# Pawn is capturing
-		if board[end_coords[0]][end_coords[1]] != EMPTY_SQUARE:
+		if board[end_coords[0]][end_coords[1]] != EMPTY_SQUARE or end_coords == en_passant:
 			possible_start_coords = []
 			start_row, start_col = end_coords[0]-1, end_coords[1]-1
 			if onBoard(start_row,start_col) and board[start_row][start_col] == 'WP':
@@ -45,7 +47,7 @@ def possiblePawnStarts(end_coords, color, board):
 			return []
 
 		# Pawn is capturing
-		if board[end_coords[0]][end_coords[1]] != EMPTY_SQUARE:
+		if board[end_coords[0]][end_coords[1]] != EMPTY_SQUARE or end_coords == en_passant:
 			possible_start_coords = []
 			start_row, start_col = end_coords[0]+1, end_coords[1]-1
 			if onBoard(start_row,start_col) and board[start_row][start_col] == 'BP':
@@ -134,20 +136,86 @@ def possibleQueenStarts(end_coords, color, board):
 	dirs = [(1,1), (1,-1), (-1,1), (-1,-1), (1,0), (0,1), (-1,0), (0,-1)]
 	return longDistancePiece(dirs, end_coords, color+'Q', board)
 
-def possiblePieceStarts(piece, end_coords, color, board):
+def bitboardPawnStarts(end_sq, color, position, en_passant=None):
+	"""Bitboard version of possiblePawnStarts returning a bitboard of starting squares"""
+	if color == 0:
+		# Cant move pawns to 1st or 2nd rank
+		if end_sq < 16:
+			return 0
+		step = -8
+	else:
+		# Cant move pawns to 7th or 8th rank
+		if end_sq >= 48:
+			return 0
+		step = 8
+
+	pawns = position.pieces[6*color + PAWN]
+
+	# Pawn is capturing
+	if position.occupancy >> end_sq & 1 or end_sq == en_passant:
+		return PAWN_ATTACKS[1-color][end_sq] & pawns
+
+	# Pawn is not capturing
+	start_sq = end_sq + step
+	if pawns >> start_sq & 1:
+		return 1 << start_sq
+	# Pawns can move 2 from their starting rank only if they are not blocked
+	if (end_sq >> 3) == (3 if color == 0 else 4) and not position.occupancy >> start_sq & 1:
+		start_sq += step
+		if pawns >> start_sq & 1:
+			return 1 << start_sq
+
+	return 0
+
+def bitboardPieceStarts(piece, end_sq, color, position, en_passant=None):
+	"""Gets a bitboard of the squares of pieces that can move to end_sq on a bitboard position.
+
+	Params:
+	piece -- Piece making move from ['P','N','B','R','Q','K']
+	end_sq -- square index of the end of the desired move
+	color -- color of moving piece as 0 (white) or 1 (black)
+	position -- Bitboards.Position to search
+	en_passant -- square index a pawn can capture en passant on or None (default: None)
+
+	Returns: bitboard of possible starting squares
+	"""
+	base = 6*color
+	pieces = position.pieces
+	if piece == 'P':
+		return bitboardPawnStarts(end_sq, color, position, en_passant)
+	elif piece == 'N':
+		return KNIGHT_ATTACKS[end_sq] & pieces[base+KNIGHT]
+	elif piece == 'B':
+		return bishopAttacks(end_sq, position.occupancy) & pieces[base+BISHOP]
+	elif piece == 'R':
+		return rookAttacks(end_sq, position.occupancy) & pieces[base+ROOK]
+	elif piece == 'Q':
+		return (rookAttacks(end_sq, position.occupancy) | bishopAttacks(end_sq, position.occupancy)) & pieces[base+QUEEN]
+	elif piece == 'K':
+		return KING_ATTACKS[end_sq] & pieces[base+KING]
+	else:
+		raise ValueError("Invalid piece '{}' given".format(piece))
+
+def possiblePieceStarts(piece, end_coords, color, board, en_passant=None):
 	"""Gets the possible starting positions of pieces that can move to end_coords.
 
 	Params:
 	piece -- Piece making move from ['','N','B','R','Q','K']
 	end_coords -- coords in board of the end of the desired move
 	color -- color of moving piece from ['W','B']
-	board -- current board position
+	board -- current board position as a list of lists or a Bitboards.Position
+	en_passant -- coords a pawn can capture en passant on or None (default: None)
 
 	Returns: list of possible starting coords
 	"""
 
+	if isinstance(board, Position):
+		en_passant_sq = en_passant[0]*8 + en_passant[1] if en_passant else None
+		starts = bitboardPieceStarts(piece, end_coords[0]*8 + end_coords[1], 0 if color == 'W' else 1, board, en_passant_sq)
+		return [squareToCoords(sq) for sq in bitSquares(starts)]
+
 	if piece == 'P':
-		return possiblePawnStarts(end_coords, color, board)
+		return possiblePawnStarts(end_coords, color, board, en_passant)
 	elif piece == 'N':
 		return possibleKinghtStarts(end_coords, color, board)
 	elif piece == 'B':
@@ -159,4 +227,311 @@ def possiblePieceStarts(piece, end_coords, color, board):
 	elif piece == 'K':
 		return possibleKingStarts(end_coords, color, board)
 	else:
-		raise ValueError("Invalid piece '{}' given".format(piece))
\ No newline at end of file
+		raise ValueError("Invalid piece '{}' given".format(piece))
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_3 = 0xff << 16
+RANK_6 = 0xff << 40
+
+def _addPawnMoves(moves, start, end):
+	"""Adds a pawn move to moves, expanding moves to the last rank into the 4 promotions"""
+	if end >= 56 or end < 8:
+		for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+			moves.append(start | end << 6 | promotion << 12)
+	else:
+		moves.append(start | end << 6)
+
+def pseudoLegalMoves(position, color, castle=None, en_passant=None):
+	"""Generates moves for color that follow piece movement rules but may leave the king in check.
+	Castling moves are only generated if the king does not pass through an attacked square.
+
+	Params:
+	position -- Bitboards.Position to generate moves for
+	color -- color to move as 0 (white) or 1 (black)
+	castle -- castling rights as [king side, queen side] for color or None for no castling (default: None)
+	en_passant -- square index a pawn can capture en passant on or None (default: None)
+
+	Returns: list of moves packed by Moves.encodeMove
+	"""
+	moves = []
+	pieces = position.pieces
+	base = 6*color
+	own = position.occupied[color]
+	enemy = position.occupied[1-color]
+	occupancy = position.occupancy
+	empty = FULL ^ occupancy
+
+	# Pawns
+	pawns = pieces[base+PAWN]
+	if color == 0:
+		single = pawns << 8 & empty
+		for end in bitSquares(single):
+			_addPawnMoves(moves, end-8, end)
+		for end in bitSquares((single & RANK_3) << 8 & empty):
+			moves.append(end-16 | end << 6)
+		for end in bitSquares((pawns & ~FILE_H) << 9 & enemy):
+			_addPawnMoves(moves, end-9, end)
+		for end in bitSquares((pawns & ~FILE_A) << 7 & enemy):
+			_addPawnMoves(moves, end-7, end)
+	else:
+		single = pawns >> 8 & empty
+		for end in bitSquares(single):
+			_addPawnMoves(moves, end+8, end)
+		for end in bitSquares((single & RANK_6) >> 8 & empty):
+			moves.append(end+16 | end << 6)
+		for end in bitSquares((pawns & ~FILE_H) >> 7 & enemy):
+			_addPawnMoves(moves, end+7, end)
+		for end in bitSquares((pawns & ~FILE_A) >> 9 & enemy):
+			_addPawnMoves(moves, end+9, end)
+	if en_passant is not None:
+		for start in bitSquares(PAWN_ATTACKS[1-color][en_passant] & pawns):
+			moves.append(start | en_passant << 6 | EN_PASSANT << 15)
+
+	# Pieces
+	for start in bitSquares(pieces[base+KNIGHT]):
+		for end in bitSquares(KNIGHT_ATTACKS[start] & ~own):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+BISHOP]):
+		for end in bitSquares(bishopAttacks(start, occupancy) & ~own):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+ROOK]):
+		for end in bitSquares(rookAttacks(start, occupancy) & ~own):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+QUEEN]):
+		for end in bitSquares((rookAttacks(start, occupancy) | bishopAttacks(start, occupancy)) & ~own):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+KING]):
+		for end in bitSquares(KING_ATTACKS[start] & ~own):
+			moves.append(start | end << 6)
+
+	# Castling
+	if castle and (castle[0] or castle[1]):
+		row = 0 if color == 0 else 56
+		king = pieces[base+KING]
+		rooks = pieces[base+ROOK]
+		if king >> (row+4) & 1 and not position.isAttacked(row+4, 1-color):
+			if castle[0] and rooks >> (row+7) & 1 and not occupancy & (0x60 << row) \
+				and not position.isAttacked(row+5, 1-color) and not position.isAttacked(row+6, 1-color):
+				moves.append(row+4 | (row+6) << 6 | CASTLE << 15)
+			if castle[1] and rooks >> row & 1 and not occupancy & (0x0e << row) \
+				and not position.isAttacked(row+3, 1-color) and not position.isAttacked(row+2, 1-color):
+				moves.append(row+4 | (row+2) << 6 | CASTLE << 15)
+
+	return moves
+
+def leavesKingSafe(position, move, color):
+	"""Checks that making move does not leave the king of color in check
+
+	Params:
+	position -- Bitboards.Position before the move. It is restored before returning
+	move -- move packed by Moves.encodeMove
+	color -- color making the move as 0 (white) or 1 (black)
+
+	Returns: True if the king is not attacked after the move
+	"""
+	start = move & 63
+	end = move >> 6 & 63
+	piece = position.removePiece(start)
+	captured = position.removePiece(end)
+	captured_sq = end
+	if move >> 15 == EN_PASSANT:
+		captured_sq = end-8 if color == 0 else end+8
+		captured = position.removePiece(captured_sq)
+	position.setPiece(end, piece)
+
+	king_sq = position.kings[color]
+	safe = king_sq is None or not position.isAttacked(king_sq, 1-color)
+
+	position.removePiece(end)
+	position.setPiece(start, piece)
+	if captured != EMPTY_SQUARE:
+		position.setPiece(captured_sq, captured)
+
+	return safe
+
+def pinnedPieces(position, color, king_sq):
+	"""Finds the pieces of color pinned to their king
+
+	Params:
+	position -- Bitboards.Position
+	color -- color of the king as 0 (white) or 1 (black)
+	king_sq -- square index of the king
+
+	Returns: dict mapping the square of each pinned piece to a bitboard of the squares it can move to
+		without leaving the pin, which is the line between the king and the pinner including the pinner
+	"""
+	pins = {}
+	pieces = position.pieces
+	base = 6*(1-color)
+	queens = pieces[base+QUEEN]
+	pinners = (ROOK_LINES[king_sq] & (pieces[base+ROOK] | queens)) \
+		| (BISHOP_LINES[king_sq] & (pieces[base+BISHOP] | queens))
+	if not pinners:
+		return pins
+
+	occupancy = position.occupancy
+	own = position.occupied[color]
+	for pinner in bitSquares(pinners):
+		line = BETWEEN[king_sq][pinner]
+		blockers = line & occupancy
+		# pinned if exactly one piece stands between the king and the pinner and it is our own
+		if blockers & own and not blockers & (blockers-1):
+			pins[blockers.bit_length() - 1] = line | 1 << pinner
+	return pins
+
+def checkMask(position, color, king_sq):
+	"""Finds the squares a non-king move must end on to get out of check
+
+	Params:
+	position -- Bitboards.Position
+	color -- color of the king as 0 (white) or 1 (black)
+	king_sq -- square index of the king
+
+	Returns: FULL if not in check, the checker plus the squares between it and the king for a single check,
+		or 0 for a double check
+	"""
+	checkers = position.attackers(king_sq, 1-color)
+	if not checkers:
+		return FULL
+	if checkers & (checkers-1):
+		return 0
+	return checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+def isLegalMove(position, move, color):
+	"""Checks that a move following piece movement rules does not leave the king of color in check,
+	without making the move.
+
+	Params:
+	position -- Bitboards.Position before the move
+	move -- move packed by Moves.encodeMove. Castling moves are assumed to have been checked when generated
+	color -- color making the move as 0 (white) or 1 (black)
+
+	Returns: True if the move is legal
+	"""
+	king_sq = position.kings[color]
+	if king_sq is None or move >> 15 == CASTLE:
+		return True
+	start = move & 63
+	end = move >> 6 & 63
+	if move >> 15 == EN_PASSANT:
+		return leavesKingSafe(position, move, color)
+	if start == king_sq:
+		return not position.isAttacked(end, 1-color, position.occupancy ^ (1 << king_sq))
+	if not checkMask(position, color, king_sq) >> end & 1:
+		return False
+	pin = pinnedPieces(position, color, king_sq).get(start)
+	return pin is None or pin >> end & 1 == 1
+
+def generateMoves(position, color, castle=None, en_passant=None):
+	"""Generates all legal moves for color including castling, promotions and en passant.
+
+	Pinned pieces and the squares that answer a check are found once for the position, so candidate moves
+	are accepted or rejected without being made. Only en passant captures are tested by making them.
+
+	Params:
+	position -- Bitboards.Position to generate moves for
+	color -- color to move as 0 (white) or 1 (black)
+	castle -- castling rights as [king side, queen side] for color or None for no castling (default: None)
+	en_passant -- square index a pawn can capture en passant on or None (default: None)
+
+	Returns: list of moves packed by Moves.encodeMove
+	"""
+	king_sq = position.kings[color]
+	if king_sq is None:
+		return pseudoLegalMoves(position, color, castle, en_passant)
+
+	moves = []
+	pieces = position.pieces
+	base = 6*color
+	enemy_color = 1-color
+	not_own = FULL ^ position.occupied[color]
+	enemy = position.occupied[enemy_color]
+	occupancy = position.occupancy
+
+	# King moves are tested with the king lifted so it cannot hide behind itself from a slider
+	without_king = occupancy ^ (1 << king_sq)
+	for end in bitSquares(KING_ATTACKS[king_sq] & not_own):
+		if not position.isAttacked(end, enemy_color, without_king):
+			moves.append(king_sq | end << 6)
+
+	mask = checkMask(position, color, king_sq)
+	if not mask:
+		# double check, only the king can move
+		return moves
+	pins = pinnedPieces(position, color, king_sq)
+	targets = not_own & mask
+
+	# Pieces
+	for start in bitSquares(pieces[base+KNIGHT]):
+		if start in pins:
+			# a pinned knight can never move
+			continue
+		for end in bitSquares(KNIGHT_ATTACKS[start] & targets):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+BISHOP]):
+		attacks = bishopAttacks(start, occupancy) & targets
+		if start in pins:
+			attacks &= pins[start]
+		for end in bitSquares(attacks):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+ROOK]):
+		attacks = rookAttacks(start, occupancy) & targets
+		if start in pins:
+			attacks &= pins[start]
+		for end in bitSquares(attacks):
+			moves.append(start | end << 6)
+	for start in bitSquares(pieces[base+QUEEN]):
+		attacks = (rookAttacks(start, occupancy) | bishopAttacks(start, occupancy)) & targets
+		if start in pins:
+			attacks &= pins[start]
+		for end in bitSquares(attacks):
+			moves.append(start | end << 6)
+
+	# Pawns
+	pawn_moves = []
+	pawns = pieces[base+PAWN]
+	empty = FULL ^ occupancy
+	if color == 0:
+		single = pawns << 8 & empty
+		for end in bitSquares(single & mask):
+			_addPawnMoves(pawn_moves, end-8, end)
+		for end in bitSquares((single & RANK_3) << 8 & empty & mask):
+			pawn_moves.append(end-16 | end << 6)
+		for end in bitSquares((pawns & ~FILE_H) << 9 & enemy & mask):
+			_addPawnMoves(pawn_moves, end-9, end)
+		for end in bitSquares((pawns & ~FILE_A) << 7 & enemy & mask):
+			_addPawnMoves(pawn_moves, end-7, end)
+	else:
+		single = pawns >> 8 & empty
+		for end in bitSquares(single & mask):
+			_addPawnMoves(pawn_moves, end+8, end)
+		for end in bitSquares((single & RANK_6) >> 8 & empty & mask):
+			pawn_moves.append(end+16 | end << 6)
+		for end in bitSquares((pawns & ~FILE_H) >> 7 & enemy & mask):
+			_addPawnMoves(pawn_moves, end+7, end)
+		for end in bitSquares((pawns & ~FILE_A) >> 9 & enemy & mask):
+			_addPawnMoves(pawn_moves, end+9, end)
+	if pins:
+		pawn_moves = [move for move in pawn_moves if (move & 63) not in pins or pins[move & 63] >> (move >> 6 & 63) & 1]
+	moves += pawn_moves
+	if en_passant is not None:
+		for start in bitSquares(PAWN_ATTACKS[enemy_color][en_passant] & pawns):
+			move = start | en_passant << 6 | EN_PASSANT << 15
+			if leavesKingSafe(position, move, color):
+				moves.append(move)
+
+	# Castling
+	if castle and (castle[0] or castle[1]) and mask == FULL:
+		row = 0 if color == 0 else 56
+		rooks = pieces[base+ROOK]
+		if king_sq == row+4:
+			if castle[0] and rooks >> (row+7) & 1 and not occupancy & (0x60 << row) \
+				and not position.isAttacked(row+5, enemy_color) and not position.isAttacked(row+6, enemy_color):
+				moves.append(row+4 | (row+6) << 6 | CASTLE << 15)
+			if castle[1] and rooks >> row & 1 and not occupancy & (0x0e << row) \
+				and not position.isAttacked(row+3, enemy_color) and not position.isAttacked(row+2, enemy_color):
+				moves.append(row+4 | (row+2) << 6 | CASTLE << 15)
+
+	return moves
@@ -0,0 +1,208 @@
+import array
+import asyncio
+import sys
+
+from Chess import Chess
+from Encoding import encodePosition, decodePosition
+from FEN import checkPosition
+from Moves import moveToUCI
+
+# Line protocol, one command per line and one reply line per command, in order:
+#   new [FEN]          -> ok <id>
+#   move <id> <move>   -> ok <id> <uci move> <status>
+#   state <id>         -> ok <id> <status> <FEN>
+#   moves <id>         -> ok <id> <uci moves made since the game started>
+#   legal <id>         -> ok <id> <uci legal moves>
+#   close <id>         -> ok <id>
+#   games              -> ok <number of games>
+#   quit               -> closes the connection
+# Any failure replies 'error <message>'. Moves are accepted in any notation Chess.makeMove accepts.
+# Status is one of playing, check, checkmate or stalemate.
+MAX_LINE = 4096
+READ_SIZE = 65536
+
+class ServerGame:
+	"""State of one hosted game: the position packed by Encoding.encodePosition and the moves made, packed by
+	Moves.encodeMove. A game takes about 200 bytes however long it is, so a Chess is only built while a command runs."""
+	__slots__ = ('record', 'moves')
+
+	def __init__(self, record):
+		self.record = record
+		self.moves = array.array('I')
+
+def gameStatus(chess):
+	"""Describes whether the player to move is in check, mated or stalemated
+
+	Returns: one of 'playing', 'check', 'checkmate' or 'stalemate'
+	"""
+	position = chess.position
+	king_sq = position.kings[chess.turn]
+	check = king_sq is not None and position.isAttacked(king_sq, 1-chess.turn)
+	if not chess.legalMoves():
+		return 'checkmate' if check else 'stalemate'
+	return 'check' if check else 'playing'
+
+class GameServer:
+	def __init__(self, max_games=100000):
+		"""Hosts many games, each keyed by an id handed out by newGame
+
+		Params:
+		max_games -- refuse new games while this many are open (default: 100000)
+		"""
+		self.games = {}
+		self.next_id = 1
+		self.max_games = max_games
+		start = Chess()
+		start.setupBoard()
+		self.start_record = encodePosition(start)
+
+	def game(self, game_id):
+		"""Looks up a game, raising ValueError if there is no game with that id"""
+		try:
+			return self.games[int(game_id)]
+		except (KeyError, ValueError):
+			raise ValueError("no game '{}'".format(game_id))
+
+	def newGame(self, fen=None):
+		"""Opens a game from the starting position or from a FEN. Positions that cannot arise in a game,
+		as reported by FEN.checkPosition, raise ValueError
+
+		Returns: id of the new game
+		"""
+		if len(self.games) >= self.max_games:
+			raise ValueError('too many games open')
+		if fen:
+			chess = Chess.fromFEN(fen)
+			problems = checkPosition(chess)
+			if problems:
+				raise ValueError('; '.join(problems))
+			record = encodePosition(chess)
+		else:
+			record = self.start_record
+		game_id = self.next_id
+		self.next_id += 1
+		self.games[game_id] = ServerGame(record)
+		return game_id
+
+	def move(self, game_id, text):
+		"""Makes a move in a game
+
+		Returns: (move in UCI notation, status of the game after the move)
+		"""
+		game = self.game(game_id)
+		chess = decodePosition(game.record, glyphs=False)
+		move = chess.makeMove(text)
+		game.record = encodePosition(chess)
+		game.moves.append(move)
+		return moveToUCI(move), gameStatus(chess)
+
+	def state(self, game_id):
+		"""Returns: (status of the game, FEN of its position)"""
+		chess = decodePosition(self.game(game_id).record, glyphs=False)
+		return gameStatus(chess), chess.toFEN()
+
+	def handleLine(self, line):
+		"""Runs one protocol command
+
+		Params:
+		line -- command without its line ending
+
+		Returns: reply line without its line ending
+		"""
+		command, _, args = line.strip().partition(' ')
+		args = args.strip()
+		try:
+			if command == 'new':
+				return 'ok {}'.format(self.newGame(args or None))
+			if command == 'games':
+				return 'ok {}'.format(len(self.games))
+
+			game_id, _, args = args.partition(' ')
+			args = args.strip()
+			if command == 'move':
+				if not args:
+					raise ValueError('expected a move')
+				uci, status = self.move(game_id, args)
+				return 'ok {} {} {}'.format(game_id, uci, status)
+			elif command == 'state':
+				status, fen = self.state(game_id)
+				return 'ok {} {} {}'.format(game_id, status, fen)
+			elif command == 'moves':
+				return ' '.join(['ok', game_id] + [moveToUCI(move) for move in self.game(game_id).moves])
+			elif command == 'legal':
+				chess = decodePosition(self.game(game_id).record, glyphs=False)
+				return ' '.join(['ok', game_id] + [moveToUCI(move) for move in chess.legalMoves()])
+			elif command == 'close':
+				self.game(game_id)
+				del self.games[int(game_id)]
+				return 'ok {}'.format(game_id)
+			raise ValueError("unknown command '{}'".format(command))
+		except ValueError as err:
+			return 'error {}'.format(err)
+
+	async def handleClient(self, reader, writer):
+		"""Serves one connection. Every command that arrived in one read is run before the replies are written
+		together, so a client that pipelines commands costs one write and one drain per batch instead of per line."""
+		pending = b''
+		closing = False
+		try:
+			while not closing:
+				data = await reader.read(READ_SIZE)
+				if not data:
+					break
+				lines = (pending + data).split(b'\n')
+				pending = lines.pop()
+				replies = []
+				for line in lines:
+					line = line.decode('utf-8', errors='replace').strip()
+					if not line:
+						continue
+					if line == 'quit':
+						closing = True
+						break
+					replies.append(self.handleLine(line))
+				if len(pending) > MAX_LINE:
+					replies.append('error line too long')
+					closing = True
+				if replies:
+					writer.write(('\n'.join(replies) + '\n').encode())
+					await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+			try:
+				await writer.wait_closed()
+			except ConnectionError:
+				pass
+
+	async def serve(self, host='127.0.0.1', port=7777, path=None):
+		"""Serves clients until cancelled, on a Unix socket if path is given or else on TCP"""
+		if path is not None:
+			server = await asyncio.start_unix_server(self.handleClient, path=path)
+		else:
+			server = await asyncio.start_server(self.handleClient, host, port)
+		async with server:
+			await server.serve_forever()
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Host many chess games over a line based protocol')
+	parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+	parser.add_argument('--port', type=int, default=7777, help='TCP port to listen on (default: 7777)')
+	parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+	parser.add_argument('--max-games', type=int, default=100000, help='most games open at once (default: 100000)')
+	options = parser.parse_args(argv)
+
+	server = GameServer(options.max_games)
+	print('Listening on {}'.format(options.unix or '{}:{}'.format(options.host, options.port)), file=sys.stderr)
+	try:
+		asyncio.run(server.serve(options.host, options.port, options.unix))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
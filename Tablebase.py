@@ -0,0 +1,442 @@
+import os
+import time
+
+from consts import PIECE_TYPES, PAWN, KNIGHT, BISHOP, ROOK, KING, EMPTY_SQUARE
+from Bitboards import Position, KNIGHT_ATTACKS, KING_ATTACKS, rookAttacks, bishopAttacks, bitSquares
+from Pieces import generateMoves
+from Zobrist import enPassantKey
+
+# Table entries are one byte from the point of view of the side to move:
+#   0            draw
+#   1-127        win, mating in that many plies
+#   LOSS + n     loss, mated in n plies
+#   ILLEGAL      not a legal or not a canonical position
+DRAW = 0
+LOSS = 128
+UNKNOWN = 254
+ILLEGAL = 255
+MAX_PIECES = 4
+
+# results returned by probe
+WIN_RESULT, DRAW_RESULT, LOSS_RESULT = 1, 0, -1
+
+# piece letters from most to least valuable, the order pieces are listed in a material name like 'KQRvK'
+MATERIAL_ORDER = 'KQRBNP'
+MATERIAL_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+# material that cannot mate
+DRAWN_MATERIAL = {'KvK', 'KNvK', 'KBvK'}
+
+def _transform(function):
+	"""Builds a 64 entry table mapping each square through function of (row, col)"""
+	table = []
+	for sq in range(64):
+		row, col = function(sq >> 3, sq & 7)
+		table.append(row*8 + col)
+	return table
+
+# board symmetries. Positions with pawns may only be mirrored left to right
+_MIRRORS = [_transform(lambda r, c: (r, c)), _transform(lambda r, c: (r, 7-c))]
+_SYMMETRIES = _MIRRORS + [_transform(f) for f in [
+	lambda r, c: (7-r, c), lambda r, c: (7-r, 7-c), lambda r, c: (c, r),
+	lambda r, c: (c, 7-r), lambda r, c: (7-c, r), lambda r, c: (7-c, 7-r)]]
+
+def materialName(pieces):
+	"""Names the material of a list of piece codes as the strongest side first, as in 'KQvK'
+
+	Returns: (name, flipped) where flipped is True if black is named first
+	"""
+	sides = ['', '']
+	for letter in MATERIAL_ORDER:
+		for color, prefix in enumerate('WB'):
+			sides[color] += letter * pieces.count(prefix + letter)
+	strength = [(sum(MATERIAL_VALUES[letter] for letter in side), len(side), side) for side in sides]
+	flipped = strength[1] > strength[0]
+	return '{}v{}'.format(*(sides[::-1] if flipped else sides)), flipped
+
+class EndgameTable:
+	def __init__(self, material, values=None):
+		"""Initialize the table of a material set
+
+		Positions are indexed by the white king's square within the part of the board left after symmetry,
+		then the square of each other piece, then the side to move. Without pawns the board has 8 symmetries
+		and the white king is kept to the a1-d1-d4 triangle. With pawns it can only be mirrored left to right
+		and the white king is kept to files a-d.
+
+		Params:
+		material -- material name with white first such as 'KQvK' or 'KPvK'
+		values -- bytearray of table entries or None for an empty table to be generated (default: None)
+		"""
+		white, black = material.split('v')
+		self.material = material
+		# piece codes in index order: kings first, then the other white and black pieces
+		self.codes = ['WK', 'BK'] + ['W' + letter for letter in white[1:]] + ['B' + letter for letter in black[1:]]
+		self.has_pawns = 'P' in material
+		self.symmetries = _MIRRORS if self.has_pawns else _SYMMETRIES
+
+		if self.has_pawns:
+			region = [sq for sq in range(64) if sq & 7 <= 3]
+		else:
+			region = [sq for sq in range(64) if sq >> 3 <= sq & 7 <= 3]
+		self.king_slots = [None]*64
+		for slot, sq in enumerate(region):
+			self.king_slots[sq] = slot
+		self.king_squares = region
+		# for each white king square the symmetries that take it into the region
+		self.region_symmetries = [[symmetry for symmetry in self.symmetries if self.king_slots[symmetry[sq]] is not None]
+			for sq in range(64)]
+		# slots of identical pieces, which are indexed in square order
+		self.groups = [[j for j in range(2, len(self.codes)) if self.codes[j] == code]
+			for code in sorted(set(self.codes[2:]))]
+		self.groups = [group for group in self.groups if len(group) > 1]
+
+		self.size = len(region) * 64**(len(self.codes)-1) * 2
+		self.values = values if values is not None else bytearray([ILLEGAL]) * self.size
+		if len(self.values) != self.size:
+			raise ValueError("Table for {} should have {} entries but has {}".format(material, self.size, len(self.values)))
+
+	def index(self, squares, turn):
+		"""Index of a position given the square of each piece in self.codes order and the side to move"""
+		best = None
+		for symmetry in self.region_symmetries[squares[0]]:
+			if self.groups:
+				mapped = [symmetry[sq] for sq in squares]
+				for group in self.groups:
+					for j, sq in zip(group, sorted(mapped[j] for j in group)):
+						mapped[j] = sq
+				index = self.king_slots[mapped[0]]
+				for sq in mapped[1:]:
+					index = index*64 + sq
+			else:
+				index = self.king_slots[symmetry[squares[0]]]
+				for sq in squares[1:]:
+					index = index*64 + symmetry[sq]
+			index = index*2 + turn
+			if best is None or index < best:
+				best = index
+		return best
+
+	def squares(self, index):
+		"""Returns (squares, turn) of an index. See index"""
+		turn = index & 1
+		index >>= 1
+		squares = []
+		for j in range(len(self.codes)-1):
+			squares.append(index & 63)
+			index >>= 6
+		squares.append(self.king_squares[index])
+		return squares[::-1], turn
+
+	def position(self, squares):
+		"""Builds a Bitboards.Position from the squares of the pieces"""
+		position = Position()
+		for code, sq in zip(self.codes, squares):
+			position.setPiece(sq, code)
+		return position
+
+	def isValid(self, index):
+		"""Checks that an index is the canonical index of a position with no two pieces on a square and no pawns on the back ranks"""
+		squares, turn = self.squares(index)
+		if len(set(squares)) != len(squares):
+			return False
+		for code, sq in zip(self.codes, squares):
+			if code[1] == 'P' and (sq >> 3 == 0 or sq >> 3 == 7):
+				return False
+		return self.index(squares, turn) == index
+
+	def predecessors(self, index):
+		"""Canonical indices of the positions that lead to this one by a move that is not a capture or promotion"""
+		squares, turn = self.squares(index)
+		color = 1-turn
+		occupancy = 0
+		for sq in squares:
+			occupancy |= 1 << sq
+		empty = ~occupancy
+
+		predecessors = set()
+		for j, code in enumerate(self.codes):
+			if code[0] != 'WB'[color]:
+				continue
+			sq = squares[j]
+			piece_type = PIECE_TYPES.index(code[1])
+			if piece_type == PAWN:
+				row = sq >> 3
+				step = -8 if color == 0 else 8
+				origins = 0
+				if (row >= 2 if color == 0 else row <= 5) and empty >> (sq+step) & 1:
+					origins |= 1 << (sq+step)
+					if row == (3 if color == 0 else 4) and empty >> (sq+2*step) & 1:
+						origins |= 1 << (sq+2*step)
+			elif piece_type == KNIGHT:
+				origins = KNIGHT_ATTACKS[sq] & empty
+			elif piece_type == KING:
+				origins = KING_ATTACKS[sq] & empty
+			else:
+				origins = 0
+				if piece_type != ROOK:
+					origins |= bishopAttacks(sq, occupancy)
+				if piece_type != BISHOP:
+					origins |= rookAttacks(sq, occupancy)
+				origins &= empty
+
+			for origin in bitSquares(origins):
+				squares[j] = origin
+				predecessors.add(self.index(squares, color))
+			squares[j] = sq
+		return predecessors
+
+
+class Tablebase:
+	def __init__(self, directory=None):
+		"""Initialize a set of endgame tables
+
+		Tables are loaded from directory when there, and otherwise generated when first needed and saved to directory.
+
+		Params:
+		directory -- folder of '<material>.tb' files or None to keep generated tables in memory only (default: None)
+		"""
+		self.directory = directory
+		self.tables = {}
+
+	def path(self, material):
+		return os.path.join(self.directory, material + '.tb')
+
+	def table(self, material, generate=True):
+		"""Returns the EndgameTable of a material name such as 'KRvK', loading or generating it if needed
+
+		Params:
+		material -- material name with the stronger side first. See materialName
+		generate -- generate the table if it is not loaded or saved (default: True)
+
+		Returns: EndgameTable or None if it is not available and generate is False
+		"""
+		if material in self.tables:
+			return self.tables[material]
+		if self.directory is not None and os.path.exists(self.path(material)):
+			with open(self.path(material), 'rb') as f:
+				self.tables[material] = EndgameTable(material, bytearray(f.read()))
+			return self.tables[material]
+		if not generate:
+			return None
+
+		table = self.generate(material)
+		if self.directory is not None:
+			os.makedirs(self.directory, exist_ok=True)
+			with open(self.path(material), 'wb') as f:
+				f.write(table.values)
+		return table
+
+	def value(self, pieces, turn, generate=True):
+		"""Table entry of a position from the point of view of the side to move
+
+		Params:
+		pieces -- list of (piece code, square)
+		turn -- side to move as 0 (white) or 1 (black)
+		generate -- generate missing tables (default: True)
+
+		Returns: table entry or None if the table is not available
+		"""
+		name, flipped = materialName([code for code, sq in pieces])
+		if name in DRAWN_MATERIAL:
+			return DRAW
+		if flipped:
+			# swap the colors and mirror the board top to bottom so the stronger side is white
+			pieces = [('WB'[code[0] == 'W'] + code[1], sq ^ 56) for code, sq in pieces]
+			turn = 1-turn
+		table = self.table(name, generate)
+		if table is None:
+			return None
+		squares = []
+		remaining = list(pieces)
+		for code in table.codes:
+			for i, (piece, sq) in enumerate(remaining):
+				if piece == code:
+					squares.append(sq)
+					del remaining[i]
+					break
+		return table.values[table.index(squares, turn)]
+
+	def generate(self, material):
+		"""Generates the table of a material set by retrograde analysis
+
+		Every position is given a count of the distinct positions its moves lead to within the table.
+		Positions are then settled in order of distance to mate, starting from the mates: a position is won
+		once one of its moves leads to a lost position, and lost once all of its moves lead to won positions.
+		Captures and promotions leave the table and are looked up in smaller tables, generated first if needed.
+
+		Params:
+		material -- material name with the stronger side first such as 'KQvK'
+
+		Returns: EndgameTable
+		"""
+		table = EndgameTable(material)
+		self.tables[material] = table
+		values = table.values
+		size = table.size
+		counts = bytearray(size)
+		longest_loss = bytearray(size)
+		can_draw = bytearray(size)
+		can_win = bytearray(size)
+		# buckets[n] lists (index, won) to settle at n plies
+		buckets = [[] for n in range(LOSS)]
+
+		for index in range(size):
+			if not table.isValid(index):
+				continue
+			squares, turn = table.squares(index)
+			position = table.position(squares)
+			if position.isAttacked(position.kings[1-turn], turn):
+				continue
+			values[index] = UNKNOWN
+
+			moves = generateMoves(position, turn)
+			if not moves:
+				if position.isAttacked(position.kings[turn], 1-turn):
+					buckets[0].append((index, False))
+				else:
+					values[index] = DRAW
+				continue
+
+			children = set()
+			for move in moves:
+				start = move & 63
+				end = move >> 6 & 63
+				promotion = move >> 12 & 7
+				if position.squares[end] == EMPTY_SQUARE and not promotion:
+					moved = squares.index(start)
+					squares[moved] = end
+					children.add(table.index(squares, 1-turn))
+					squares[moved] = start
+					continue
+
+				# captures and promotions are looked up in the table of the new material
+				pieces = []
+				for code, sq in zip(table.codes, squares):
+					if sq == start:
+						pieces.append((code[0] + PIECE_TYPES[promotion] if promotion else code, end))
+					elif sq != end:
+						pieces.append((code, sq))
+				value = self.value(pieces, 1-turn)
+				if value == DRAW:
+					can_draw[index] = 1
+				elif value < LOSS:
+					longest_loss[index] = max(longest_loss[index], value+1)
+				else:
+					can_win[index] = 1
+					buckets[value-LOSS+1].append((index, True))
+
+			counts[index] = len(children)
+			if not children and not can_win[index] and not can_draw[index]:
+				buckets[longest_loss[index]].append((index, False))
+
+		for plies in range(LOSS):
+			for index, won in buckets[plies]:
+				if values[index] != UNKNOWN:
+					continue
+				if won:
+					values[index] = plies
+				else:
+					if plies >= UNKNOWN-LOSS:
+						raise ValueError('Distance to mate of {} does not fit in the table'.format(material))
+					values[index] = LOSS + plies
+
+				for predecessor in table.predecessors(index):
+					if values[predecessor] != UNKNOWN:
+						continue
+					if not won:
+						can_win[predecessor] = 1
+						buckets[plies+1].append((predecessor, True))
+					else:
+						counts[predecessor] -= 1
+						if not counts[predecessor] and not can_win[predecessor] and not can_draw[predecessor]:
+							buckets[max(plies+1, longest_loss[predecessor])].append((predecessor, False))
+
+		for index in range(size):
+			if values[index] == UNKNOWN:
+				values[index] = DRAW
+		return table
+
+	def probe(self, chess, generate=True):
+		"""Looks up a game's position
+
+		Params:
+		chess -- Chess game with at most MAX_PIECES pieces and no castling rights
+		generate -- generate the table if it is not loaded yet (default: True)
+
+		Returns: (result, plies) where result is WIN_RESULT, DRAW_RESULT or LOSS_RESULT for the side to move
+			and plies is the distance to mate, or None if the position is not covered
+		"""
+		position = chess.position
+		if position.occupancy.bit_count() > MAX_PIECES or any(chess.castle[0] + chess.castle[1]):
+			return None
+		if enPassantKey(position, chess.turn, chess.en_passant):
+			return None
+		if position.pieces[KING].bit_count() != 1 or position.pieces[6+KING].bit_count() != 1:
+			return None
+		pieces = [(position.squares[sq], sq) for sq in bitSquares(position.occupancy)]
+
+		value = self.value(pieces, chess.turn, generate)
+		if value is None or value == ILLEGAL:
+			return None
+		if value == DRAW:
+			return (DRAW_RESULT, 0)
+		if value < LOSS:
+			return (WIN_RESULT, value)
+		return (LOSS_RESULT, value-LOSS)
+
+	def bestMove(self, chess, generate=True):
+		"""Picks the move that wins fastest, draws, or loses slowest
+
+		Returns: move packed by Moves.encodeMove or None if the position is not covered or has no moves
+		"""
+		if self.probe(chess, generate) is None:
+			return None
+		best = None
+		best_score = None
+		for move in chess.legalMoves():
+			undo = chess.doMove(move)
+			result = self.probe(chess, generate)
+			chess.undoMove(undo)
+			if result is None:
+				continue
+			# the opponent's loss is our win, sooner is better, and our loss is better later
+			result, plies = result
+			score = -result * (1000 - plies) if result else 0
+			if best_score is None or score > best_score:
+				best, best_score = move, score
+		return best
+
+
+if __name__ == "__main__":
+	import argparse
+	from Chess import Chess
+	from Moves import moveToUCI
+
+	parser = argparse.ArgumentParser(description='Generate endgame tables and probe positions')
+	parser.add_argument('materials', nargs='*', help="material sets to generate, such as 'KQvK KRvK KPvK'")
+	parser.add_argument('--dir', default='tablebases', help='folder to save and load tables (default: tablebases)')
+	parser.add_argument('--probe', help='FEN of a position to look up')
+	options = parser.parse_args()
+
+	tablebase = Tablebase(options.dir)
+	for material in options.materials:
+		start = time.perf_counter()
+		table = tablebase.table(material)
+		values = table.values
+		wins = sum(1 for value in values if 0 < value < LOSS)
+		losses = sum(1 for value in values if LOSS <= value < ILLEGAL)
+		draws = values.count(DRAW)
+		longest = max((value for value in values if 0 < value < LOSS), default=0)
+		print('{}: {} entries, {} wins, {} draws, {} losses, longest mate {} plies in {:.1f}s'.format(
+			material, len(values), wins, draws, losses, longest, time.perf_counter() - start))
+
+	if options.probe:
+		chess = Chess.fromFEN(options.probe)
+		result = tablebase.probe(chess)
+		if result is None:
+			print('position is not covered')
+		else:
+			print({WIN_RESULT: 'win', DRAW_RESULT: 'draw', LOSS_RESULT: 'loss'}[result[0]],
+				'in {} plies'.format(result[1]) if result[0] else '')
+			move = tablebase.bestMove(chess)
+			if move is not None:
+				print('best move {}'.format(moveToUCI(move)))
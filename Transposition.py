@@ -0,0 +1,122 @@
+from array import array
+
+# Bounds of stored values. 0 marks an empty slot
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# Entries are a 64-bit key plus 64 bits of data packed as:
+#   bits  0-16 move packed by Moves.encodeMove (0 for none)
+#   bits 17-23 depth (0-127)
+#   bits 24-25 bound
+#   bits 26-29 search generation
+#   bits 30-63 value offset by VALUE_OFFSET so negative values fit
+ENTRY_BYTES = 16
+VALUE_OFFSET = 1 << 33
+MAX_DEPTH = 127
+
+class TranspositionTable:
+	def __init__(self, size_mb=16):
+		"""Initialize a fixed size transposition table
+
+		The table is a power of two number of buckets, each with a depth-preferred slot and an always-replace slot.
+		Keys and data live in two flat arrays of unsigned 64-bit ints so each entry costs 16 bytes.
+
+		Params:
+		size_mb -- memory to use for entries in megabytes (default: 16)
+		"""
+		buckets = 1
+		while buckets * 2 * ENTRY_BYTES * 2 <= size_mb * (1 << 20):
+			buckets *= 2
+		self.buckets = buckets
+		self.mask = buckets - 1
+		self.keys = array('Q', bytes(16*buckets))
+		self.data = array('Q', bytes(16*buckets))
+		self.generation = 0
+
+		self.hits = 0
+		self.misses = 0
+		self.collisions = 0
+
+	def __len__(self):
+		"""Number of entry slots in the table"""
+		return 2*self.buckets
+
+	def clear(self):
+		"""Empties the table and resets the counters"""
+		self.keys = array('Q', bytes(16*self.buckets))
+		self.data = array('Q', bytes(16*self.buckets))
+		self.generation = 0
+		self.hits = self.misses = self.collisions = 0
+
+	def newSearch(self):
+		"""Starts a new search generation so entries from earlier searches are replaced first"""
+		self.generation = (self.generation + 1) & 15
+
+	def store(self, key, depth, value, bound=EXACT, move=0):
+		"""Stores a search result for a position
+
+		Params:
+		key -- 64-bit position key such as Chess.hash
+		depth -- remaining depth the value was searched to (clamped to 0-127)
+		value -- signed int value. Values with |value| >= 2**33, such as large perft counts, do not fit and are not stored
+		bound -- EXACT, LOWER or UPPER (default: EXACT)
+		move -- best move packed by Moves.encodeMove or 0 (default: 0)
+		"""
+		if not -VALUE_OFFSET < value < VALUE_OFFSET:
+			return
+		if depth > MAX_DEPTH:
+			depth = MAX_DEPTH
+		elif depth < 0:
+			depth = 0
+		data = move | depth << 17 | bound << 24 | self.generation << 26 | (value + VALUE_OFFSET) << 30
+
+		slot = (key & self.mask) << 1
+		keys = self.keys
+		old = self.data[slot]
+		# depth-preferred slot takes the entry if it is empty, the same position, stale or not searched as deep
+		if not old or keys[slot] == key or old >> 26 & 15 != self.generation or depth >= old >> 17 & 127:
+			if old and keys[slot] != key:
+				self.collisions += 1
+		else:
+			slot += 1
+			if self.data[slot] and keys[slot] != key:
+				self.collisions += 1
+		keys[slot] = key
+		self.data[slot] = data
+
+	def probe(self, key):
+		"""Looks up a position
+
+		Params:
+		key -- 64-bit position key such as Chess.hash
+
+		Returns: (move, depth, value, bound) or None if the position is not stored
+		"""
+		slot = (key & self.mask) << 1
+		keys = self.keys
+		if keys[slot] == key and self.data[slot]:
+			data = self.data[slot]
+		elif keys[slot+1] == key and self.data[slot+1]:
+			data = self.data[slot+1]
+		else:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return (data & 0x1ffff, data >> 17 & 127, (data >> 30) - VALUE_OFFSET, data >> 24 & 3)
+
+	def hashfull(self):
+		"""Permille of the first 1000 slots used by the current generation"""
+		slots = min(1000, len(self))
+		used = sum(1 for data in self.data[:slots] if data and data >> 26 & 15 == self.generation)
+		return used * 1000 // slots
+
+	def stats(self):
+		"""Returns a dict of table size and hit/miss/collision counters"""
+		probes = self.hits + self.misses
+		return {
+			'entries': len(self),
+			'megabytes': len(self) * ENTRY_BYTES / (1 << 20),
+			'hits': self.hits,
+			'misses': self.misses,
+			'collisions': self.collisions,
+			'hit_rate': self.hits / probes if probes else 0.0,
+		}
@@ -0,0 +1,59 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+from Chess import Chess
+from Encoding import encodePosition, decodePosition
+from perft import PERFT_POSITIONS
+
+def measure(make, count):
+	"""Creates count objects with make, timing the calls and measuring the memory the objects hold
+
+	Returns: (objects per second, bytes per object)
+	"""
+	make()
+	start = time.perf_counter()
+	for i in range(count):
+		make()
+	seconds = time.perf_counter() - start
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	objects = [make() for i in range(count)]
+	held = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	# the list holding the objects is not part of their cost
+	held -= sys.getsizeof(objects)
+	del objects
+	return count / seconds if seconds > 0 else 0.0, held / count
+
+def runBenchmark(count=20000):
+	"""Measures creating, copying and decoding games of the perft positions
+
+	Returns: dict of case name to {'per_sec', 'bytes'}
+	"""
+	results = {}
+	results['Chess()'] = measure(Chess, count)
+	for name, fen, depth, nodes in PERFT_POSITIONS[:2]:
+		chess = Chess.fromFEN(fen)
+		record = encodePosition(chess)
+		results['fromFEN {}'.format(name)] = measure(lambda: Chess.fromFEN(fen), count)
+		results['copy {}'.format(name)] = measure(chess.copy, count)
+		results['decode {}'.format(name)] = measure(lambda: decodePosition(record), count)
+		results['position copy {}'.format(name)] = measure(chess.position.copy, count)
+	return {name: {'per_sec': per_sec, 'bytes': size} for name, (per_sec, size) in results.items()}
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Measure how fast games are created and copied and how much memory each holds')
+	parser.add_argument('--count', type=int, default=20000, help='objects made per case (default: 20000)')
+	options = parser.parse_args(argv)
+
+	print('{:28} {:>12} {:>10}'.format('case', 'per sec', 'bytes'))
+	for name, result in runBenchmark(options.count).items():
+		print('{:28} {:12.0f} {:10.0f}'.format(name, result['per_sec'], result['bytes']))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -8,4 +8,12 @@ chess_glyphs = {
 # conversion between chess notation and col index
 col_conv = {'a':0, 'b':1, 'c':2, 'd':3, 'e':4, 'f':5, 'g':6, 'h':7}
 
-EMPTY_SQUARE = '  '
\ No newline at end of file
+EMPTY_SQUARE = '  '
+
+# piece types in the order used to index bitboards
+PIECE_TYPES = ['P', 'N', 'B', 'R', 'Q', 'K']
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# 2 char piece codes in bitboard order. Index is 6*color + piece type
+PIECE_CODES = ['WP', 'WN', 'WB', 'WR', 'WQ', 'WK', 'BP', 'BN', 'BB', 'BR', 'BQ', 'BK']
+piece_index = {code: i for i, code in enumerate(PIECE_CODES)}
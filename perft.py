@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import Chess
+from Moves import moveToUCI
+from Transposition import TranspositionTable
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Standard perft positions as (name, fen, depth, expected nodes)
+PERFT_POSITIONS = [
+	('start', START_FEN, 4, 197281),
+	('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', 3, 97862),
+	('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', 4, 43238),
+	('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', 3, 9467),
+	('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', 3, 62379),
+	('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', 3, 89890),
+]
+
+def runPerft(chess, depth, table=None):
+	"""Runs perft and times it
+
+	Returns: (nodes, seconds)
+	"""
+	start = time.perf_counter()
+	nodes = chess.perft(depth, table)
+	return nodes, time.perf_counter() - start
+
+# transposition table of a worker process, created once per process by _initWorker
+_worker_table = None
+
+def _initWorker(hash_mb):
+	global _worker_table
+	_worker_table = TranspositionTable(hash_mb) if hash_mb else None
+
+def _perftTask(task):
+	"""Rebuilds a position from its root FEN and the packed moves leading to it, then runs perft below it"""
+	fen, path, depth = task
+	chess = Chess.fromFEN(fen)
+	for move in path:
+		chess.doMove(move)
+	return chess.perft(depth, _worker_table)
+
+def _splitPaths(chess, plies):
+	"""Lists the move paths of exactly plies moves from the current position"""
+	if plies == 0:
+		return [()]
+	paths = []
+	for move in chess.legalMoves():
+		undo = chess.doMove(move)
+		paths.extend((move,) + path for path in _splitPaths(chess, plies-1))
+		chess.undoMove(undo)
+	return paths
+
+def parallelDivide(fen, depth, processes=None, split_depth=1, hash_mb=0):
+	"""Runs divide with the subtrees spread over a pool of processes
+
+	The tree is split at split_depth plies below the root and each worker rebuilds its subtree's position
+	from the FEN and the packed moves leading to it, so no Chess objects are sent between processes.
+
+	Params:
+	fen -- FEN of the root position
+	depth -- number of plies to search including the root move
+	processes -- number of worker processes or None for one per core (default: None)
+	split_depth -- plies below the root to split the tree at. Deeper splits balance the load better (default: 1)
+	hash_mb -- transposition table size in MB for each worker or 0 for none (default: 0)
+
+	Returns: dict mapping each root move in coordinate notation (Ex: 'e2e4') to its perft(depth-1) count
+	"""
+	chess = Chess.fromFEN(fen)
+	split_depth = max(1, min(split_depth, depth-1))
+	if depth <= 1:
+		return {moveToUCI(move): 1 for move in chess.legalMoves()} if depth == 1 else {}
+
+	paths = _splitPaths(chess, split_depth)
+	tasks = [(fen, path, depth - split_depth) for path in paths]
+	counts = {moveToUCI(move): 0 for move in chess.legalMoves()}
+	with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(hash_mb,)) as executor:
+		chunksize = max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
+		for path, nodes in zip(paths, executor.map(_perftTask, tasks, chunksize=chunksize)):
+			counts[moveToUCI(path[0])] += nodes
+	return counts
+
+def parallelPerft(fen, depth, processes=None, split_depth=1, hash_mb=0):
+	"""Runs perft with the subtrees spread over a pool of processes. See parallelDivide
+
+	Returns: number of positions reachable in exactly depth plies
+	"""
+	if depth <= 0:
+		return 1
+	return sum(parallelDivide(fen, depth, processes, split_depth, hash_mb).values())
+
+def runBenchmark(positions=PERFT_POSITIONS, out=sys.stdout):
+	"""Runs perft over each position, printing a line per position to out
+
+	Returns: dict mapping position name to {'depth', 'nodes', 'expected', 'seconds', 'nps'}
+	"""
+	results = {}
+	for name, fen, depth, expected in positions:
+		nodes, seconds = runPerft(Chess.fromFEN(fen), depth)
+		nps = nodes / seconds if seconds > 0 else 0.0
+		results[name] = {'depth': depth, 'nodes': nodes, 'expected': expected, 'seconds': seconds, 'nps': nps}
+		if out:
+			print('{:12} depth {} {:>10} nodes {:8.2f}s {:>10.0f} nodes/sec{}'.format(
+				name, depth, nodes, seconds, nps, '' if nodes == expected else ' WRONG (expected {})'.format(expected)), file=out)
+	return results
+
+def compareToBaseline(results, baseline, tolerance=0.2):
+	"""Compares benchmark results to a baseline
+
+	Params:
+	results -- dict returned by runBenchmark
+	baseline -- dict of a previous runBenchmark, as saved by --save-baseline
+	tolerance -- fraction of baseline nodes/sec that may be lost before flagging a regression (default: 0.2)
+
+	Returns: list of strings describing wrong node counts and throughput regressions
+	"""
+	problems = []
+	for name, result in results.items():
+		if result['nodes'] != result['expected']:
+			problems.append('{}: {} nodes but expected {}'.format(name, result['nodes'], result['expected']))
+		base = baseline.get(name)
+		if base is None or base['depth'] != result['depth']:
+			continue
+		if result['nps'] < base['nps'] * (1-tolerance):
+			problems.append('{}: {:.0f} nodes/sec is {:.0%} below baseline {:.0f}'.format(
+				name, result['nps'], 1 - result['nps']/base['nps'], base['nps']))
+	return problems
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Count perft nodes and benchmark move generation')
+	parser.add_argument('args', nargs='*', help='[fen] depth')
+	parser.add_argument('--divide', action='store_true', help='print the node count below each root move')
+	parser.add_argument('--bench', action='store_true', help='run the standard perft position benchmark')
+	parser.add_argument('--baseline', help='JSON baseline to compare the benchmark against')
+	parser.add_argument('--save-baseline', help='write the benchmark results to this JSON file')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='allowed fractional nodes/sec loss (default: 0.2)')
+	parser.add_argument('--hash', type=int, default=0, help='transposition table size in MB to cache subtree counts (default: off)')
+	parser.add_argument('--processes', type=int, default=None,
+		help='spread the tree over this many worker processes, 0 for one per core (default: run in this process)')
+	parser.add_argument('--split', type=int, default=1, help='plies below the root to split the tree at for --processes (default: 1)')
+	options = parser.parse_args(argv)
+
+	if options.bench:
+		results = runBenchmark()
+		baseline = {}
+		if options.baseline:
+			with open(options.baseline) as f:
+				baseline = json.load(f)
+		problems = compareToBaseline(results, baseline, options.tolerance)
+		if options.save_baseline:
+			with open(options.save_baseline, 'w') as f:
+				json.dump(results, f, indent=2, sort_keys=True)
+		for problem in problems:
+			print('REGRESSION ' + problem)
+		return 1 if problems else 0
+
+	if len(options.args) == 1:
+		fen, depth = START_FEN, options.args[0]
+	elif len(options.args) == 2:
+		fen, depth = options.args
+	else:
+		parser.error('expected [fen] depth')
+	chess = Chess.fromFEN(fen)
+	depth = int(depth)
+	table = TranspositionTable(options.hash) if options.hash and options.processes is None else None
+
+	start = time.perf_counter()
+	if options.processes is not None:
+		counts = parallelDivide(fen, depth, options.processes or None, options.split, options.hash)
+		if options.divide:
+			for move in sorted(counts):
+				print('{}: {}'.format(move, counts[move]))
+		nodes = sum(counts.values())
+	elif options.divide:
+		counts = chess.divide(depth, table)
+		for move in sorted(counts):
+			print('{}: {}'.format(move, counts[move]))
+		nodes = sum(counts.values())
+	else:
+		nodes = chess.perft(depth, table)
+	seconds = time.perf_counter() - start
+
+	print('\nNodes: {}'.format(nodes))
+	print('Time: {:.3f}s'.format(seconds))
+	print('Nodes/sec: {:.0f}'.format(nodes / seconds if seconds > 0 else 0))
+	if table is not None:
+		print('Hash: {hits} hits {misses} misses {collisions} collisions'.format(**table.stats()))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -1,9 +1,24 @@
+import argparse
+
 from Chess import Chess
+from Engine import Engine
+from Book import OpeningBook
+from Instrument import profiling, addProfileArgument
 
 class ChessGame:
-	def __init__(self):
-		"""Initializes chess class and board"""
+	def __init__(self, engine_color=None, movetime=1.0, book=None):
+		"""Initializes chess class and board
+
+		Params:
+		engine_color -- color played by the engine as 0 (white), 1 (black) or None for two players (default: None)
+		movetime -- seconds the engine searches per move (default: 1.0)
+		book -- Book.OpeningBook the engine plays from while the position is in it (default: None)
+		"""
 		self.chess = Chess()
+		self.engine_color = engine_color
+		self.movetime = movetime
+		self.book = book
+		self.engine = Engine(self.chess) if engine_color is not None else None
 
 	def startGame(self):
 		"""Starts the interactive chess game and runs the game loop"""
@@ -22,6 +37,21 @@ class ChessGame:
 		"""Runs the game loop, asking for input and exiting on 'q' input"""
 		while True:
 			self.chess.printBoard()
+			if self.chess.turn == self.engine_color:
+				book_move = self.book.choose(self.chess) if self.book is not None else None
+				if book_move is not None:
+					move = self.chess.longAlgebraic(book_move)
+					print('Engine plays {} from the book'.format(move))
+					self.chess.makeMove(move)
+					continue
+				result = self.engine.search(movetime=self.movetime)
+				if result.move is None:
+					print('No legal moves left. Game over')
+					return
+				move = self.chess.longAlgebraic(result.move)
+				print('Engine plays {}'.format(move))
+				self.chess.makeMove(move)
+				continue
 			try:
 				input_query = ''
 				if self.chess.turn == 0:
@@ -46,5 +76,14 @@ class ChessGame:
 
 
 if __name__ == "__main__":
-	game = ChessGame()
-	game.startGame()
\ No newline at end of file
+	parser = argparse.ArgumentParser(description='Play chess on the command line')
+	parser.add_argument('--engine', choices=['white', 'black'], help='color for the engine to play')
+	parser.add_argument('--movetime', type=float, default=1.0, help='seconds the engine searches per move (default: 1.0)')
+	parser.add_argument('--book', help='Polyglot opening book for the engine to play from')
+	addProfileArgument(parser)
+	options = parser.parse_args()
+
+	book = OpeningBook(options.book) if options.book else None
+	game = ChessGame({'white': 0, 'black': 1}.get(options.engine), options.movetime, book)
+	with profiling(options.profile):
+		game.startGame()
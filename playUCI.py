@@ -0,0 +1,255 @@
+import sys
+import threading
+import time
+
+from Chess import Chess
+from Engine import Engine, MATE, MATE_BOUND, MAX_PLY
+from Moves import moveToUCI
+from Transposition import TranspositionTable
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+# seconds kept back from each move for reading input and writing the reply
+MOVE_OVERHEAD = 0.05
+# moves the remaining time is shared over when the GUI does not say
+DEFAULT_MOVES_TO_GO = 30
+
+def parseUCIMove(chess, text):
+	"""Finds the legal move of chess written in UCI notation. Ex: 'e2e4', 'e1g1', 'e7e8q'
+
+	Returns: move packed by Moves.encodeMove. Raises ValueError if no legal move matches
+	"""
+	for move in chess.legalMoves():
+		if moveToUCI(move) == text:
+			return move
+	raise ValueError("'{}' is not a legal move".format(text))
+
+def allocateTime(time_left, increment=0.0, moves_to_go=None):
+	"""Splits the time left on the clock into a budget for the next move
+
+	Params:
+	time_left -- seconds left on the clock
+	increment -- seconds added after each move (default: 0.0)
+	moves_to_go -- moves until the next time control or None if the rest of the game must be played (default: None)
+
+	Returns: seconds to search
+	"""
+	budget = time_left / (moves_to_go or DEFAULT_MOVES_TO_GO) + increment * 3/4
+	return max(0.01, min(budget, time_left - MOVE_OVERHEAD))
+
+def formatScore(value):
+	"""Writes a search value as a UCI score, 'cp <centipawns>' or 'mate <moves>' with negative moves when being mated"""
+	if value > MATE_BOUND:
+		return 'mate {}'.format((MATE - value + 1) // 2)
+	if value < -MATE_BOUND:
+		return 'mate {}'.format(-((MATE + value) // 2))
+	return 'cp {}'.format(value)
+
+class UCIEngine:
+	def __init__(self, output=None):
+		"""Speaks the Universal Chess Interface. Searches run in a background thread so commands like
+		isready and stop are answered while the engine thinks.
+
+		Params:
+		output -- function called with each line to send (default: print to stdout and flush)
+		"""
+		self.output = output if output is not None else lambda line: print(line, flush=True)
+		self.output_lock = threading.Lock()
+		self.hash_mb = DEFAULT_HASH_MB
+		self.table = None
+		self.chess = Chess.fromFEN(START_FEN, glyphs=False)
+		self.engine = None
+		self.thread = None
+		self.timer = None
+		self.ponder_time = None
+		# set when the bestmove of the running search may be sent. Infinite and ponder searches hold it until stop or ponderhit
+		self.release = threading.Event()
+		# set when the running search has ended, whether or not its bestmove was sent
+		self.finished = threading.Event()
+
+	def send(self, line):
+		with self.output_lock:
+			self.output(line)
+
+	def handleCommand(self, line):
+		"""Runs one command from the GUI
+
+		Returns: False after quit, True otherwise
+		"""
+		tokens = line.split()
+		if not tokens:
+			return True
+		command, args = tokens[0], tokens[1:]
+		if command == 'uci':
+			self.send('id name pyChess')
+			self.send('id author pyChess contributors')
+			self.send('option name Hash type spin default {} min 1 max {}'.format(DEFAULT_HASH_MB, MAX_HASH_MB))
+			self.send('uciok')
+		elif command == 'isready':
+			self.send('readyok')
+		elif command == 'setoption':
+			self.setOption(args)
+		elif command == 'ucinewgame':
+			self.stopSearch()
+			self.table = None
+		elif command == 'position':
+			self.stopSearch()
+			try:
+				self.setPosition(args)
+			except ValueError as err:
+				self.send('info string {}'.format(err))
+		elif command == 'go':
+			self.go(args)
+		elif command == 'stop':
+			self.stopSearch()
+		elif command == 'ponderhit':
+			self.ponderhit()
+		elif command == 'quit':
+			self.stopSearch()
+			return False
+		else:
+			self.send("info string unknown command '{}'".format(command))
+		return True
+
+	def setOption(self, args):
+		"""Handles 'setoption name <name> value <value>'"""
+		text = ' '.join(args)
+		name, _, value = text.partition(' value ')
+		name = name.replace('name', '', 1).strip()
+		if name.lower() == 'hash':
+			try:
+				self.hash_mb = max(1, min(int(value), MAX_HASH_MB))
+			except ValueError:
+				self.send("info string invalid Hash value '{}'".format(value))
+				return
+			self.stopSearch()
+			self.table = None
+		else:
+			self.send("info string unknown option '{}'".format(name))
+
+	def setPosition(self, args):
+		"""Handles 'position startpos|fen <FEN> [moves <uci moves>]'. The position is unchanged if any part is invalid"""
+		if 'moves' in args:
+			split = args.index('moves')
+			setup, moves = args[:split], args[split+1:]
+		else:
+			setup, moves = args, []
+		if setup[:1] == ['startpos']:
+			chess = Chess.fromFEN(START_FEN, glyphs=False)
+		elif setup[:1] == ['fen']:
+			chess = Chess.fromFEN(' '.join(setup[1:]), glyphs=False)
+		else:
+			raise ValueError('expected startpos or fen')
+		for text in moves:
+			chess.doMove(parseUCIMove(chess, text))
+		self.chess = chess
+
+	def go(self, args):
+		"""Handles 'go' with depth, nodes, movetime, wtime, btime, winc, binc, movestogo, infinite and ponder"""
+		self.stopSearch()
+		limits = {}
+		flags = set()
+		i = 0
+		while i < len(args):
+			if args[i] in ('infinite', 'ponder'):
+				flags.add(args[i])
+				i += 1
+			elif i+1 < len(args):
+				try:
+					limits[args[i]] = int(args[i+1])
+				except ValueError:
+					pass
+				i += 2
+			else:
+				i += 1
+
+		depth = max(1, min(limits.get('depth', MAX_PLY), MAX_PLY))
+		nodes = limits.get('nodes')
+		movetime = None
+		if 'movetime' in limits:
+			movetime = max(0, limits['movetime'] - MOVE_OVERHEAD*1000) / 1000
+		else:
+			side = 'wb'[self.chess.turn]
+			if side + 'time' in limits:
+				movetime = allocateTime(limits[side + 'time'] / 1000, limits.get(side + 'inc', 0) / 1000, limits.get('movestogo'))
+
+		self.ponder_time = None
+		if 'ponder' in flags:
+			# search without a limit until ponderhit starts the clock or stop ends the search
+			self.ponder_time = movetime
+			movetime = None
+		self.finished.clear()
+		if flags:
+			self.release.clear()
+		else:
+			self.release.set()
+
+		if self.table is None:
+			self.table = TranspositionTable(self.hash_mb)
+		# a new engine starts unstopped, so a stop that arrives before the thread runs still ends the search
+		self.engine = Engine(self.chess, table=self.table)
+		self.thread = threading.Thread(target=self.search, args=(self.engine, depth, movetime, nodes), daemon=True)
+		self.thread.start()
+
+	def search(self, engine, depth, movetime, nodes):
+		"""Runs in the search thread and sends the bestmove once the search ends and is released"""
+		result = engine.search(depth, movetime, nodes, self.info)
+		self.finished.set()
+		self.release.wait()
+		if result.move is None:
+			self.send('bestmove 0000')
+		elif len(result.pv) > 1:
+			self.send('bestmove {} ponder {}'.format(moveToUCI(result.move), moveToUCI(result.pv[1])))
+		else:
+			self.send('bestmove {}'.format(moveToUCI(result.move)))
+
+	def info(self, stats):
+		"""Sends the result of each completed depth"""
+		engine = self.engine
+		seconds = time.perf_counter() - engine.start_time
+		self.send('info depth {} score {} nodes {} nps {:.0f} time {:.0f} pv {}'.format(
+			stats['depth'], formatScore(stats['value']), engine.nodes, engine.nodes / seconds if seconds > 0 else 0,
+			seconds * 1000, ' '.join(stats['pv'])))
+
+	def ponderhit(self):
+		"""The opponent played the expected move: the ponder search goes on as a normal search with the move's time budget"""
+		if self.thread is None or self.release.is_set():
+			return
+		if self.ponder_time is not None:
+			self.timer = threading.Timer(self.ponder_time, self.engine.stop)
+			self.timer.daemon = True
+			self.timer.start()
+		self.release.set()
+
+	def stopSearch(self):
+		"""Stops the running search, if any, and waits for its bestmove to be sent"""
+		if self.timer is not None:
+			self.timer.cancel()
+			self.timer = None
+		if self.thread is not None:
+			self.engine.stop()
+			self.release.set()
+			self.thread.join()
+			self.thread = None
+
+	def wait(self):
+		"""Waits for the running search to send its bestmove. The search must end on its own or be released"""
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		if self.timer is not None:
+			self.timer.cancel()
+			self.timer = None
+
+def main(stream=None):
+	"""Reads UCI commands from stream until quit or end of input"""
+	engine = UCIEngine()
+	for line in stream if stream is not None else sys.stdin:
+		if not engine.handleCommand(line.strip()):
+			break
+	engine.stopSearch()
+
+
+if __name__ == "__main__":
+	main()
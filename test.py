@@ -1,6 +1,32 @@
+import io
+import asyncio
+import json
+import random
+import os
+import tempfile
 import unittest
-from Chess import Chess
-from consts import EMPTY_SQUARE
+from Chess import Chess, MOVE_OK, INVALID_NOTATION, OWN_PIECE_ON_TARGET, NO_PIECE, AMBIGUOUS, PROMOTION_REQUIRED, KING_IN_CHECK, CASTLE_RIGHT_LOST, CASTLE_THROUGH_CHECK
+from consts import EMPTY_SQUARE, piece_index, KNIGHT, QUEEN
+from Pieces import possiblePieceStarts, pseudoLegalMoves, leavesKingSafe, isLegalMove, pinnedPieces, checkMask
+from Moves import encodeMove, moveToUCI, moveStart, moveFlag, CASTLE, EN_PASSANT
+from perft import PERFT_POSITIONS, compareToBaseline, parallelDivide, parallelPerft
+from Zobrist import hashPosition
+from Transposition import TranspositionTable, LOWER
+from Engine import Engine, MATE, MATE_BOUND
+from Evaluation import evaluate, evaluatePosition, MAX_PHASE
+from PGN import PGNGame, readGames, validateGame, validateGames
+from FEN import checkPosition, normalizeFEN, validateFENs
+from Encoding import encodePosition, decodePosition, writePositions, PositionStore, RECORD_SIZE
+from Book import OpeningBook, buildBook, toBookMove, fromBookMove
+from Tablebase import Tablebase, WIN_RESULT, DRAW_RESULT, LOSS_RESULT
+from Batch import np, piecePlanes, recordArray, recordPlanes, scorePlanes, evaluateGames, evaluateRecords
+from Server import GameServer, gameStatus
+from Notation import parseMove, parseMoves, ParsedMove
+from MoveCache import MoveCache
+from Bitboards import Position
+from benchPositions import runBenchmark as runPositionBenchmark
+from playUCI import UCIEngine, parseUCIMove, allocateTime, formatScore
+import Instrument
 
 class SimpleInputsTest(unittest.TestCase):
 	def setUp(self):
@@ -183,34 +209,34 @@ class PawnMovesTest(unittest.TestCase):
 		self.assertEqual(self.chess.checkSquare('d2'), 'WP')
 		self.assertEqual(self.chess.checkSquare('d3'), 'WP')
 
-	# def test_en_passant(self):
-	# 	"""
-	# 	En passant
-	# 	"""
-	# 	self.chess.setSquare('a4', 'BP')
-	# 	self.chess.makeMove('b4')
-	# 	self.chess.makeMove('axb3')
+	def test_en_passant(self):
+		"""
+		En passant
+		"""
+		self.chess.setSquare('a4', 'BP')
+		self.chess.makeMove('b4')
+		self.chess.makeMove('axb3')
 
-	# 	self.assertEqual(self.chess.checkSquare('a4'), EMPTY_SQUARE)
-	# 	self.assertEqual(self.chess.checkSquare('b4'), EMPTY_SQUARE)
-	# 	self.assertEqual(self.chess.checkSquare('b3'), 'BP')
+		self.assertEqual(self.chess.checkSquare('a4'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.checkSquare('b4'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.checkSquare('b3'), 'BP')
 
-	# def test_no_en_passant(self):
-	# 	"""
-	# 	No en passant
-	# 	"""
-	# 	self.chess.setSquare('a4', 'BP')
-	# 	self.chess.setSquare('g8', 'BK')
+	def test_no_en_passant(self):
+		"""
+		No en passant
+		"""
+		self.chess.setSquare('a4', 'BP')
+		self.chess.setSquare('g8', 'BK')
 
-	# 	self.chess.makeMove('b4')
-	# 	self.chess.makeMove('Kf7')
-	# 	self.chess.makeMove('d4')
-	# 	with self.assertRaises(ValueError):
-	# 		self.chess.makeMove('axb3')
+		self.chess.makeMove('b4')
+		self.chess.makeMove('Kf7')
+		self.chess.makeMove('d4')
+		with self.assertRaises(ValueError):
+			self.chess.makeMove('axb3')
 
-	# 	self.assertEqual(self.chess.checkSquare('a4'), 'BP')
-	# 	self.assertEqual(self.chess.checkSquare('b4'), 'WP')
-	# 	self.assertEqual(self.chess.checkSquare('b3'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.checkSquare('a4'), 'BP')
+		self.assertEqual(self.chess.checkSquare('b4'), 'WP')
+		self.assertEqual(self.chess.checkSquare('b3'), EMPTY_SQUARE)
 
 
 class KnightMovesTest(unittest.TestCase):
@@ -296,6 +322,34 @@ class KnightMovesTest(unittest.TestCase):
 		self.assertEqual(self.chess.checkSquare('g1'), EMPTY_SQUARE)
 		self.assertEqual(self.chess.checkSquare('f3'), 'WN')
 
+	def test_ambig_move_san(self):
+		"""
+		Ambiguous moves given with the file or rank of the moving piece
+		"""
+
+		self.chess.setSquare('e1', 'WN')
+		self.chess.makeMove('Nef3+')
+		self.assertEqual(self.chess.checkSquare('e1'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.checkSquare('f3'), 'WN')
+
+		self.chess.setSquare('a8', 'BR')
+		self.chess.setSquare('a2', 'BR')
+		with self.assertRaises(ValueError):
+			self.chess.makeMove('Ra5')
+		self.chess.makeMove('R8a5!?')
+		self.assertEqual(self.chess.checkSquare('a8'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.checkSquare('a5'), 'BR')
+
+	def test_ambig_pinned(self):
+		"""
+		Pinned piece does not make a move ambiguous
+		"""
+
+		chess = Chess.fromFEN('4k3/4r3/8/8/8/1N6/4N3/4K3 w - -')
+		chess.makeMove('Nd4')
+		self.assertEqual(chess.checkSquare('d4'), 'WN')
+		self.assertEqual(chess.checkSquare('e2'), 'WN')
+
 
 class QueenMovesTest(unittest.TestCase):
 	"""
@@ -593,6 +647,1482 @@ class CheckTests(unittest.TestCase):
 
 		self.chess.makeMove('Bd2')
 
-		
+class BitboardTest(unittest.TestCase):
+	def setUp(self):
+		self.chess = Chess()
+		self.chess.setupBoard()
+
+	def test_board_view(self):
+		"""
+		List board view matches the bitboards
+		"""
+		self.assertEqual(self.chess.board[0], ('WR', 'WN', 'WB', 'WQ', 'WK', 'WB', 'WN', 'WR'))
+		self.assertEqual(self.chess.board[4], (EMPTY_SQUARE,)*8)
+		self.assertEqual(bin(self.chess.position.occupancy).count('1'), 32)
+		self.assertEqual(self.chess.position.pieces[piece_index['BK']], 1 << 60)
+
+		self.chess.makeMove('Nf3')
+		self.assertEqual(self.chess.board[2][5], 'WN')
+		self.assertEqual(self.chess.board[0][6], EMPTY_SQUARE)
+
+		# the view cannot drift from the position
+		with self.assertRaises(TypeError):
+			self.chess.board[1][3] = EMPTY_SQUARE
+		with self.assertRaises(TypeError):
+			self.chess.board[1] = [EMPTY_SQUARE]*8
+		self.assertEqual(self.chess.checkSquare('d2'), 'WP')
+
+	def test_possible_starts_match(self):
+		"""
+		Bitboard and list boards give the same starting squares
+		"""
+		for move in ['e4', 'd5', 'exd5', 'Nf6', 'Bb5']:
+			self.chess.makeMove(move)
+		board = [list(row) for row in self.chess.board]
+		for piece in ['P','N','B','R','Q','K']:
+			for color in ['W','B']:
+				for row in range(2,6):
+					for col in range(8):
+						self.assertEqual(sorted(possiblePieceStarts(piece, (row,col), color, board)),
+							sorted(possiblePieceStarts(piece, (row,col), color, self.chess.position)))
+
+	def test_find_king(self):
+		"""
+		King search and check detection on bitboards and lists
+		"""
+		self.assertEqual(self.chess.findKing(self.chess.position), (0,4))
+		self.assertEqual(self.chess.findKing(self.chess.board), (0,4))
+		self.assertFalse(self.chess.checkForCheck(self.chess.board))
+
+	def test_kings_adjacent(self):
+		"""
+		Kings cannot move next to each other
+		"""
+		chess = Chess()
+		chess.setSquare('e1', 'WK')
+		chess.setSquare('e3', 'BK')
+		with self.assertRaises(ValueError):
+			chess.makeMove('Ke2')
+		chess.makeMove('Kf1')
+
+class MakeUnmakeTest(unittest.TestCase):
+	def setUp(self):
+		self.chess = Chess()
+		self.chess.setSquare('e1', 'WK')
+		self.chess.setSquare('h1', 'WR')
+		self.chess.setSquare('e8', 'BK')
+		self.chess.setSquare('a8', 'BR')
+		self.chess.setSquare('b7', 'WP')
+
+	def assertUndone(self, move):
+		board = self.chess.board
+		castle = [rights[:] for rights in self.chess.castle]
+		undo = self.chess.doMove(move)
+		self.assertEqual(self.chess.turn, 1)
+		self.chess.undoMove(undo)
+		self.assertEqual(self.chess.board, board)
+		self.assertEqual(self.chess.castle, castle)
+		self.assertEqual(self.chess.turn, 0)
+
+	def test_undo(self):
+		"""
+		Moves, captures, promotions and castling are taken back exactly
+		"""
+		self.assertUndone(encodeMove(7, 15))
+		self.assertUndone(encodeMove(49, 56, QUEEN))
+		self.assertUndone(encodeMove(49, 57, KNIGHT))
+		self.assertUndone(encodeMove(4, 6, flag=CASTLE))
+		self.assertUndone(encodeMove(4, 12))
+
+	def test_castle_rights(self):
+		"""
+		Capturing a rook in its corner removes castling rights
+		"""
+		self.chess.makeMove('bxa8=Q')
+		self.assertEqual(self.chess.castle[1], [True, False])
+		with self.assertRaises(ValueError):
+			self.chess.makeMove('O-O-O')
+
+	def test_illegal_move_restored(self):
+		"""
+		Illegal moves are taken back
+		"""
+		self.chess.setSquare('e4', 'BQ')
+		self.chess.setSquare('e2', 'WR')
+		with self.assertRaises(ValueError):
+			self.chess.makeMove('Rd2')
+		self.assertEqual(self.chess.checkSquare('e2'), 'WR')
+		self.assertEqual(self.chess.checkSquare('d2'), EMPTY_SQUARE)
+		self.assertEqual(self.chess.castle, [[True, True], [True, True]])
+		self.assertEqual(self.chess.turn, 0)
+
+	def test_black_back_rank(self):
+		"""
+		Black pieces move to the 1st rank without a promotion
+		"""
+		self.chess.makeMove('Rh2')
+		self.chess.makeMove('Ra1')
+		self.assertEqual(self.chess.checkSquare('a1'), 'BR')
+
+class MoveGenerationTest(unittest.TestCase):
+	def setUp(self):
+		self.chess = Chess()
+		self.chess.setupBoard()
+
+	def countMoves(self, depth):
+		if depth == 0:
+			return 1
+		nodes = 0
+		for move in self.chess.legalMoves():
+			undo = self.chess.doMove(move)
+			nodes += self.countMoves(depth-1)
+			self.chess.undoMove(undo)
+		return nodes
+
+	def test_start_position(self):
+		"""
+		Legal move counts from the start position
+		"""
+		self.assertEqual(len(self.chess.legalMoves()), 20)
+		self.assertEqual(self.countMoves(3), 8902)
+
+	def test_special_moves(self):
+		"""
+		Castling, promotion and en passant are generated
+		"""
+		chess = Chess()
+		chess.setSquare('e1', 'WK')
+		chess.setSquare('h1', 'WR')
+		chess.setSquare('a1', 'WR')
+		chess.setSquare('b7', 'WP')
+		chess.setSquare('e5', 'WP')
+		chess.setSquare('g8', 'BK')
+		chess.setSquare('d7', 'BP')
+		chess.makeMove('Kf1')
+		chess.makeMove('d5')
+		moves = [moveToUCI(move) for move in chess.legalMoves()]
+		self.assertIn('e5d6', moves)
+		self.assertIn('b7b8q', moves)
+		self.assertIn('b7b8n', moves)
+		self.assertNotIn('f1g1', [moveToUCI(move) for move in chess.legalMoves() if moveFlag(move) == CASTLE])
+
+		chess = Chess()
+		chess.setSquare('e1', 'WK')
+		chess.setSquare('h1', 'WR')
+		chess.setSquare('a1', 'WR')
+		chess.setSquare('g8', 'BK')
+		chess.setSquare('d8', 'BR')
+		castles = [moveToUCI(move) for move in chess.legalMoves() if moveFlag(move) == CASTLE]
+		self.assertEqual(castles, ['e1g1'])
+
+	def test_pinned_en_passant(self):
+		"""
+		En passant is not allowed when it exposes the king along the rank
+		"""
+		chess = Chess()
+		chess.setSquare('a5', 'WK')
+		chess.setSquare('b5', 'WP')
+		chess.setSquare('h5', 'BR')
+		chess.setSquare('c7', 'BP')
+		chess.setSquare('h8', 'BK')
+		chess.turn = 1
+		chess.makeMove('c5')
+		self.assertNotIn('b5c6', [moveToUCI(move) for move in chess.legalMoves()])
+		with self.assertRaises(ValueError):
+			chess.makeMove('bxc6')
+
+class PerftTest(unittest.TestCase):
+	def test_positions(self):
+		"""
+		Perft counts of the standard positions at a shallow depth
+		"""
+		expected = {'start': [20, 400], 'kiwipete': [48, 2039], 'position3': [14, 191, 2812],
+			'position4': [6, 264], 'position5': [44, 1486], 'position6': [46, 2079]}
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			chess = Chess.fromFEN(fen)
+			self.assertEqual([chess.perft(d+1) for d in range(len(expected[name]))], expected[name], name)
+
+	def test_divide(self):
+		"""
+		Divide splits the perft count by root move
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		counts = chess.divide(2)
+		self.assertEqual(len(counts), 48)
+		self.assertEqual(sum(counts.values()), 2039)
+		self.assertEqual(counts['e1g1'], 43)
+
+	def test_parallel(self):
+		"""
+		Parallel divide and perft match the single process counts when split at one and two plies
+		"""
+		fen = PERFT_POSITIONS[1][1]
+		counts = Chess.fromFEN(fen).divide(3)
+		self.assertEqual(parallelDivide(fen, 3, processes=2), counts)
+		self.assertEqual(parallelDivide(fen, 3, processes=2, split_depth=2, hash_mb=1), counts)
+		self.assertEqual(parallelPerft(PERFT_POSITIONS[2][1], 4, processes=2, split_depth=3), 43238)
+		self.assertEqual(parallelPerft(fen, 1, processes=2), 48)
+
+	def test_baseline(self):
+		"""
+		Throughput regressions and wrong counts are flagged
+		"""
+		results = {'start': {'depth': 3, 'nodes': 8902, 'expected': 8902, 'nps': 50000.0}}
+		self.assertEqual(compareToBaseline(results, {'start': {'depth': 3, 'nps': 55000.0}}), [])
+		self.assertEqual(len(compareToBaseline(results, {'start': {'depth': 3, 'nps': 80000.0}})), 1)
+		results['start']['nodes'] = 8901
+		self.assertEqual(len(compareToBaseline(results, {})), 1)
+
+class ZobristTest(unittest.TestCase):
+	def fullHash(self, chess):
+		return hashPosition(chess.position, chess.turn, chess.castle, chess.en_passant)
+
+	def test_incremental(self):
+		"""
+		Incremental key matches a full recompute through captures, castling, promotion and en passant
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			chess = Chess.fromFEN(fen)
+			key = chess.hash
+			self.assertEqual(key, self.fullHash(chess))
+			for move in chess.legalMoves():
+				undo = chess.doMove(move)
+				self.assertEqual(chess.hash, self.fullHash(chess), moveToUCI(move))
+				for reply in chess.legalMoves():
+					reply_undo = chess.doMove(reply)
+					self.assertEqual(chess.hash, self.fullHash(chess), moveToUCI(reply))
+					chess.undoMove(reply_undo)
+				chess.undoMove(undo)
+			self.assertEqual(chess.hash, key)
+
+	def test_transposition(self):
+		"""
+		Same position reached by different move orders has the same key
+		"""
+		chess1 = Chess()
+		chess1.setupBoard()
+		start = chess1.hash
+		for move in ['Nf3', 'Nf6', 'Ng1', 'Ng8']:
+			chess1.makeMove(move)
+		self.assertEqual(chess1.hash, start)
+
+		chess2 = Chess()
+		chess2.setupBoard()
+		for move in ['e4', 'e5', 'Nf3']:
+			chess1.makeMove(move)
+		for move in ['Nf3', 'e5', 'e4']:
+			chess2.makeMove(move)
+		self.assertEqual(chess1.hash, chess2.hash)
+		self.assertNotEqual(chess1.hash, start)
+
+	def test_en_passant_key(self):
+		"""
+		En passant square is only part of the key when it can be captured
+		"""
+		chess1 = Chess.fromFEN('4k3/8/8/8/3p4/8/4P3/4K3 w - -')
+		chess1.makeMove('e4')
+		chess2 = Chess.fromFEN('4k3/8/8/8/3pP3/8/8/4K3 b - -')
+		self.assertNotEqual(chess1.hash, chess2.hash)
+
+		chess1 = Chess.fromFEN('4k3/8/8/8/2p5/8/4P3/4K3 w - -')
+		chess1.makeMove('e4')
+		chess2 = Chess.fromFEN('4k3/8/8/8/2p1P3/8/8/4K3 b - -')
+		self.assertEqual(chess1.hash, chess2.hash)
+
+class TranspositionTableTest(unittest.TestCase):
+	def setUp(self):
+		self.table = TranspositionTable(1)
+
+	def test_store_probe(self):
+		"""
+		Entries round trip and count hits and misses
+		"""
+		move = encodeMove(12, 28)
+		self.table.store(0x123456789abcdef0, 5, -250, LOWER, move)
+		self.assertEqual(self.table.probe(0x123456789abcdef0), (move, 5, -250, LOWER))
+		self.assertIsNone(self.table.probe(0x0fedcba987654321))
+		self.assertEqual(self.table.stats()['hits'], 1)
+		self.assertEqual(self.table.stats()['misses'], 1)
+		self.assertEqual(len(self.table), 1 << 16)
+
+	def test_replacement(self):
+		"""
+		Deeper entries stay in the depth-preferred slot and others go to the always-replace slot
+		"""
+		step = self.table.buckets
+		self.table.store(1, 8, 10)
+		self.table.store(1 + step, 3, 20)
+		self.table.store(1 + 2*step, 2, 30)
+		self.assertEqual(self.table.probe(1)[2], 10)
+		self.assertIsNone(self.table.probe(1 + step))
+		self.assertEqual(self.table.probe(1 + 2*step)[2], 30)
+		self.assertEqual(self.table.collisions, 1)
+
+		self.table.newSearch()
+		self.table.store(1 + step, 1, 40)
+		self.assertEqual(self.table.probe(1 + step)[2], 40)
+		self.assertIsNone(self.table.probe(1))
+
+	def test_perft(self):
+		"""
+		Perft with a table gives the same counts
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		self.assertEqual(chess.perft(3, self.table), 97862)
+		self.assertEqual(self.table.hits, 0)
+		self.assertEqual(chess.divide(3, self.table)['e1g1'], 2059)
+		self.assertEqual(self.table.hits, 48)
+
+	def test_value_range(self):
+		"""
+		Values too large to pack, like the perft 8 count of the start position, are skipped
+		"""
+		self.table.store(1, 8, 84998978956)
+		self.assertIsNone(self.table.probe(1))
+		self.table.store(1, 8, -(1 << 33))
+		self.assertIsNone(self.table.probe(1))
+		self.table.store(1, 8, (1 << 33) - 1)
+		self.assertEqual(self.table.probe(1)[2], (1 << 33) - 1)
+		self.table.store(2, 8, 1 - (1 << 33))
+		self.assertEqual(self.table.probe(2)[2], 1 - (1 << 33))
+
+class AttackTest(unittest.TestCase):
+	def test_king_tracking(self):
+		"""
+		King squares follow moves, castling and undo
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		self.assertEqual(chess.position.kings, [4, 60])
+		chess.makeMove('O-O')
+		self.assertEqual(chess.position.kings, [6, 60])
+		undo = chess.doMove(encodeMove(60, 59))
+		self.assertEqual(chess.findKing(chess.position, 1), (7,3))
+		chess.undoMove(undo)
+		self.assertEqual(chess.position.kings, [6, 60])
+		chess.position.removePiece(6)
+		self.assertIsNone(chess.findKing(chess.position, 0))
+
+	def test_is_square_attacked(self):
+		"""
+		Early exit attack test agrees with the full attacker set
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			chess = Chess.fromFEN(fen)
+			for move in chess.legalMoves():
+				undo = chess.doMove(move)
+				for sq in range(64):
+					for color in [0, 1]:
+						self.assertEqual(chess.isSquareAttacked(sq, color), chess.position.attackers(sq, color) != 0)
+				chess.undoMove(undo)
+
+	def test_square_notation(self):
+		"""
+		Squares can be given in chess notation
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		self.assertTrue(chess.isSquareAttacked('f3', 0))
+		self.assertFalse(chess.isSquareAttacked('e4', 0))
+		self.assertTrue(chess.isSquareAttacked('f6', 1))
+
+class LegalityTest(unittest.TestCase):
+	def test_pins(self):
+		"""
+		Pinned pieces and their allowed lines
+		"""
+		chess = Chess.fromFEN('4k3/4r3/8/b7/8/8/2NP4/4K3 w - -')
+		chess.setSquare('e4', 'WR')
+		pins = pinnedPieces(chess.position, 0, 4)
+		self.assertEqual(sorted(pins), [11, 28])
+		moves = [moveToUCI(move) for move in chess.legalMoves()]
+		self.assertNotIn('d2d3', moves)
+		self.assertIn('e4e7', moves)
+		self.assertNotIn('e4d4', moves)
+		self.assertIn('c2b4', moves)
+
+	def test_check_mask(self):
+		"""
+		Single checks can be blocked or captured and double checks only answered by the king
+		"""
+		chess = Chess.fromFEN('4k3/8/8/8/1b6/8/8/R3K3 w - -')
+		self.assertEqual(checkMask(chess.position, 0, 4), (1 << 25) | (1 << 18) | (1 << 11))
+		chess = Chess.fromFEN('4k3/8/8/8/1b2r3/8/8/R3K3 w - -')
+		self.assertEqual(checkMask(chess.position, 0, 4), 0)
+		self.assertTrue(all(moveStart(move) == 4 for move in chess.legalMoves()))
+
+	def test_matches_make_and_test(self):
+		"""
+		Pin and check mask legality agrees with making each move
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			chess = Chess.fromFEN(fen)
+			for move in chess.legalMoves():
+				undo = chess.doMove(move)
+				pseudo = pseudoLegalMoves(chess.position, chess.turn, chess.castle[chess.turn], chess.en_passant)
+				expected = [m for m in pseudo if leavesKingSafe(chess.position, m, chess.turn)]
+				self.assertEqual(sorted(chess.legalMoves()), sorted(expected))
+				for m in pseudo:
+					self.assertEqual(isLegalMove(chess.position, m, chess.turn), m in expected)
+				chess.undoMove(undo)
+
+class EngineTest(unittest.TestCase):
+	def test_mate_in_one(self):
+		"""
+		Engine finds a back rank mate
+		"""
+		engine = Engine(Chess.fromFEN('6k1/5ppp/8/8/8/8/8/R5K1 w - -'), hash_mb=1)
+		result = engine.search(depth=3)
+		self.assertEqual(moveToUCI(result.move), 'a1a8')
+		self.assertGreater(result.value, MATE_BOUND)
+
+	def test_capture(self):
+		"""
+		Engine takes a hanging queen and leaves the position as it was
+		"""
+		chess = Chess.fromFEN('4k3/8/8/3q4/8/8/3R4/4K3 w - -')
+		key = chess.hash
+		engine = Engine(chess, hash_mb=1)
+		result = engine.search(depth=3)
+		self.assertEqual(moveToUCI(result.move), 'd2d5')
+		self.assertEqual(result.pv[0], result.move)
+		self.assertEqual(len(engine.depth_stats), 3)
+		self.assertEqual(chess.hash, key)
+		self.assertEqual(chess.turn, 0)
+
+	def test_limits(self):
+		"""
+		Node budget stops the search and restores the position
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		key = chess.hash
+		result = Engine(chess, hash_mb=1).search(nodes=3000)
+		self.assertIn(result.move, chess.legalMoves())
+		self.assertLess(result.nodes, 5000)
+		self.assertEqual(chess.hash, key)
+
+	def test_stop_before_search(self):
+		"""
+		A stop asked for before the search starts is not lost, and the next search runs normally
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		engine = Engine(chess, hash_mb=1)
+		engine.stop()
+		result = engine.search(depth=20)
+		self.assertEqual(result.depth, 0)
+		self.assertIn(result.move, chess.legalMoves())
+		self.assertEqual(engine.search(depth=2).depth, 2)
+
+	def test_long_algebraic(self):
+		"""
+		Packed moves convert to notation that makeMove accepts
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		for move in chess.legalMoves():
+			copy = Chess.fromFEN(PERFT_POSITIONS[1][1])
+			copy.makeMove(chess.longAlgebraic(move))
+			undo = chess.doMove(move)
+			self.assertEqual(copy.hash, chess.hash)
+			chess.undoMove(undo)
+
+class EvaluationTest(unittest.TestCase):
+	def terms(self, chess):
+		position = chess.position
+		return (position.mg, position.eg, position.phase)
+
+	def test_incremental(self):
+		"""
+		Incremental evaluation terms match a full recompute through make and unmake
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			chess = Chess.fromFEN(fen)
+			start = self.terms(chess)
+			self.assertEqual(start, evaluatePosition(chess.position))
+			for move in chess.legalMoves():
+				undo = chess.doMove(move)
+				self.assertEqual(self.terms(chess), evaluatePosition(chess.position), moveToUCI(move))
+				for reply in chess.legalMoves():
+					reply_undo = chess.doMove(reply)
+					self.assertEqual(self.terms(chess), evaluatePosition(chess.position), moveToUCI(reply))
+					chess.undoMove(reply_undo)
+				chess.undoMove(undo)
+			self.assertEqual(self.terms(chess), start)
+
+	def test_start_position(self):
+		"""
+		Start position is balanced and in the middle game phase
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		self.assertEqual(evaluate(chess), 0)
+		self.assertEqual(chess.position.phase, MAX_PHASE)
+
+	def test_side_to_move(self):
+		"""
+		Score is from the point of view of the player to move
+		"""
+		white = Chess.fromFEN('4k3/8/8/8/8/8/8/3QK3 w - -')
+		black = Chess.fromFEN('4k3/8/8/8/8/8/8/3QK3 b - -')
+		self.assertGreater(evaluate(white), 800)
+		self.assertEqual(evaluate(black), -evaluate(white))
+
+	def test_setup_board(self):
+		"""
+		Terms stay correct when the board is replaced through the list view
+		"""
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		chess.board = [list(row) for row in chess.board]
+		self.assertEqual(self.terms(chess), evaluatePosition(chess.position))
+
+PGN_TEXT = '''[Event "Test \\"quoted\\""]
+[White "A"]
+[Black "B"]
+
+1. e4 e5 2. Nf3 {a comment
+over two lines} Nc6 (2... d6 3. d4 (3. Bc4) exd4) 3.Bb5 $1 a6 4. Ba4 Nf6 ; rest of line 5. d4
+5. O-O Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O 9. h3 Nb8 10. d4 Nbd7 11. Nbd2 Bb7 1-0
+% escaped line
+
+[Event "Illegal"]
+
+1. e4 e5 2. Ke3 *
+[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"]
+1. e4 Kd7 2. e5 Ke6 3. Ke2 Kxe5
+'''
+
+class PGNTest(unittest.TestCase):
+	def test_read(self):
+		"""
+		Tags and main line moves are read with comments, variations, NAGs and move numbers removed
+		"""
+		games = list(readGames(io.StringIO(PGN_TEXT)))
+		self.assertEqual(len(games), 3)
+		self.assertEqual(games[0].tags['Event'], 'Test "quoted"')
+		self.assertEqual(games[0].moves[:6], ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'])
+		self.assertEqual(len(games[0].moves), 22)
+		self.assertEqual(games[0].result, '1-0')
+		self.assertEqual(games[1].result, '*')
+		self.assertEqual(games[2].result, None)
+		self.assertEqual(len(games[2].moves), 6)
+
+	def test_validate(self):
+		"""
+		Games are replayed to the end or to the first illegal move
+		"""
+		results = [validateGame(game, number) for number, game in enumerate(readGames(io.StringIO(PGN_TEXT)), 1)]
+		self.assertTrue(results[0].legal)
+		self.assertEqual(results[0].plies, 22)
+
+		self.assertFalse(results[1].legal)
+		self.assertEqual(results[1].plies, 2)
+		self.assertEqual(results[1].illegal_ply, 3)
+		self.assertEqual(results[1].illegal_move, 'Ke3')
+		self.assertEqual(results[1].fen, 'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2')
+
+		self.assertTrue(results[2].legal)
+		self.assertEqual(results[2].key, Chess.fromFEN('8/8/8/4k3/8/8/4K3/8 w - -').hash)
+		self.assertEqual(results[2].fen, '8/8/8/4k3/8/8/4K3/8 w - - 0 4')
+
+		result = validateGame(PGNGame({'FEN': '8/8/8'}, ['e4'], None))
+		self.assertFalse(result.legal)
+		self.assertIsNone(result.fen)
+
+	def test_processes(self):
+		"""
+		Validating across processes gives the same results in the same order
+		"""
+		games = list(readGames(io.StringIO(PGN_TEXT * 5)))
+		serial = list(validateGames(games))
+		parallel = list(validateGames(iter(games), processes=2, chunk_size=2))
+		self.assertEqual(parallel, serial)
+		self.assertEqual([result.number for result in parallel], list(range(1, 16)))
+
+class FENTest(unittest.TestCase):
+	def test_round_trip(self):
+		"""
+		FEN written by toFEN matches the FEN the game was set up from
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			self.assertEqual(Chess.fromFEN(fen).toFEN(), fen, name)
+
+	def test_clocks(self):
+		"""
+		Halfmove clock and fullmove number follow the moves and are restored by undoMove
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		chess.makeMove('e4')
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+		chess.makeMove('c5')
+		chess.makeMove('Nf3')
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2')
+		undo = chess.doMove(chess.legalMoves()[0])
+		chess.undoMove(undo)
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2')
+
+	def test_invalid_clocks(self):
+		"""
+		Move clocks must be numbers
+		"""
+		with self.assertRaises(ValueError):
+			Chess.fromFEN('4k3/8/8/8/8/8/8/4K3 w - - x 1')
+		with self.assertRaises(ValueError):
+			Chess.fromFEN('4k3/8/8/8/8/8/8/4K3 w - - 0 0')
+		with self.assertRaises(ValueError):
+			Chess.fromFEN('4k3/8/8/8/8/8/8/4K3 w - - 0 1 extra')
+
+	def test_invalid_fields(self):
+		"""
+		Ranks longer than 8 squares and repeated castling rights are rejected
+		"""
+		for fen in ['rnbqkbnrp/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+				'rnbqkbnr/pppppppp/44p/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR1 w KQkq - 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KKKK - 0 1',
+				'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkqq - 0 1']:
+			with self.assertRaises(ValueError):
+				Chess.fromFEN(fen)
+		self.assertEqual(normalizeFEN('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w Qk - 0 1'),
+			'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w Qk - 0 1')
+
+	def test_check_position(self):
+		"""
+		Positions that cannot arise in a game are reported
+		"""
+		self.assertEqual(checkPosition(Chess.fromFEN(PERFT_POSITIONS[1][1])), [])
+		self.assertEqual(len(checkPosition(Chess.fromFEN('8/8/8/8/8/8/8/4K3 w - -'))), 1)
+		self.assertEqual(len(checkPosition(Chess.fromFEN('4k3/8/8/8/8/8/8/P3K3 w - -'))), 1)
+		self.assertEqual(len(checkPosition(Chess.fromFEN('4k3/4R3/8/8/8/8/8/4K3 w - -'))), 1)
+		self.assertEqual(len(checkPosition(Chess.fromFEN('4k3/8/8/8/8/8/8/4K2R w KQ -'))), 1)
+		self.assertEqual(len(checkPosition(Chess.fromFEN('4k3/8/8/8/4P3/8/8/4K3 b - e3'))), 0)
+		self.assertEqual(len(checkPosition(Chess.fromFEN('4k3/8/8/8/4P3/8/8/4K3 b - d3'))), 1)
+
+	def test_bulk(self):
+		"""
+		Each line is normalized or reported with its line number
+		"""
+		lines = io.StringIO('# comment\n4k3/8/8/8/8/8/8/4K3\n\nbad\n8/8/8/8/8/8/8/8 w - - 0 1\n')
+		results = list(validateFENs(lines))
+		self.assertEqual([result.number for result in results], [2, 4, 5])
+		self.assertEqual(results[0].normalized, '4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+		self.assertIsNone(results[1].normalized)
+		self.assertIsNotNone(results[2].error)
+		with self.assertRaises(ValueError):
+			normalizeFEN('8/8/8/8/8/8/8/8 w - - 0 1')
+
+class EncodingTest(unittest.TestCase):
+	def test_round_trip(self):
+		"""
+		Decoded positions match the encoded ones including en passant and move clocks
+		"""
+		fens = [fen for name, fen, depth, nodes in PERFT_POSITIONS]
+		fens.append('rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3')
+		for fen in fens:
+			chess = Chess.fromFEN(fen)
+			record = encodePosition(chess)
+			self.assertEqual(len(record), RECORD_SIZE)
+			decoded = decodePosition(record)
+			self.assertEqual(decoded.toFEN(), fen)
+			self.assertEqual(decoded.hash, chess.hash)
+
+	def test_too_many_pieces(self):
+		"""
+		Positions with more than 32 pieces cannot be encoded
+		"""
+		chess = Chess.fromFEN('pppppppp/pppppppp/pppppppp/pppppppp/pppppppp/8/8/8 w - -')
+		with self.assertRaises(ValueError):
+			encodePosition(chess)
+
+	def test_store(self):
+		"""
+		Records written to a file are read back by index and in order
+		"""
+		fens = [fen for name, fen, depth, nodes in PERFT_POSITIONS]
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'positions.bin')
+			self.assertEqual(writePositions(path, (Chess.fromFEN(fen) for fen in fens[:3])), 3)
+			writePositions(path, (Chess.fromFEN(fen) for fen in fens[3:]), append=True)
+			self.assertEqual(os.path.getsize(path), len(fens) * RECORD_SIZE)
+
+			with PositionStore(path) as store:
+				self.assertEqual(len(store), len(fens))
+				self.assertEqual(store[4].toFEN(), fens[4])
+				self.assertEqual(store[-1].toFEN(), fens[-1])
+				self.assertEqual([chess.toFEN() for chess in store], fens)
+				self.assertEqual(store.record(1), encodePosition(Chess.fromFEN(fens[1])))
+				self.assertEqual([fields[2] & 1 for fields in store.records()], [0]*len(fens))
+				self.assertEqual(store.fields(0)[0], Chess.fromFEN(fens[0]).position.occupancy)
+				with self.assertRaises(IndexError):
+					store.record(len(fens))
+				record = store.record(0)
+			# records outlive the store
+			self.assertEqual(decodePosition(record).toFEN(), fens[0])
+			self.assertTrue(store.file.closed)
+
+			empty = os.path.join(directory, 'empty.bin')
+			writePositions(empty, [])
+			with PositionStore(empty) as store:
+				self.assertEqual(len(store), 0)
+				self.assertEqual(list(store), [])
+
+class BookTest(unittest.TestCase):
+	def test_polyglot_keys(self):
+		"""
+		Position keys are the published Polyglot keys, including en passant only when a capture is possible
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		self.assertEqual(chess.hash, 0x463b96181691fc9c)
+		chess.makeMove('e4')
+		self.assertEqual(chess.hash, 0x823c9b50fd114196)
+		chess.makeMove('d5')
+		self.assertEqual(chess.hash, 0x0756b94461c50fb0)
+		for move in ['e5', 'f5']:
+			chess.makeMove(move)
+		self.assertEqual(chess.hash, 0x22a48b5a8e47ff78)
+		for move in ['Ke2', 'Kf7']:
+			chess.makeMove(move)
+		self.assertEqual(chess.hash, 0x00fdd303c946bdd9)
+
+	def test_book_moves(self):
+		"""
+		Moves convert to and from the Polyglot move format, with castling as the king taking its own rook
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		e4 = encodeMove(12, 28)
+		self.assertEqual(toBookMove(e4), 0x031c)
+		self.assertEqual(fromBookMove(chess, 0x031c), e4)
+		self.assertIsNone(fromBookMove(chess, toBookMove(encodeMove(12, 36))))
+
+		chess = Chess.fromFEN(PERFT_POSITIONS[1][1])
+		for move in chess.legalMoves():
+			self.assertEqual(fromBookMove(chess, toBookMove(move)), move, moveToUCI(move))
+		castle = [move for move in chess.legalMoves() if moveFlag(move) == CASTLE and move >> 6 & 63 == 6][0]
+		self.assertEqual(toBookMove(castle), 7 | 4 << 6)
+
+	def test_build_and_probe(self):
+		"""
+		Book built from PGN returns the moves played with weights from the results
+		"""
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'book.bin')
+			count = buildBook(readGames(io.StringIO(PGN_TEXT)), path, plies=4, min_weight=0)
+			# the illegal game adds nothing new and the FEN game adds its first 4 plies
+			self.assertEqual(count, 8)
+			self.assertEqual(os.path.getsize(path), count * 16)
+
+			with OpeningBook(path) as book:
+				chess = Chess()
+				chess.setupBoard()
+				moves = book.moves(chess)
+				self.assertEqual([moveToUCI(move) for move, weight in moves], ['e2e4'])
+				# the first game was won by white and the second has no result
+				self.assertEqual(moves[0][1], 3)
+				self.assertEqual(book.choose(chess, random.Random(1)), moves[0][0])
+
+				chess.makeMove('e4')
+				self.assertEqual(book.moves(chess)[0][1], 1)
+				chess.makeMove('d5')
+				self.assertEqual(book.moves(chess), [])
+				self.assertIsNone(book.choose(chess))
+
+class TablebaseTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.directory = tempfile.TemporaryDirectory()
+		cls.tablebase = Tablebase(cls.directory.name)
+		cls.tablebase.table('KQvK')
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.directory.cleanup()
+
+	def test_longest_mate(self):
+		"""
+		Longest KQK mate is 10 moves
+		"""
+		values = self.tablebase.table('KQvK').values
+		self.assertEqual(max(value for value in values if 0 < value < 128), 19)
+
+	def test_probe(self):
+		"""
+		Wins, losses, mates and stalemates from the point of view of the side to move, with either color stronger
+		"""
+		probe = self.tablebase.probe
+		self.assertEqual(probe(Chess.fromFEN('k7/8/1QK5/8/8/8/8/8 w - -')), (WIN_RESULT, 1))
+		self.assertEqual(probe(Chess.fromFEN('k7/1Q6/1K6/8/8/8/8/8 b - -')), (LOSS_RESULT, 0))
+		self.assertEqual(probe(Chess.fromFEN('k7/2Q5/1K6/8/8/8/8/8 b - -')), (DRAW_RESULT, 0))
+		# black queen hanging to the white king
+		self.assertEqual(probe(Chess.fromFEN('8/8/8/8/8/8/1q6/K6k w - -')), (DRAW_RESULT, 0))
+		self.assertEqual(probe(Chess.fromFEN('8/8/8/8/8/1k6/1q6/K7 w - -')), (LOSS_RESULT, 0))
+		self.assertEqual(probe(Chess.fromFEN('K7/8/1k6/8/8/8/7q/8 b - -'))[0], WIN_RESULT)
+		self.assertEqual(probe(Chess.fromFEN('8/8/8/4k3/8/8/8/KN6 w - -')), (DRAW_RESULT, 0))
+
+	def test_not_covered(self):
+		"""
+		Positions with castling rights, en passant or more pieces are not looked up
+		"""
+		probe = self.tablebase.probe
+		self.assertIsNone(probe(Chess.fromFEN('4k3/8/8/8/8/8/8/4K2R w K -')))
+		self.assertIsNone(probe(Chess.fromFEN(PERFT_POSITIONS[2][1])))
+		self.assertIsNone(Tablebase().probe(Chess.fromFEN('8/8/8/4k3/8/8/8/KR6 w - -'), generate=False))
+
+	def test_best_move(self):
+		"""
+		Best move shortens the mate and saved tables are loaded instead of generated
+		"""
+		chess = Chess.fromFEN('8/8/8/4k3/8/8/8/KQ6 w - -')
+		result, plies = self.tablebase.probe(chess)
+		self.assertEqual(result, WIN_RESULT)
+		chess.doMove(self.tablebase.bestMove(chess))
+		self.assertEqual(self.tablebase.probe(chess), (LOSS_RESULT, plies-1))
+
+		loaded = Tablebase(self.directory.name)
+		self.assertEqual(loaded.probe(chess, generate=False), (LOSS_RESULT, plies-1))
+
+	def test_engine(self):
+		"""
+		Engine scores tablebase positions as mates
+		"""
+		chess = Chess.fromFEN('8/8/8/4k3/8/8/8/KQ6 w - -')
+		plies = self.tablebase.probe(chess)[1]
+		result = Engine(chess, hash_mb=1, tablebase=self.tablebase).search(depth=2)
+		self.assertEqual(result.value, MATE - plies)
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class BatchTest(unittest.TestCase):
+	def setUp(self):
+		self.games = [Chess.fromFEN(position[1]) for position in PERFT_POSITIONS]
+		self.games.append(Chess.fromFEN('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1'))
+
+	def test_planes(self):
+		"""
+		Planes mark every piece on its square
+		"""
+		planes = piecePlanes(self.games)
+		self.assertEqual(planes.shape, (len(self.games), 12, 8, 8))
+		for chess, plane in zip(self.games, planes):
+			for sq, piece in enumerate(chess.position.squares):
+				for index in range(12):
+					self.assertEqual(plane[index, sq >> 3, sq & 7], int(piece != EMPTY_SQUARE and piece_index[piece] == index))
+
+	def test_record_planes(self):
+		"""
+		Planes built from packed records match planes built from games
+		"""
+		records = b''.join(encodePosition(chess) for chess in self.games)
+		self.assertTrue((recordPlanes(records) == piecePlanes(self.games)).all())
+
+	def test_scores(self):
+		"""
+		Batch scores match evaluate for games and packed records
+		"""
+		expected = [evaluate(chess) for chess in self.games]
+		self.assertEqual(evaluateGames(self.games).tolist(), expected)
+		records = b''.join(encodePosition(chess) for chess in self.games)
+		self.assertEqual(evaluateRecords(records).tolist(), expected)
+		white = scorePlanes(piecePlanes(self.games))
+		self.assertEqual(white.tolist(), [score if chess.turn == 0 else -score for chess, score in zip(self.games, expected)])
+
+	def test_store(self):
+		"""
+		Packed position stores are scored in place
+		"""
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'positions.bin')
+			writePositions(path, self.games)
+			with PositionStore(path) as store:
+				scores = evaluateRecords(store).tolist()
+
+			# arrays over the mapped file keep it from being unmapped, but the file is still closed
+			store = PositionStore(path)
+			records = recordArray(store)
+			with self.assertRaises(BufferError):
+				store.close()
+			self.assertTrue(store.file.closed)
+			del records
+		self.assertEqual(scores, [evaluate(chess) for chess in self.games])
+
+class ServerTest(unittest.TestCase):
+	def test_commands(self):
+		"""
+		Games are played through protocol commands
+		"""
+		server = GameServer()
+		self.assertEqual(server.handleLine('new'), 'ok 1')
+		self.assertEqual(server.handleLine('new 7k/8/8/8/8/8/5Q2/6K1 w - - 0 1'), 'ok 2')
+		self.assertEqual(server.handleLine('move 1 e4'), 'ok 1 e2e4 playing')
+		self.assertEqual(server.handleLine('move 1 e7-e5'), 'ok 1 e7e5 playing')
+		self.assertEqual(server.handleLine('moves 1'), 'ok 1 e2e4 e7e5')
+		self.assertEqual(server.handleLine('state 1'), 'ok 1 playing rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2')
+		self.assertEqual(server.handleLine('move 2 Qe2'), 'ok 2 f2e2 playing')
+		self.assertTrue(server.handleLine('move 2 Kh6').startswith('error '))
+		self.assertEqual(server.handleLine('legal 2').split()[:2], ['ok', '2'])
+		self.assertEqual(server.handleLine('games'), 'ok 2')
+		self.assertEqual(server.handleLine('close 2'), 'ok 2')
+		self.assertEqual(server.handleLine('state 2'), "error no game '2'")
+		self.assertEqual(server.handleLine('jump 1'), "error unknown command 'jump'")
+
+	def test_invalid_position(self):
+		"""
+		Games cannot be opened from positions without both kings
+		"""
+		server = GameServer()
+		self.assertEqual(server.handleLine('new 8/8/8/8/8/8/8/8 w - - 0 1'), 'error white has 0 kings; black has 0 kings')
+		self.assertTrue(server.handleLine('new 4k3/8/8/8/8/8/8/8 w - - 0 1').startswith('error '))
+		self.assertEqual(server.handleLine('games'), 'ok 0')
+		self.assertEqual(gameStatus(Chess.fromFEN('8/8/8/8/8/8/8/4k3 w - - 0 1')), 'stalemate')
+
+	def test_status(self):
+		"""
+		Moves report check, checkmate and stalemate
+		"""
+		server = GameServer()
+		server.newGame('7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+		self.assertEqual(server.handleLine('move 1 Qb8'), 'ok 1 b1b8 checkmate')
+		server.newGame('7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+		self.assertEqual(server.handleLine('move 2 Qf5'), 'ok 2 b1f5 playing')
+		server.newGame('7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+		self.assertEqual(server.handleLine('move 3 Qh1'), 'ok 3 b1h1 check')
+		server.newGame('7k/8/6K1/8/8/8/5Q2/8 w - - 0 1')
+		self.assertEqual(server.handleLine('move 4 Qf7'), 'ok 4 f2f7 stalemate')
+
+	def test_connection(self):
+		"""
+		Pipelined commands over a socket get one reply per line in order
+		"""
+		async def play():
+			server = GameServer()
+			listener = await asyncio.start_server(server.handleClient, '127.0.0.1', 0)
+			port = listener.sockets[0].getsockname()[1]
+			reader, writer = await asyncio.open_connection('127.0.0.1', port)
+			writer.write(b'new\nnew\nmove 1 e4\nmove 2 d4\nmove 1 e5\nmoves 1\nquit\n')
+			await writer.drain()
+			replies = (await reader.read()).decode().splitlines()
+			writer.close()
+			listener.close()
+			await listener.wait_closed()
+			return replies
+
+		self.assertEqual(asyncio.run(play()), ['ok 1', 'ok 2', 'ok 1 e2e4 playing', 'ok 2 d2d4 playing', 'ok 1 e7e5 playing', 'ok 1 e2e4 e7e5'])
+
+class UCITest(unittest.TestCase):
+	def setUp(self):
+		self.lines = []
+		self.uci = UCIEngine(self.lines.append)
+
+	def test_handshake(self):
+		"""
+		uci and isready are answered
+		"""
+		self.uci.handleCommand('uci')
+		self.uci.handleCommand('isready')
+		self.assertEqual(self.lines[0], 'id name pyChess')
+		self.assertEqual(self.lines[-2:], ['uciok', 'readyok'])
+
+	def test_position(self):
+		"""
+		Positions are set from startpos or a FEN followed by UCI moves
+		"""
+		self.uci.handleCommand('position startpos moves e2e4 e7e5 g1f3')
+		self.assertEqual(self.uci.chess.toFEN(), 'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2')
+		self.uci.handleCommand('position fen r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1 moves e1g1 e8c8')
+		self.assertEqual(self.uci.chess.toFEN(), '2kr3r/8/8/8/8/8/8/R4RK1 w - - 2 2')
+		self.uci.handleCommand('position startpos moves e2e5')
+		self.assertEqual(self.uci.chess.toFEN(), '2kr3r/8/8/8/8/8/8/R4RK1 w - - 2 2')
+		self.assertEqual(self.lines, ["info string 'e2e5' is not a legal move"])
+
+	def test_go_depth(self):
+		"""
+		go depth searches in the background and sends info and a bestmove
+		"""
+		self.uci.handleCommand('position fen 7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')
+		self.uci.handleCommand('go depth 3')
+		self.uci.wait()
+		self.assertTrue(self.lines[0].startswith('info depth 1 score mate 1 '))
+		self.assertEqual(self.lines[-1], 'bestmove b1b8')
+
+	def test_stop(self):
+		"""
+		go infinite runs until stop and isready is answered while it searches
+		"""
+		self.uci.handleCommand('position startpos')
+		self.uci.handleCommand('go infinite')
+		self.uci.handleCommand('isready')
+		self.assertIn('readyok', self.lines)
+		self.assertFalse(any(line.startswith('bestmove') for line in self.lines))
+		self.uci.handleCommand('stop')
+		self.assertTrue(self.lines[-1].startswith('bestmove '))
+		move = self.lines[-1].split()[1]
+		self.assertIn(move, [moveToUCI(legal) for legal in self.uci.chess.legalMoves()])
+
+	def test_ponderhit(self):
+		"""
+		A ponder search sends its bestmove only after ponderhit
+		"""
+		self.uci.handleCommand('position startpos moves e2e4')
+		self.uci.handleCommand('go ponder depth 2')
+		self.assertTrue(self.uci.finished.wait(10))
+		self.assertFalse(any(line.startswith('bestmove') for line in self.lines))
+		self.uci.handleCommand('ponderhit')
+		self.uci.wait()
+		self.assertTrue(self.lines[-1].startswith('bestmove '))
+
+	def test_time(self):
+		"""
+		Clock time is split over the moves to go and scores are written in UCI form
+		"""
+		self.assertAlmostEqual(allocateTime(60, 0, 20), 3)
+		self.assertAlmostEqual(allocateTime(60, 2), 3.5)
+		self.assertAlmostEqual(allocateTime(0.1, 5), 0.05)
+		self.assertEqual(formatScore(35), 'cp 35')
+		self.assertEqual(formatScore(MATE - 3), 'mate 2')
+		self.assertEqual(formatScore(-MATE + 2), 'mate -1')
+		chess = Chess.fromFEN('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+		self.assertEqual(moveToUCI(parseUCIMove(chess, 'b7b8n')), 'b7b8n')
+		with self.assertRaises(ValueError):
+			parseUCIMove(chess, 'b7b8')
+
+class InstrumentTest(unittest.TestCase):
+	def tearDown(self):
+		Instrument.disable()
+		Instrument.reset()
+
+	def test_disabled(self):
+		"""
+		Disabling puts the original functions back
+		"""
+		originals = [getattr(owner, attribute) for owner, attribute in Instrument.TARGETS]
+		Instrument.enable()
+		self.assertTrue(Instrument.enabled())
+		self.assertIsNot(Chess.makeMove, originals[0])
+		Instrument.disable()
+		self.assertFalse(Instrument.enabled())
+		self.assertEqual([getattr(owner, attribute) for owner, attribute in Instrument.TARGETS], originals)
+
+	def test_counts(self):
+		"""
+		Calls are counted per function and per piece type
+		"""
+		Instrument.reset()
+		Instrument.enable()
+		chess = Chess()
+		chess.setupBoard()
+		# resolve every move instead of finding some in the shared cache
+		chess.move_cache = None
+		for move in ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6', 'O-O']:
+			chess.makeMove(move)
+		Instrument.disable()
+		chess.makeMove('Nf6')
+		report = Instrument.report()
+		self.assertEqual(report['Chess.makeMove']['calls'], 7)
+		self.assertEqual(report['Chess.findPieceMove']['calls'], 6)
+		self.assertEqual(report['Chess.findCastle']['calls'], 1)
+		self.assertEqual(report['possiblePieceStarts[P]']['calls'], 3)
+		self.assertEqual(report['possiblePieceStarts[N]']['calls'], 2)
+		self.assertEqual(report['possiblePieceStarts[B]']['calls'], 1)
+		self.assertGreater(report['Chess.makeMove']['seconds'], 0)
+		self.assertIn('Chess.makeMove', Instrument.formatReport())
+
+	def test_profiling(self):
+		"""
+		profiling reports to a stream and a JSON file, and does nothing without an output
+		"""
+		with Instrument.profiling(None):
+			self.assertFalse(Instrument.enabled())
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'profile.json')
+			stream = io.StringIO()
+			with Instrument.profiling(path, stream):
+				self.assertTrue(Instrument.enabled())
+				chess = Chess.fromFEN('4k3/8/8/8/8/8/8/4K2R w K - 0 1')
+				chess.move_cache = None
+				chess.makeMove('Rh8+')
+			self.assertFalse(Instrument.enabled())
+			self.assertIn('possiblePieceStarts[R]', stream.getvalue())
+			with open(path) as f:
+				self.assertEqual(json.load(f)['Chess.makeMove']['calls'], 1)
+
+class TryMoveTest(unittest.TestCase):
+	def test_move_piece_records(self):
+		"""
+		movePiece and moveCastle pass the turn and record the move like makeMove
+		"""
+		chess = Chess.fromFEN('r3k2r/6P1/8/3p4/4P3/8/8/R3K2R w KQkq - 0 1')
+		chess.movePiece('P', 'd5', 'e', True)
+		chess.moveCastle('queen')
+		chess.movePiece('P', 'h8', 'g7', True, 'Q')
+		chess.makeMove('Kb7')
+		chess.moveCastle('king')
+		self.assertEqual(chess.moves, [['e4xd5', 'g7xh8=Q', 'O-O'], ['O-O-O', 'Kb7']])
+		self.assertEqual(chess.toFEN(), '3r3Q/1k6/8/3P4/8/8/8/R4RK1 b - - 2 3')
+		for line in chess.moves[0] + chess.moves[1]:
+			self.assertIsNotNone(parseMove(line))
+
+	def test_reasons(self):
+		"""
+		Rejected moves report the rule that rejected them and leave the board unchanged
+		"""
+		chess = Chess.fromFEN('r3k2r/1P6/8/8/8/2N5/8/R3K1NR w Kkq - 0 1')
+		fen = chess.toFEN()
+		cases = [
+			('Ke4x', INVALID_NOTATION),
+			('Ra2', MOVE_OK),
+			('Rg1', OWN_PIECE_ON_TARGET),
+			('Qd4', NO_PIECE),
+			('Ne2', AMBIGUOUS),
+			('b8', PROMOTION_REQUIRED),
+			('O-O-O', CASTLE_RIGHT_LOST),
+		]
+		for move, reason in cases:
+			result = chess.findMove(move)
+			self.assertEqual(result.reason, reason, move)
+			self.assertEqual(chess.isLegal(move), reason == MOVE_OK)
+		self.assertEqual(chess.toFEN(), fen)
+
+	def test_messages(self):
+		"""
+		Messages match the ValueError raised by makeMove
+		"""
+		chess = Chess.fromFEN('4k3/8/8/8/8/8/5r2/R3K2R w KQ - 0 1')
+		for move in ['O-O', 'Kf1', 'Ra9', 'Nc3', 'a1=Q']:
+			result = chess.tryMove(move)
+			self.assertFalse(result)
+			with self.assertRaises(ValueError) as context:
+				chess.makeMove(move)
+			self.assertEqual(str(context.exception), result.message)
+		self.assertEqual(chess.findMove('O-O').reason, CASTLE_THROUGH_CHECK)
+		self.assertEqual(chess.findMove('Kd2').reason, KING_IN_CHECK)
+
+	def test_make(self):
+		"""
+		Legal moves are made and recorded
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		result = chess.tryMove('e4')
+		self.assertTrue(result)
+		self.assertIsNone(result.message)
+		self.assertEqual(moveToUCI(result.move), 'e2e4')
+		self.assertEqual(chess.turn, 1)
+		self.assertEqual(chess.moves, [['e4'], []])
+		self.assertFalse(chess.tryMove('e5x'))
+		self.assertEqual(chess.moves, [['e4'], []])
+
+class NotationTest(unittest.TestCase):
+	def test_san(self):
+		"""
+		Standard algebraic moves are split into their parts
+		"""
+		self.assertEqual(parseMove('e4'), ParsedMove('P', None, 'e4', False, None, None))
+		self.assertEqual(parseMove('exd5'), ParsedMove('P', 'e', 'd5', True, None, None))
+		self.assertEqual(parseMove('Nbd7'), ParsedMove('N', 'b', 'd7', False, None, None))
+		self.assertEqual(parseMove('R1e2'), ParsedMove('R', '1', 'e2', False, None, None))
+		self.assertEqual(parseMove('Qh4xe1+'), ParsedMove('Q', 'h4', 'e1', True, None, None))
+		self.assertEqual(parseMove('bxa8=N#!?'), ParsedMove('P', 'b', 'a8', True, 'N', None))
+		self.assertEqual(parseMove('O-O+').castle, 'king')
+		self.assertEqual(parseMove('0-0-0').castle, 'queen')
+
+	def test_lan_uci(self):
+		"""
+		Long algebraic and UCI moves name their start square
+		"""
+		self.assertEqual(parseMove('Ng1-f3'), ParsedMove('N', 'g1', 'f3', False, None, None))
+		self.assertEqual(parseMove('e2 - e4'), ParsedMove(None, 'e2', 'e4', False, None, None))
+		self.assertEqual(parseMove('g1f3'), ParsedMove(None, 'g1', 'f3', None, None, None))
+		self.assertEqual(parseMove('e7e8q'), ParsedMove(None, 'e7', 'e8', None, 'Q', None))
+		self.assertEqual(parseMove('Ng1f3'), ParsedMove('N', 'g1', 'f3', False, None, None))
+		self.assertEqual(parseMove('e7-e8=R'), ParsedMove(None, 'e7', 'e8', False, 'R', None))
+
+	def test_invalid(self):
+		"""
+		Text that is not a move is rejected
+		"""
+		for text in ['', 'e', 'e9', 'i4', 'xd5', 'Pe4', 'Ke2x', 'e4!!!', 'O-O-O-O', 'Nf3+!+', 'e8=K', 'h-e8q', 'Nb1c3q']:
+			self.assertIsNone(parseMove(text), text)
+
+	def test_batch(self):
+		"""
+		Whole move lists are parsed, skipping move numbers
+		"""
+		moves = parseMoves('1. e4 e5 2.Nf3 Nc6 3. Bb5 a6 4... Ba4 zz 1-0 Nf6')
+		self.assertEqual([move and move.end for move in moves], ['e4', 'e5', 'f3', 'c6', 'b5', 'a6', 'a4', None])
+		self.assertEqual(parseMoves(['O-O', 'e4', 'e4']), [parseMove('O-O'), parseMove('e4'), parseMove('e4')])
+
+	def test_chess_uci(self):
+		"""
+		Chess games accept UCI moves, including castling
+		"""
+		chess = Chess.fromFEN('r3k2r/P7/8/8/8/8/8/R3K1NR w KQkq - 0 1')
+		self.assertEqual(moveToUCI(chess.makeMove('g1f3')), 'g1f3')
+		self.assertEqual(moveFlag(chess.makeMove('e8c8')), CASTLE)
+		self.assertEqual(moveFlag(chess.makeMove('e1g1')), CASTLE)
+		self.assertEqual(moveToUCI(chess.makeMove('c8b7')), 'c8b7')
+		self.assertEqual(chess.toFEN(), '3r3r/Pk6/8/8/8/5N2/8/R4RK1 w - - 4 3')
+		with self.assertRaises(ValueError):
+			chess.makeMove('e2e4')
+
+		chess = Chess.fromFEN('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2')
+		self.assertEqual(moveToUCI(chess.makeMove('e4d5')), 'e4d5')
+		chess.makeMove('e7e5')
+		self.assertEqual(moveFlag(chess.makeMove('d5e6')), EN_PASSANT)
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/ppp2ppp/4P3/8/8/8/PPPP1PPP/RNBQKBNR b KQkq - 0 3')
+		self.assertTrue(chess.isLegal('d8d2'))
+		self.assertFalse(chess.isLegal('d8d1'))
+
+		# long algebraic moves must mark captures correctly
+		chess = Chess.fromFEN('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2')
+		self.assertFalse(chess.isLegal('e4-d5'))
+		self.assertFalse(chess.isLegal('e2xe3'))
+		self.assertTrue(chess.isLegal('e4xd5'))
+		self.assertTrue(chess.isLegal('d2-d4'))
+		chess = Chess()
+		chess.setupBoard()
+		self.assertFalse(chess.isLegal('e2xe4'))
+		self.assertTrue(chess.isLegal('e2e4'))
+
+class MoveCacheTest(unittest.TestCase):
+	def test_lru(self):
+		"""
+		The least recently used entry is dropped when the cache is full
+		"""
+		cache = MoveCache(2)
+		cache.put(1, 'e4', 'a')
+		cache.put(2, 'e4', 'b')
+		self.assertEqual(cache.get(1, 'e4'), 'a')
+		cache.put(3, 'e4', 'c')
+		self.assertIsNone(cache.get(2, 'e4'))
+		self.assertEqual(cache.get(3, 'e4'), 'c')
+		self.assertIsNone(cache.get(1, 'd4'))
+		self.assertEqual(cache.stats(), {'entries': 2, 'size': 2, 'hits': 2, 'misses': 2, 'evictions': 1, 'hit_rate': 0.5})
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+		with self.assertRaises(ValueError):
+			MoveCache(0)
+
+	def test_chess(self):
+		"""
+		Games share resolved moves through the cache, including illegal ones
+		"""
+		cache = MoveCache()
+		for i in range(3):
+			chess = Chess()
+			chess.setupBoard()
+			chess.move_cache = cache
+			for move in ['e4', 'e5', 'Nf3', 'Nc6']:
+				chess.makeMove(move)
+			self.assertFalse(chess.tryMove('Ke3'))
+			with self.assertRaises(ValueError):
+				chess.makeMove('O-O')
+		self.assertEqual(cache.misses, 6)
+		self.assertEqual(cache.hits, 12)
+		self.assertEqual(chess.toFEN(), 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+
+	def test_transpositions(self):
+		"""
+		The cache is keyed by position, so move orders reaching the same position share entries
+		"""
+		cache = MoveCache()
+		first = Chess.fromFEN('r1bqkbnr/pppppppp/2n5/8/8/5N2/PPPPPPPP/RNBQKB1R w KQkq - 2 2')
+		first.move_cache = cache
+		self.assertTrue(first.isLegal('Ng5'))
+		second = Chess()
+		second.setupBoard()
+		second.move_cache = cache
+		for move in ['Nf3', 'Nc6', 'Ng1', 'Nb8', 'Nf3', 'Nc6']:
+			second.makeMove(move)
+		self.assertTrue(second.isLegal('Ng5'))
+		# the repeated Nf3 and Nc6, then Ng5 found from the first game
+		self.assertEqual(cache.stats()['hits'], 3)
+
+	def test_castle_changed_directly(self):
+		"""
+		Castling rights changed without resetHash are part of the cache key
+		"""
+		cache = MoveCache()
+		for rights in [True, False]:
+			chess = Chess()
+			chess.setupBoard()
+			chess.move_cache = cache
+			for move in ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5']:
+				chess.makeMove(move)
+			chess.castle[0][0] = rights
+			self.assertEqual(chess.isLegal('O-O'), rights)
+
+class LightweightTest(unittest.TestCase):
+	def test_slots(self):
+		"""
+		Games and positions have no per-instance __dict__
+		"""
+		chess = Chess()
+		self.assertFalse(hasattr(chess, '__dict__'))
+		self.assertFalse(hasattr(chess.position, '__dict__'))
+		with self.assertRaises(AttributeError):
+			chess.score = 0
+
+	def test_copy(self):
+		"""
+		Copies of a game are independent
+		"""
+		chess = Chess()
+		chess.setupBoard()
+		chess.makeMove('e4')
+		copy = chess.copy()
+		for move in ['e5', 'Ke2', 'Nc6']:
+			copy.makeMove(move)
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+		self.assertEqual(chess.moves, [['e4'], []])
+		self.assertEqual(chess.castle, [[True, True], [True, True]])
+		self.assertEqual(copy.toFEN(), 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/8/PPPPKPPP/RNBQ1BNR w kq - 2 3')
+		self.assertEqual(copy.hash, Chess.fromFEN(copy.toFEN()).hash)
+
+		copy = chess.copy()
+		chess.castle[0][0] = False
+		self.assertEqual(copy.castle, [[True, True], [True, True]])
+		snapshot = copy.snapshot()
+		copy.castle[1][1] = False
+		copy.restore(snapshot)
+		copy.castle[1][0] = False
+		copy.restore(snapshot)
+		self.assertEqual(copy.castle, [[True, True], [True, True]])
+
+	def test_from_squares(self):
+		"""
+		Positions built in one pass match positions built piece by piece
+		"""
+		for name, fen, depth, nodes in PERFT_POSITIONS:
+			squares = Chess.fromFEN(fen).position.squares
+			built = Position()
+			for sq, piece in enumerate(squares):
+				if piece != EMPTY_SQUARE:
+					built.setPiece(sq, piece)
+			position = Position.fromSquares(squares)
+			for field in Position.__slots__:
+				self.assertEqual(getattr(position, field), getattr(built, field), field)
+
+	def test_benchmark(self):
+		"""
+		The benchmark reports a rate and size for each case
+		"""
+		results = runPositionBenchmark(count=20)
+		self.assertIn('Chess()', results)
+		for result in results.values():
+			self.assertGreater(result['per_sec'], 0)
+
+class HistoryTest(unittest.TestCase):
+	# a game long enough to cross several snapshots, repeating the knight dance after the opening
+	OPENING = ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6', 'Ba4', 'Nf6', 'O-O', 'Be7']
+	DANCE = ['Nc3', 'Nb8', 'Nb1', 'Nc6']
+
+	def replay(self, moves):
+		chess = Chess()
+		chess.setupBoard()
+		for move in moves:
+			chess.makeMove(move)
+		return chess
+
+	def game(self):
+		return self.OPENING + self.DANCE * 20
+
+	def test_undo_redo(self):
+		"""
+		Undo takes back recorded moves and redo makes them again
+		"""
+		chess = self.replay(['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6', 'Bxc6', 'dxc6', 'O-O'])
+		fen, moves, key = chess.toFEN(), [line[:] for line in chess.moves], chess.hash
+		self.assertEqual(chess.plies(), (9, 9))
+
+		for i in range(9):
+			self.assertIsNotNone(chess.undo())
+		self.assertIsNone(chess.undo())
+		self.assertEqual(chess.toFEN(), 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+		self.assertEqual(chess.moves, [[], []])
+		self.assertEqual(chess.plies(), (0, 9))
+
+		for i in range(9):
+			self.assertIsNotNone(chess.redo())
+		self.assertIsNone(chess.redo())
+		self.assertEqual(chess.toFEN(), fen)
+		self.assertEqual(chess.moves, moves)
+		self.assertEqual(chess.hash, key)
+
+	def test_new_line(self):
+		"""
+		Moving after an undo drops the moves that were taken back
+		"""
+		chess = self.replay(['e4', 'e5', 'Nf3'])
+		chess.undo()
+		chess.undo()
+		self.assertTrue(chess.tryMove('c5'))
+		self.assertEqual(chess.plies(), (2, 2))
+		self.assertIsNone(chess.redo())
+		self.assertEqual(chess.moves, [['e4'], ['c5']])
+		self.assertEqual(chess.toFEN(), self.replay(['e4', 'c5']).toFEN())
+
+	def test_goto_ply(self):
+		"""
+		Jumping to any ply gives the same game as replaying the moves up to it
+		"""
+		moves = self.game()
+		chess = self.replay(moves)
+		for ply in [0, len(moves), 5, 77, 31, 32, 33, 64, 1, len(moves) - 1, 40]:
+			chess.gotoPly(ply)
+			expected = self.replay(moves[:ply])
+			self.assertEqual(chess.plies(), (ply, len(moves)))
+			self.assertEqual(chess.toFEN(), expected.toFEN())
+			self.assertEqual(chess.hash, expected.hash)
+			self.assertEqual(chess.moves, expected.moves)
+
+		chess.gotoPly(3)
+		chess.undo()
+		chess.redo()
+		chess.makeMove('Nf6')
+		self.assertEqual(chess.plies(), (4, 4))
+		self.assertEqual(chess.toFEN(), self.replay(['e4', 'e5', 'Nf3', 'Nf6']).toFEN())
+
+	def test_goto_ply_black_start(self):
+		"""
+		Move lists are rebuilt for games started with black to move
+		"""
+		chess = Chess.fromFEN('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+		moves = ['e5'] + ['Nc3', 'Nc6', 'Nb1', 'Nb8'] * 12
+		for move in moves:
+			chess.makeMove(move)
+		chess.gotoPly(0)
+		chess.gotoPly(45)
+		self.assertEqual(chess.moves, [moves[1:45:2], moves[0:45:2]])
+
+	def test_move_piece(self):
+		"""
+		Moves made with movePiece and moveCastle are taken back in order, and setSquare clears the history
+		"""
+		chess = self.replay(['e4', 'e5', 'Nf3', 'Nc6', 'Bc4'])
+		chess.movePiece('B', 'c5')
+		chess.undo()
+		self.assertEqual(chess.toFEN(), 'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3')
+		chess.movePiece('N', 'f6')
+		chess.moveCastle('king')
+		self.assertEqual(chess.plies(), (7, 7))
+		chess.gotoPly(5)
+		self.assertEqual(chess.toFEN(), 'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3')
+		self.assertEqual(chess.moves, [['e4', 'Nf3', 'Bc4'], ['e5', 'Nc6']])
+
+		chess.setSquare('a3', 'WP')
+		self.assertEqual(chess.plies(), (0, 0))
+		self.assertIsNone(chess.undo())
+
+	def test_out_of_range(self):
+		"""
+		Plies that were not recorded are rejected
+		"""
+		chess = self.replay(['e4'])
+		with self.assertRaises(ValueError):
+			chess.gotoPly(2)
+		with self.assertRaises(ValueError):
+			chess.gotoPly(-1)
+		chess.setupFEN('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+		self.assertEqual(chess.plies(), (0, 0))
+		self.assertIsNone(chess.undo())
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file